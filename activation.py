@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides strategies that decide which inactive supporters are activated in order to
+support starving peers that could not be assigned to an already active supporter.
+
+A supporter can only be activated if it gets at least min_peer peers assigned, and it is able to
+supply up to max_peer peers (its available slots). Given n starving peers, a set of supporters can
+be activated if the sum of their min_peer values does not exceed n, and it covers as many peers
+as its available slots add up to (but at most n). The strategies try to find a set that covers
+as many starving peers as possible while activating as few supporters as possible, which is a
+variant of the bin packing problem.
+
+SupporterMonitor uses BranchAndBoundActivationStrategy by default. Other strategies can be passed
+to its constructor.
+"""
+
+import bisect
+import logging
+
+from supporter.clock import monotonic
+from supporter.shared import *
+
+
+class ActivationStrategy(object):
+    """Interface of all activation strategies."""
+
+    def select_supporters(self, starving_peers, supporters):
+        """Selects the supporters that shall be activated.
+
+        @param starving_peers:
+            Number of starving peers that have to be assigned to a supporter
+        @param supporters:
+            List of inactive MonitoredSupporter instances
+
+        @return:
+            List of MonitoredSupporter instances (a subset of the given supporters) that shall be
+            activated. The sum of their min_peer values must not exceed the number of starving
+            peers. Peers are assigned to them in the order of the list.
+        """
+        pass
+
+
+def _candidates(starving_peers, supporters):
+    """@return:
+        List of 3-tuples (available slots, min_peer, MonitoredSupporter) of all supporters that
+        could be activated on their own, ordered by decreasing number of available slots and
+        increasing min_peer
+    """
+    candidates = [(s.available_slots(), s.get_min_peer(), s) for s in supporters
+                  if s.get_min_peer() <= starving_peers and s.available_slots() > 0]
+    candidates.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+    return candidates
+
+
+class GreedyActivationStrategy(ActivationStrategy):
+    """Activates supporters in ascending order of their min_peer value as long as the remaining
+    starving peers reach the min_peer value of the next supporter. This is the strategy that
+    SupporterMonitor used originally. It is fast, but tends to activate many small supporters and
+    might leave peers starving, although there is a set of supporters that covers them."""
+
+    def select_supporters(self, starving_peers, supporters):
+        """See ActivationStrategy.select_supporters."""
+        selected = []
+        starving_number = starving_peers
+        for supporter in sorted(supporters, key=lambda s: s.get_min_peer()):
+            if starving_number >= supporter.get_min_peer():
+                starving_number -= supporter.available_slots()
+                selected.append(supporter)
+            else:
+                break
+        return selected
+
+
+class LargestFirstActivationStrategy(ActivationStrategy):
+    """Activates the supporters with the most available slots first, as long as their min_peer
+    values can still be satisfied, until all starving peers are covered. Runs in O(s log s) for
+    s supporters and usually activates only few supporters."""
+
+    def select_supporters(self, starving_peers, supporters):
+        """See ActivationStrategy.select_supporters."""
+        selected = []
+        weight = 0
+        value = 0
+        for slots, min_peer, supporter in _candidates(starving_peers, supporters):
+            if value >= starving_peers:
+                break
+            if weight + min_peer <= starving_peers:
+                selected.append(supporter)
+                weight += min_peer
+                value += slots
+        return selected
+
+
+class BranchAndBoundActivationStrategy(ActivationStrategy):
+    """Finds a set of supporters that covers as many starving peers as possible and, among those
+    sets, activates the fewest supporters. The search space is explored depth-first starting from
+    the solution of LargestFirstActivationStrategy and is pruned by an upper bound on the covered
+    peers and a lower bound on the number of supporters that are still required. Supporters with
+    the same min_peer value and the same number of available slots are interchangeable, so only
+    one of their permutations is explored.
+
+    The search stops once the given time budget is exhausted, in which case the best set found so
+    far is returned.
+    """
+
+    def __init__(self, time_budget=None):
+        """@param time_budget:
+            Time in seconds the search may take at most. Defaults to
+            SUPPORTER_ACTIVATION_TIME_BUDGET.
+        """
+        self._logger = logging.getLogger("Tracker.BranchAndBoundActivationStrategy")
+        self._time_budget = SUPPORTER_ACTIVATION_TIME_BUDGET if time_budget is None else time_budget
+        self._heuristic = LargestFirstActivationStrategy()
+        # number of searches that were stopped because they exhausted the time budget
+        self._exhausted_budgets = 0
+
+    def get_time_budget(self):
+        """@return:
+            Time in seconds a search may take at most
+        """
+        return self._time_budget
+
+    def get_exhausted_budgets(self):
+        """@return:
+            Number of searches that were stopped because they exhausted the time budget, i.e.
+            whose result is not guaranteed to be optimal
+        """
+        return self._exhausted_budgets
+
+    def select_supporters(self, starving_peers, supporters):
+        """See ActivationStrategy.select_supporters."""
+        deadline = monotonic() + self._time_budget
+        n = starving_peers
+        candidates = _candidates(n, supporters)
+        slots = [candidate[0] for candidate in candidates]
+        min_peers = [candidate[1] for candidate in candidates]
+        m = len(candidates)
+        # prefix_slots[i]: available slots of the first i candidates
+        prefix_slots = [0]
+        for value in slots:
+            prefix_slots.append(prefix_slots[-1] + value)
+        # next_distinct[i]: index of the next candidate that differs from candidate i
+        next_distinct = [m] * m
+        for i in xrange(m - 2, -1, -1):
+            if slots[i] == slots[i + 1] and min_peers[i] == min_peers[i + 1]:
+                next_distinct[i] = next_distinct[i + 1]
+            else:
+                next_distinct[i] = i + 1
+
+        selected = self._heuristic.select_supporters(n, supporters)
+        best_coverage = min(n, sum([s.available_slots() for s in selected]))
+        best_count = len(selected)
+        best_chosen = None
+
+        # search nodes: (index of the next candidate, sum of min_peer, sum of slots, number of
+        # chosen candidates, chosen candidates as linked list of (index, parent) tuples)
+        stack = [(0, 0, 0, 0, None)]
+        nodes = 0
+        while len(stack) > 0:
+            nodes += 1
+            if nodes & 1023 == 0 and monotonic() > deadline:
+                self._exhausted_budgets += 1
+                self._logger.debug("Activation search exhausted its time budget after %i nodes" % nodes)
+                break
+            index, weight, value, count, chosen = stack.pop()
+            coverage = min(n, value)
+            if coverage > best_coverage or (coverage == best_coverage and count < best_count):
+                best_coverage, best_count, best_chosen = coverage, count, chosen
+            if value >= n or index == m:
+                continue
+            # upper bound on the coverage, ignoring the min_peer values of the remaining candidates
+            optimistic = min(n, value + prefix_slots[m] - prefix_slots[index])
+            if optimistic < best_coverage:
+                continue
+            if optimistic == best_coverage:
+                # lower bound on the number of candidates required to reach the best coverage
+                # (candidates are ordered by decreasing number of slots)
+                required = bisect.bisect_left(prefix_slots, prefix_slots[index] + best_coverage - value,
+                                              index) - index
+                if count + max(required, 0) >= best_count:
+                    continue
+            # exclude the candidate and all candidates that are interchangeable with it
+            stack.append((next_distinct[index], weight, value, count, chosen))
+            # include the candidate (explored first)
+            if weight + min_peers[index] <= n:
+                stack.append((index + 1, weight + min_peers[index], value + slots[index], count + 1,
+                              (index, chosen)))
+
+        if best_chosen is None:
+            return selected
+        result = []
+        while best_chosen is not None:
+            index, best_chosen = best_chosen
+            result.append(candidates[index][2])
+        result.reverse()
+        return result
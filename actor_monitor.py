@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides ActorSupporterMonitor, an alternative execution model for SupporterMonitor.
+
+SupporterMonitor synchronizes tracker request threads and its update thread on a single lock.
+ActorSupporterMonitor hands all of its state to a single owner
+thread instead. Message handlers only append (message type, peer ID, timestamp) tuples to a
+bounded ingestion queue, which is a collections.deque whose append and popleft operations are
+atomic, so producers do not wait for each other or for the owner thread unless the queue is full.
+In that case, producers of state-changing messages wait for the owner thread to make space. The
+owner thread drains the queue in batches between update cycles and is the only thread that
+touches MonitoredPeer and MonitoredSupporter instances. If it has nothing to do, it waits on a
+condition variable until a message or call arrives or an update is due. Supportee lists are
+dispatched by a separate thread, so that slow supporters do not stall the ingestion of messages.
+
+All other operations on the monitor (e.g. the registration of peers and supporters) are executed
+on the owner thread via call_synchronized while the owner thread is running. Status pages are
+rendered from snapshots that are taken on the owner thread.
+"""
+
+import logging
+import Queue
+import sys
+import threading
+
+from collections import deque
+
+from supporter.clock import monotonic
+from supporter.scheduler import FixedRateScheduler
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.shared import *
+
+# messages that change the state of a peer. producers of these messages wait for space in the
+# full ingestion queue instead of dropping them right away.
+STATE_CHANGING_MESSAGES = frozenset([MSG_SUPPORT_REQUIRED, MSG_SUPPORT_NOT_NEEDED])
+
+
+class OwnerLock(object):
+    """Stands in for the lock of a SupporterMonitor whose state is owned by a single thread."""
+
+    def acquire(self, blocking=1):
+        return True
+
+    def release(self):
+        pass
+
+
+class ActorSupporterMonitor(SupporterMonitor):
+    """SupporterMonitor whose state is owned by a single thread (see module documentation).
+
+    Peer messages are queued and processed asynchronously once start() has been called. Before
+    that (and after stop()), they stay queued until process_queued_messages is called. The
+    ingestion queue holds at most queue_capacity messages. While it is full, producers of
+    state-changing messages (cf. STATE_CHANGING_MESSAGES) wait up to enqueue_timeout seconds for
+    the owner thread to make space. Other messages, state-changing messages whose wait timed out
+    and all messages that arrive at a full queue while the owner thread is not running are
+    dropped (cf. get_dropped_messages). Since producers do not synchronize with each other,
+    concurrent producers may exceed the capacity by a few messages.
+    """
+
+    def __init__(self, is_alive_timeout=None, peer_timeout=None, queue_capacity=None, batch_size=None,
+                 enqueue_timeout=None, **kwargs):
+        """Initializes the monitor.
+
+        @param queue_capacity:
+            Max. number of queued peer messages (defaults to ACTOR_QUEUE_CAPACITY)
+        @param batch_size:
+            Max. number of peer messages that are processed at once (defaults to ACTOR_BATCH_SIZE)
+        @param enqueue_timeout:
+            Max. number of seconds a producer of a state-changing message waits for space in the
+            full ingestion queue (defaults to ACTOR_ENQUEUE_TIMEOUT, 0 disables waiting)
+        @param kwargs:
+            Further keyword arguments of SupporterMonitor
+        """
+        SupporterMonitor.__init__(self, is_alive_timeout, peer_timeout, **kwargs)
+        self._logger = logging.getLogger("Tracker.ActorSupporterMonitor")
+        # the state is only accessed by the owner thread while it is running
+        self._lock = OwnerLock()
+        self._queue_capacity = queue_capacity or ACTOR_QUEUE_CAPACITY
+        self._batch_size = batch_size or ACTOR_BATCH_SIZE
+        self._enqueue_timeout = ACTOR_ENQUEUE_TIMEOUT if enqueue_timeout is None else enqueue_timeout
+        # queued (message type, peer ID, timestamp) tuples
+        self._queue = deque()
+        # queued (function, args, Event, result list) tuples of call_synchronized
+        self._calls = deque()
+        # only taken by producers that drop a message
+        self._drop_lock = threading.Lock()
+        self._dropped_messages = 0
+        self._processed_messages = 0
+        self._max_queue_depth = 0
+        self._skipped_updates = 0
+        # the owner thread waits on this condition if it has nothing to do, producers wait on it
+        # while the ingestion queue is full. producers and callers of call_synchronized only
+        # acquire it if the owner thread is idle.
+        self._wakeup = threading.Condition(threading.Lock())
+        self._idle = False
+        self._waiting_producers = 0
+        # number of update intervals that elapsed since the last update of the owner thread. the
+        # scheduler only signals due updates, the owner thread performs them.
+        self._due_updates = 0
+        self._scheduler = FixedRateScheduler(self._signal_due_update, self.get_update_interval(),
+                                             "ActorSupporterMonitor.update")
+        self._owner = None
+        self._dispatch_thread = None
+        self._plans = Queue.Queue()
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts the owner thread, which processes queued messages and performs the asynchronous
+        state updates at a fixed rate of one update per update interval, and the thread that
+        dispatches supportee lists.
+
+        @return:
+            NoneType
+        """
+        if self.is_running():
+            return
+        self._stopped.clear()
+        self._dispatch_thread = threading.Thread(target=self._run_dispatcher, name="ActorSupporterMonitor.dispatch")
+        self._dispatch_thread.setDaemon(True)
+        self._dispatch_thread.start()
+        self._due_updates = 0
+        self._owner = threading.Thread(target=self._run_owner, name="ActorSupporterMonitor.owner")
+        self._owner.setDaemon(True)
+        self._owner.start()
+        self._scheduler.start()
+
+    def stop(self, timeout=None):
+        """Stops the owner thread and the dispatch thread. Calls that were submitted via
+        call_synchronized and not executed yet are executed by the calling thread. Queued peer
+        messages remain queued.
+
+        @param timeout:
+            Time in seconds to wait for each of the threads to terminate. Waits until they have
+            terminated if set to NoneType.
+
+        @return:
+            NoneType
+        """
+        owner = self._owner
+        if owner is None:
+            return
+        self._scheduler.stop(timeout)
+        self._stopped.set()
+        self._notify()
+        if owner is not threading.currentThread():
+            owner.join(timeout)
+        self._plans.put(None)
+        if self._dispatch_thread is not threading.currentThread():
+            self._dispatch_thread.join(timeout)
+        self._owner = None
+        self._process_calls()
+
+    def is_running(self):
+        """@return:
+            True, if the owner thread is alive and has not been asked to stop. False otherwise.
+        """
+        return self._owner is not None and self._owner.isAlive() and not self._stopped.isSet()
+
+    def get_skipped_updates(self):
+        """@return:
+            Number of asynchronous state updates that were skipped because an update took
+            longer than the update interval
+        """
+        return self._skipped_updates
+
+    def get_queue_depth(self):
+        """@return:
+            The number of peer messages that currently wait in the ingestion queue
+        """
+        return len(self._queue)
+
+    def get_max_queue_depth(self):
+        """@return:
+            The max. number of peer messages that waited in the ingestion queue when the owner
+            thread started to process a batch
+        """
+        return self._max_queue_depth
+
+    def get_dropped_messages(self):
+        """@return:
+            The number of peer messages that were dropped, since the ingestion queue was full
+            (cf. class documentation)
+        """
+        return self._dropped_messages
+
+    def get_processed_messages(self):
+        """@return:
+            The number of peer messages that were taken from the ingestion queue
+        """
+        return self._processed_messages
+
+    def received_peer_message(self, msg_type, peer_id):
+        """Handler method for incoming peer messages. Appends the message to the ingestion queue,
+        which only blocks if the queue is full (cf. class documentation). The message is
+        timestamped once it is queued.
+
+        @param msg_type:
+            Represents the type of the message
+        @param peer_id:
+            The ID of the peer that sent the original message
+
+        @return:
+            NoneType
+        """
+        queue = self._queue
+        if len(queue) < self._queue_capacity or self._wait_for_space(msg_type):
+            queue.append((msg_type, peer_id, self._clock.read()))
+            if self._idle:
+                self._notify()
+        else:
+            self._drop(1)
+
+    def received_peer_messages(self, messages):
+        """Handler method for a batch of incoming peer messages. Appends the messages to the
+        ingestion queue, which only blocks if the queue is full (cf. class documentation). All
+        messages of the batch share a single timestamp.
+
+        @param messages:
+            Iterable of 2-tuples (message type, peer ID)
+
+        @return:
+            The number of messages that were queued
+        """
+        ts = self._clock.read()
+        queue = self._queue
+        capacity = self._queue_capacity
+        space = capacity - len(queue)
+        queued = 0
+        dropped = 0
+        for msg_type, peer_id in messages:
+            if queued >= space:
+                # the owner thread may have made space in the meantime
+                if len(queue) >= capacity and not self._wait_for_space(msg_type):
+                    dropped += 1
+                    continue
+                space = queued + capacity - len(queue)
+            queue.append((msg_type, peer_id, ts))
+            queued += 1
+        if queued > 0 and self._idle:
+            self._notify()
+        if dropped > 0:
+            self._drop(dropped)
+        return queued
+
+    def _wait_for_space(self, msg_type):
+        """Waits until the full ingestion queue has space for the given message, if it is a
+        state-changing message and the owner thread is running.
+
+        @return:
+            True, if the queue has space. False, if the message shall be dropped.
+        """
+        if msg_type not in STATE_CHANGING_MESSAGES or self._enqueue_timeout <= 0 or not self.is_running() or \
+                threading.currentThread() is self._owner:
+            return False
+        deadline = monotonic() + self._enqueue_timeout
+        self._wakeup.acquire()
+        try:
+            self._waiting_producers += 1
+            try:
+                # the owner thread may be idle, since the queue filled up without waking it up
+                self._wakeup.notifyAll()
+                while len(self._queue) >= self._queue_capacity:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self._logger.warning("Dropping %s message, since the ingestion queue stayed full for %.3fs" %
+                                             (msg_type, self._enqueue_timeout))
+                        return False
+                    if not self.is_running():
+                        return False
+                    self._wakeup.wait(remaining)
+                return True
+            finally:
+                self._waiting_producers -= 1
+        finally:
+            self._wakeup.release()
+
+    def _drop(self, count):
+        self._drop_lock.acquire()
+        try:
+            self._dropped_messages += count
+        finally:
+            self._drop_lock.release()
+
+    def call_synchronized(self, function, *args):
+        """Calls function(*args) on the owner thread and waits for its completion. The function
+        is called directly if the owner thread is not running or if this method is called by
+        the owner thread itself.
+
+        @return:
+            The return value of the function. Exceptions raised by the function are re-raised.
+        """
+        if not self.is_running() or threading.currentThread() is self._owner:
+            return function(*args)
+        done = threading.Event()
+        result = []
+        self._calls.append((function, args, done, result))
+        if self._idle:
+            self._notify()
+        while not done.wait(0.1):
+            if self._owner is None:
+                # the owner thread was stopped before it executed the call
+                self._process_calls()
+        if result[0]:
+            return result[1]
+        raise result[1][0], result[1][1], result[1][2]
+
+    def register_monitored_peer(self, id, ip, port, peer_type):
+        """See SupporterMonitor.register_monitored_peer. Executed on the owner thread."""
+        return self.call_synchronized(SupporterMonitor.register_monitored_peer, self, id, ip, port, peer_type)
+
+    def register_monitored_peers(self, peers):
+        """See SupporterMonitor.register_monitored_peers. Executed on the owner thread."""
+        return self.call_synchronized(SupporterMonitor.register_monitored_peers, self, peers)
+
+    def unregister_monitored_peer(self, monitored_peer):
+        """See SupporterMonitor.unregister_monitored_peer. Executed on the owner thread."""
+        return self.call_synchronized(SupporterMonitor.unregister_monitored_peer, self, monitored_peer)
+
+    def register_monitored_supporter(self, id, addr, min_peer, max_peer):
+        """See SupporterMonitor.register_monitored_supporter. Executed on the owner thread."""
+        return self.call_synchronized(SupporterMonitor.register_monitored_supporter, self, id, addr, min_peer,
+                                      max_peer)
+
+    def unregister_monitored_supporter(self, monitored_supporter):
+        """See SupporterMonitor.unregister_monitored_supporter. Executed on the owner thread."""
+        return self.call_synchronized(SupporterMonitor.unregister_monitored_supporter, self, monitored_supporter)
+
+    def publish_snapshot(self):
+        """See SupporterMonitor.publish_snapshot. Executed on the owner thread."""
+        return self.call_synchronized(SupporterMonitor.publish_snapshot, self)
+
+    def update_states(self):
+        """See SupporterMonitor.update_states. Executed on the owner thread, after all messages
+        that were queued up to now have been processed.
+
+        @return:
+            NoneType
+        """
+        self.call_synchronized(self._process_queue_and_update)
+
+    def _process_queue_and_update(self):
+        self.process_queued_messages(len(self._queue))
+        SupporterMonitor.update_states(self)
+
+    def process_queued_messages(self, limit=None):
+        """Processes queued peer messages in the order of their arrival. Each message is
+        dispatched to the resp. monitored peer with the timestamp of its arrival. This method
+        must only be called by the owner thread or while the owner thread is not running.
+
+        @param limit:
+            Max. number of messages to process (defaults to the batch size of the monitor)
+
+        @return:
+            The number of messages that were taken from the queue
+        """
+        queue = self._queue
+        depth = len(queue)
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        count = min(depth, self._batch_size if limit is None else limit)
+        monitored_peers = self._monitored_peers
+        clock = self._clock
+        unregistered = 0
+        for _ in xrange(count):
+            msg_type, peer_id, ts = queue.popleft()
+            peer = monitored_peers.get(peer_id)
+            if peer is None:
+                unregistered += 1
+                continue
+            clock.begin_tick(ts)
+            try:
+                peer.receive_msg(msg_type)
+            except:
+                self._logger.exception("Processing of %s message of %s failed" % (msg_type, peer_id))
+            clock.end_tick()
+        self._processed_messages += count
+        if self._waiting_producers > 0:
+            self._notify()
+        if unregistered > 0:
+            self._logger.warning("Got %i messages of unregistered peer IDs" % unregistered)
+        return count
+
+    def _process_calls(self):
+        """Executes all calls that were submitted via call_synchronized.
+
+        @return:
+            The number of executed calls
+        """
+        calls = self._calls
+        count = 0
+        while len(calls) > 0:
+            function, args, done, result = calls.popleft()
+            try:
+                result.extend([True, function(*args)])
+            except:
+                result.extend([False, sys.exc_info()])
+            done.set()
+            count += 1
+        return count
+
+    def _notify(self):
+        """Wakes up the owner thread and all producers that wait for space in the ingestion queue.
+
+        @return:
+            NoneType
+        """
+        self._wakeup.acquire()
+        try:
+            self._wakeup.notifyAll()
+        finally:
+            self._wakeup.release()
+
+    def _signal_due_update(self):
+        """Task of the scheduler, which signals the owner thread that an update is due.
+
+        @return:
+            NoneType
+        """
+        self._wakeup.acquire()
+        try:
+            self._due_updates += 1
+            self._wakeup.notifyAll()
+        finally:
+            self._wakeup.release()
+
+    def _take_due_updates(self):
+        """@return:
+            The number of updates that became due since the last call, which are reset to 0
+        """
+        self._wakeup.acquire()
+        try:
+            due_updates = self._due_updates
+            self._due_updates = 0
+            return due_updates
+        finally:
+            self._wakeup.release()
+
+    def _wait_for_work(self):
+        """Blocks the owner thread until a message or a call arrives, an update is due or the
+        owner thread is asked to stop.
+
+        @return:
+            NoneType
+        """
+        self._wakeup.acquire()
+        try:
+            # producers that see the idle flag acquire the condition before they notify, messages
+            # and calls they submitted before are found by the check below
+            self._idle = True
+            if not (self._queue or self._calls or self._due_updates or self._stopped.isSet()):
+                self._wakeup.wait()
+            self._idle = False
+        finally:
+            self._wakeup.release()
+
+    def _run_io_phase(self, plan):
+        """Hands the given DispatchPlan over to the dispatch thread, if it is running. Executes
+        it directly otherwise.
+
+        @return:
+            NoneType
+        """
+        if self._dispatch_thread is not None and self._dispatch_thread.isAlive():
+            self._plans.put(plan)
+        else:
+            SupporterMonitor._run_io_phase(self, plan)
+
+    def _run_dispatcher(self):
+        """Main loop of the dispatch thread.
+
+        @return:
+            NoneType
+        """
+        while True:
+            plan = self._plans.get()
+            if plan is None:
+                break
+            try:
+                SupporterMonitor._run_io_phase(self, plan)
+            except:
+                self._logger.exception("Dispatch of supportee lists failed")
+
+    def _run_owner(self):
+        """Main loop of the owner thread.
+
+        @return:
+            NoneType
+        """
+        period = self.get_update_interval()
+        while not self._stopped.isSet():
+            busy = self._process_calls() > 0
+            busy = self.process_queued_messages() > 0 or busy
+            if self._due_updates > 0:
+                self._take_due_updates()
+                try:
+                    SupporterMonitor.update_states(self)
+                except:
+                    self._logger.exception("Update of the monitor state failed")
+                # updates that became due while this update was still in progress are skipped
+                skipped = self._take_due_updates()
+                if skipped > 0:
+                    self._skipped_updates += skipped
+                    self._logger.warning("Update exceeded the update interval of %.3fs, skipped %i update(s)" %
+                                         (period, skipped))
+            elif not busy:
+                self._wait_for_work()
@@ -0,0 +1,751 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides an event-driven variant of SupporterMonitor and SupporteeListDispatcher
+for trackers that are built around an asyncore event loop.
+
+EventLoop drives asyncore channels and timers on a single thread. AsyncSupporterMonitor runs its
+update cycles as periodic timers of the loop, so announces can be reported from loop callbacks
+directly, without handing them over to another thread and without locking. The I/O phase of an
+update cycle does not block the loop either: AsyncSupporteeListDispatcher issues the XML-RPC
+calls to all supporters of a DispatchPlan at once over non-blocking, persistent HTTP/1.1
+connections (AsyncXmlRpcProxy) and gathers their outcomes into a DispatchResult, which is merged
+back in the next update cycle. Calls are subject to a timeout and the whole I/O phase to the
+dispatch deadline.
+
+State transitions of peers and supporters are shared with SupporterMonitor (state_machine,
+monitored_subjects).
+"""
+
+import asynchat
+import asyncore
+import errno
+import fcntl
+import heapq
+import logging
+import os
+import socket
+import sys
+import threading
+import xmlrpclib
+
+from collections import deque
+
+from supporter.actor_monitor import OwnerLock
+from supporter.clock import monotonic
+from supporter.supporter_adapter import DispatchResult, SupporteeListDispatcher
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.shared import *
+
+# max. time in seconds the loop waits for I/O if no timer is due earlier
+_MAX_POLL_TIMEOUT = 1.0
+
+
+class _Waker(asyncore.file_dispatcher):
+    """Wakes the event loop up from other threads via a pipe."""
+
+    def __init__(self, socket_map):
+        read_fd, self._write_fd = os.pipe()
+        fcntl.fcntl(self._write_fd, fcntl.F_SETFL, fcntl.fcntl(self._write_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        asyncore.file_dispatcher.__init__(self, read_fd, socket_map)
+        # file_dispatcher works on a duplicate of the descriptor
+        os.close(read_fd)
+
+    def wake(self):
+        try:
+            os.write(self._write_fd, 'x')
+        except OSError, e:
+            # the pipe is full, so the loop will wake up anyway
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+
+
+class EventLoop(object):
+    """Single-threaded event loop that drives asyncore channels and timers."""
+
+    def __init__(self):
+        self._logger = logging.getLogger("Tracker.EventLoop")
+        # asyncore socket map of all channels of the loop
+        self._socket_map = {}
+        # min-heap of timers, which are lists of the form [deadline, sequence number, function, args].
+        # cancelled timers have their function set to NoneType.
+        self._timers = []
+        self._sequence = 0
+        # (function, args) tuples submitted by other threads
+        self._calls = deque()
+        self._waker = _Waker(self._socket_map)
+        self._thread = None
+        self._stopped = False
+
+    def get_socket_map(self):
+        """@return:
+            The asyncore socket map of the loop, which channels have to be added to
+        """
+        return self._socket_map
+
+    def time(self):
+        """@return:
+            The current time of the loop in seconds (monotonic)
+        """
+        return monotonic()
+
+    def call_later(self, delay, function, *args):
+        """Schedules the call function(*args) after the given delay. Must be called on the loop
+        thread or while the loop is not running.
+
+        @return:
+            Timer handle that can be passed to cancel
+        """
+        self._sequence += 1
+        timer = [self.time() + delay, self._sequence, function, args]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        """Cancels a timer that was created by call_later.
+
+        @return:
+            NoneType
+        """
+        timer[2] = None
+
+    def call_soon_threadsafe(self, function, *args):
+        """Schedules the call function(*args) on the loop thread. May be called by any thread.
+
+        @return:
+            NoneType
+        """
+        self._calls.append((function, args))
+        self._waker.wake()
+
+    def is_running(self):
+        """@return:
+            True, if a thread currently runs the loop. False otherwise.
+        """
+        return self._thread is not None
+
+    def in_loop_thread(self):
+        """@return:
+            True, if the calling thread currently runs the loop. False otherwise.
+        """
+        return self._thread is threading.currentThread()
+
+    def run(self, until=None, timeout=None):
+        """Runs the loop on the calling thread until stop() is called. If stop() was called before,
+        the loop returns after a single iteration.
+
+        @param until:
+            Callable that takes no arguments. The loop stops as soon as it returns True.
+        @param timeout:
+            Time in seconds after which the loop stops at the latest
+
+        @return:
+            NoneType
+        """
+        assert self._thread is None
+        self._thread = threading.currentThread()
+        deadline = timeout is not None and self.time() + timeout or None
+        try:
+            while not (until is not None and until()):
+                if deadline is not None and self.time() >= deadline:
+                    break
+                self._run_once(deadline)
+                if self._stopped:
+                    break
+        finally:
+            self._stopped = False
+            self._thread = None
+
+    def stop(self):
+        """Stops the loop after the current iteration. May be called by any thread, also before
+        the loop is run.
+
+        @return:
+            NoneType
+        """
+        self._stopped = True
+        self._waker.wake()
+
+    def close(self):
+        """Closes all channels of the loop.
+
+        @return:
+            NoneType
+        """
+        asyncore.close_all(self._socket_map)
+
+    def _run_once(self, deadline):
+        timeout = _MAX_POLL_TIMEOUT
+        if len(self._timers) > 0:
+            timeout = min(timeout, self._timers[0][0] - self.time())
+        if deadline is not None:
+            timeout = min(timeout, deadline - self.time())
+        if len(self._calls) > 0:
+            timeout = 0
+        asyncore.loop(max(timeout, 0), True, self._socket_map, 1)
+
+        while len(self._calls) > 0:
+            function, args = self._calls.popleft()
+            self._invoke(function, args)
+        now = self.time()
+        while len(self._timers) > 0 and self._timers[0][0] <= now:
+            _, _, function, args = heapq.heappop(self._timers)
+            if function is not None:
+                self._invoke(function, args)
+
+    def _invoke(self, function, args):
+        try:
+            function(*args)
+        except:
+            self._logger.exception("Callback %s failed" % function)
+
+
+class _HttpChannel(asynchat.async_chat):
+    """Non-blocking HTTP client connection that performs one request at a time."""
+
+    def __init__(self, loop):
+        asynchat.async_chat.__init__(self, map=loop.get_socket_map())
+        self._callback = None
+        self._closed = False
+        self._keep_alive = False
+        self._received = False
+        self._buffer = []
+        self._state = None
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    def is_open(self):
+        """@return:
+            True, if the connection can be used for another request
+        """
+        return not self._closed
+
+    def request(self, headers, body, callback):
+        """Sends an HTTP request. The callback is called with the arguments (body, error, received)
+        once the response has been received, where received indicates whether any response data
+        arrived before an error occurred.
+
+        @return:
+            NoneType
+        """
+        assert self._callback is None
+        self._callback = callback
+        self._received = False
+        self._buffer = []
+        self._state = 'headers'
+        self.set_terminator('\r\n\r\n')
+        self.push(headers + body)
+
+    def abort(self, error):
+        """Closes the connection and reports the given error for the current request.
+
+        @return:
+            NoneType
+        """
+        self.close()
+        self._finish(None, error)
+
+    def close(self):
+        self._closed = True
+        asynchat.async_chat.close(self)
+
+    def collect_incoming_data(self, data):
+        self._received = True
+        self._buffer.append(data)
+
+    def found_terminator(self):
+        data = ''.join(self._buffer)
+        self._buffer = []
+        if self._state == 'headers':
+            lines = data.split('\r\n')
+            status = lines[0].split(None, 2)
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(status) < 2 or status[1] != '200':
+                self.abort(xmlrpclib.ProtocolError(str(self.addr), len(status) > 1 and status[1] or 0,
+                                                   ' '.join(status[2:]), headers))
+                return
+            self._keep_alive = status[0] == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            length = int(headers.get('content-length', -1))
+            if length > 0:
+                self._state = 'body'
+                self.set_terminator(length)
+            elif length == 0:
+                self._complete('')
+            else:
+                # the body ends when the server closes the connection
+                self._state = 'body until close'
+                self._keep_alive = False
+                self.set_terminator(None)
+        elif self._state == 'body':
+            self._complete(data)
+
+    def _complete(self, body):
+        self._state = None
+        if not self._keep_alive:
+            self.close()
+        self._finish(body, None)
+
+    def _finish(self, body, error):
+        callback, self._callback = self._callback, None
+        if callback is not None:
+            callback(body, error, self._received)
+
+    def handle_connect(self):
+        pass
+
+    def handle_close(self):
+        if self._state == 'body until close':
+            body = ''.join(self._buffer)
+            self.close()
+            self._finish(body, None)
+        else:
+            self.abort(socket.error(errno.ECONNRESET, "Connection closed"))
+
+    def handle_error(self):
+        self.abort(sys.exc_info()[1])
+
+
+class AsyncXmlRpcProxy(object):
+    """Issues XML-RPC calls to a single server over a persistent HTTP/1.1 connection driven by an
+    EventLoop. Calls are sent one after another in the order they were made. If a connection that
+    was kept open turns out to be closed by the server, the call is repeated on a new connection.
+    """
+
+    def __init__(self, loop, addr, timeout=None):
+        """@param loop:
+            EventLoop instance
+        @param addr:
+            2-tuple (IP, port) of the XML-RPC server
+        @param timeout:
+            Time in seconds a call may take at most (including the establishment of a connection)
+        """
+        self._loop = loop
+        self._addr = addr
+        self._timeout = timeout or SUPPORTER_CONNECT_TIMEOUT + SUPPORTER_READ_TIMEOUT
+        self._channel = None
+        # (method name, params, callback) tuples of calls that have not been sent yet
+        self._pending = deque()
+        self._busy = False
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.reconnects = 0
+        self.requests = 0
+
+    def get_statistics(self):
+        """@return:
+            Dictionary with the counters connections_created, connections_reused, reconnects
+            and requests (cf. supporter_adapter.PersistentTransport)
+        """
+        return {'connections_created': self.connections_created,
+                'connections_reused': self.connections_reused,
+                'reconnects': self.reconnects,
+                'requests': self.requests}
+
+    def is_busy(self):
+        """@return:
+            True, if a call is in progress
+        """
+        return self._busy
+
+    def call(self, method, params, callback):
+        """Calls the given remote method. The callback is called on the loop thread with the
+        arguments (result, error) once the call completed. error is NoneType if the call
+        succeeded and the exception that made it fail otherwise (e.g. xmlrpclib.Fault,
+        socket.timeout).
+
+        @return:
+            NoneType
+        """
+        self._pending.append((method, params, callback))
+        if not self._busy:
+            self._send_next()
+
+    def close(self):
+        """Closes the connection to the server.
+
+        @return:
+            NoneType
+        """
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
+
+    def _send_next(self):
+        if len(self._pending) == 0:
+            self._busy = False
+            return
+        self._busy = True
+        method, params, callback = self._pending.popleft()
+        self.requests += 1
+        body = xmlrpclib.dumps(tuple(params), method)
+        headers = "POST /RPC2 HTTP/1.1\r\nHost: %s:%i\r\nUser-Agent: %s\r\nContent-Type: text/xml\r\n" \
+                  "Content-Length: %i\r\n\r\n" % (self._addr[0], self._addr[1], xmlrpclib.Transport.user_agent,
+                                                  len(body))
+        self._send(headers, body, callback, True)
+
+    def _send(self, headers, body, callback, retry):
+        reused = self._channel is not None and self._channel.is_open()
+        if reused:
+            self.connections_reused += 1
+        else:
+            self.connections_created += 1
+            self._channel = _HttpChannel(self._loop)
+            try:
+                self._channel.connect(self._addr)
+            except socket.error, e:
+                self._channel.close()
+                self._channel = None
+                self._loop.call_later(0, self._complete, callback, None, e)
+                return
+        channel = self._channel
+        timer = self._loop.call_later(self._timeout, channel.abort, socket.timeout("timed out"))
+
+        def response_received(response, error, received):
+            self._loop.cancel(timer)
+            if error is not None and reused and retry and not received and not isinstance(error, socket.timeout):
+                # the server closed the idle connection in the meantime, so we have to reconnect
+                self.reconnects += 1
+                self._send(headers, body, callback, False)
+                return
+            result = None
+            if error is None:
+                try:
+                    result = xmlrpclib.loads(response)[0][0]
+                except:
+                    error = sys.exc_info()[1]
+            self._complete(callback, result, error)
+
+        channel.request(headers, body, response_received)
+
+    def _complete(self, callback, result, error):
+        try:
+            callback(result, error)
+        finally:
+            self._send_next()
+
+
+class AsyncSupporteeListDispatcher(SupporteeListDispatcher):
+    """Dispatches supportee lists on an EventLoop. All supporters of a DispatchPlan are contacted
+    at the same time. The outcome is reported to a callback once all calls completed or once the
+    dispatch deadline expired, whatever happens first. Supporters that failed or did not answer
+    before the deadline are reported as dead. The protocol (deltas, complete lists, legacy
+    supporters) follows SupporteeListDispatcher.
+    """
+
+    def __init__(self, monitor, loop, timeout=None, deadline=None):
+        """@param loop:
+            EventLoop instance that drives the XML-RPC calls
+        @param timeout:
+            Time in seconds a single call may take at most
+        @param deadline:
+            Time in seconds after which the I/O phase stops waiting for outstanding calls
+            (defaults to SUPPORTER_DISPATCH_DEADLINE)
+        """
+        SupporteeListDispatcher.__init__(self, monitor)
+        self._loop = loop
+        self._timeout = timeout
+        self._deadline = deadline or SUPPORTER_DISPATCH_DEADLINE
+        # supporters for which a call of an earlier I/O phase is still in progress
+        self._in_flight = set()
+
+    def register_proxy(self, supporter):
+        """Creates an AsyncXmlRpcProxy for the given supporter.
+
+        @return:
+            NoneType
+        """
+        proxy = AsyncXmlRpcProxy(self._loop, (supporter.get_addr()[0], supporter.get_addr()[1] + 1), self._timeout)
+        self._proxies[supporter] = proxy
+        # the proxy provides the statistics of a transport (cf. get_connection_statistics)
+        self._transports[supporter] = proxy
+
+    def execute_dispatch_plan(self, plan):
+        """Executes the given plan by running the event loop until its outcome is available. Must
+        not be called while the loop is running. See execute_dispatch_plan_async.
+
+        @return:
+            DispatchResult instance
+        """
+        results = []
+        self.execute_dispatch_plan_async(plan, results.append)
+        self._loop.run(until=lambda: len(results) > 0)
+        return results[0]
+
+    def execute_dispatch_plan_async(self, plan, callback):
+        """Starts to execute the given plan. Must be called on the loop thread or while the loop
+        is not running.
+
+        @param plan:
+            DispatchPlan instance as returned by SupporteeListDispatcher.create_dispatch_plan
+        @param callback:
+            Callable that gets called on the loop thread with the resulting DispatchResult
+
+        @return:
+            NoneType
+        """
+        requests = self._count_requests()
+        jobs = [(supporter, proxy, update) for supporter, proxy, update in plan.updates] + \
+               [(supporter, proxy, None) for supporter, proxy in plan.probes]
+        outstanding = {}
+        dead_supporters = []
+        failed_dispatches = []
+        contacted_supporters = []
+        finished = []
+
+        def finish():
+            if len(finished) > 0:
+                return
+            finished.append(True)
+            self._loop.cancel(timer)
+            for supporter, update in outstanding.items():
+                self._logger.info("Supporter at %s:%i did not respond before the dispatch deadline. "
+                                  "Marking it for unregistering." % supporter.get_addr())
+                dead_supporters.append(supporter)
+                if update is not None:
+                    failed_dispatches.append(supporter)
+            callback(DispatchResult(tuple(dead_supporters), tuple(failed_dispatches), tuple(contacted_supporters),
+                                    self._count_requests() - requests))
+
+        def report(supporter, alive, delivered):
+            if len(finished) > 0 or supporter not in outstanding:
+                # the deadline expired before the supporter answered
+                return
+            del outstanding[supporter]
+            if alive:
+                contacted_supporters.append(supporter)
+            else:
+                dead_supporters.append(supporter)
+            if not delivered:
+                failed_dispatches.append(supporter)
+            if len(outstanding) == 0:
+                finish()
+
+        timer = self._loop.call_later(self._deadline, finish)
+        for supporter, proxy, update in jobs:
+            if supporter in self._in_flight:
+                # the call of an earlier I/O phase is still waiting for this supporter
+                if update is not None:
+                    failed_dispatches.append(supporter)
+                continue
+            self._in_flight.add(supporter)
+            outstanding[supporter] = update
+        for supporter, update in outstanding.items():
+            self._contact_supporter(supporter, self._proxies[supporter], update, report)
+        if len(outstanding) == 0:
+            finish()
+
+    def _contact_supporter(self, supporter, proxy, update, report):
+        """Sends the given supportee list update to the given supporter or probes the supporter
+        if there is no update (NoneType). Reports (supporter, alive, delivered) to the given
+        callable once the supporter answered or failed.
+
+        @return:
+            NoneType
+        """
+        def completed(delivered, error):
+            self._in_flight.discard(supporter)
+            if error is not None:
+                self._logger.info("Supporter at %s:%i is not responding. Marking it for unregistering." %
+                                  supporter.get_addr())
+                report(supporter, False, update is None)
+            else:
+                report(supporter, True, delivered)
+
+        if update is None:
+            proxy.call('is_alive', (), lambda result, error: completed(True, error))
+        else:
+            self._send_update_async(supporter, proxy, update, completed)
+
+    def _send_update_async(self, supporter, proxy, update, callback):
+        """Sends the given supportee list update to the supporter (cf.
+        SupporteeListDispatcher._send_update). The callback is called with the arguments
+        (delivered, error).
+
+        @return:
+            NoneType
+        """
+        def delivered():
+            self._connections_at_last_update[supporter] = proxy.connections_created
+            callback(True, None)
+
+        def delta_sent(result, error):
+            if error is not None:
+                callback(False, error)
+            elif not result:
+                self._logger.info("Supporter at %s:%i rejected delta %i. Sending the complete list next time." %
+                                  (supporter.get_addr() + (update.version,)))
+                callback(False, None)
+            else:
+                delivered()
+
+        def legacy_list_sent(result, error):
+            if error is not None:
+                callback(False, error)
+            else:
+                delivered()
+
+        def list_sent(result, error):
+            if error is None:
+                self._delta_capable[supporter] = True
+                delivered()
+            elif isinstance(error, xmlrpclib.Fault):
+                # the supporter does not know about versioned supportee lists
+                self._delta_capable[supporter] = False
+                proxy.call('receive_peer_list', (list(update.peers),), legacy_list_sent)
+            else:
+                callback(False, error)
+
+        if not update.full and self._delta_capable.get(supporter) and \
+                self._connections_at_last_update.get(supporter) == proxy.connections_created:
+            proxy.call('receive_peer_delta', (update.version, list(update.added), list(update.removed)), delta_sent)
+        elif self._delta_capable.get(supporter, True):
+            proxy.call('receive_peer_list', (list(update.peers), update.version), list_sent)
+        else:
+            proxy.call('receive_peer_list', (list(update.peers),), legacy_list_sent)
+
+
+class AsyncSupporterMonitor(SupporterMonitor):
+    """SupporterMonitor that runs on an EventLoop. Update cycles are periodic timers of the loop
+    and their I/O phases are executed by an AsyncSupporteeListDispatcher without blocking the
+    loop. The state of the monitor is owned by the loop thread, so it is not locked. Message
+    handlers and all other methods have to be called on the loop thread (or while the loop is
+    not running). Other threads have to use call_synchronized.
+    """
+
+    def __init__(self, loop, is_alive_timeout=None, peer_timeout=None, **kwargs):
+        """Initializes the monitor.
+
+        @param loop:
+            EventLoop instance that drives the monitor
+        @param kwargs:
+            Further keyword arguments of SupporterMonitor. The dispatcher defaults to an
+            AsyncSupporteeListDispatcher that runs on the given loop.
+        """
+        if kwargs.get('dispatcher_factory') is None:
+            kwargs['dispatcher_factory'] = lambda monitor: AsyncSupporteeListDispatcher(monitor, loop)
+        SupporterMonitor.__init__(self, is_alive_timeout, peer_timeout, **kwargs)
+        self._logger = logging.getLogger("Tracker.AsyncSupporterMonitor")
+        self._loop = loop
+        # the state is only accessed by the loop thread
+        self._lock = OwnerLock()
+        self._update_timer = None
+        self._next_update = None
+        self._skipped_updates = 0
+        # time in seconds from the start of the last completed update cycle until the outcome
+        # of its I/O phase was available
+        self._last_cycle_latency = None
+
+    def start(self):
+        """Schedules update cycles at a fixed rate of one cycle per update interval on the loop.
+        The first cycle happens one interval after this call.
+
+        @return:
+            NoneType
+        """
+        self.call_synchronized(self._schedule_updates)
+
+    def _schedule_updates(self):
+        if self._update_timer is None:
+            self._next_update = self._loop.time() + self.get_update_interval()
+            self._update_timer = self._loop.call_later(self.get_update_interval(), self._run_scheduled_update)
+
+    def stop(self, timeout=None):
+        """Cancels the update cycles. I/O phases that are in progress are completed by the loop.
+
+        @return:
+            NoneType
+        """
+        self.call_synchronized(self._cancel_updates)
+
+    def _cancel_updates(self):
+        if self._update_timer is not None:
+            self._loop.cancel(self._update_timer)
+            self._update_timer = None
+
+    def is_running(self):
+        """@return:
+            True, if update cycles are scheduled. False otherwise.
+        """
+        return self._update_timer is not None
+
+    def get_skipped_updates(self):
+        """@return:
+            Number of update cycles that were skipped because the loop was busy for longer
+            than the update interval
+        """
+        return self._skipped_updates
+
+    def get_last_cycle_latency(self):
+        """@return:
+            Time in seconds from the start of the last completed update cycle until the outcome
+            of its I/O phase was available. NoneType if no cycle has completed yet.
+        """
+        return self._last_cycle_latency
+
+    def call_synchronized(self, function, *args):
+        """Calls function(*args) on the loop thread and waits for its completion. The function is
+        called directly if the loop is not running or if this method is called on the loop thread.
+
+        @return:
+            The return value of the function. Exceptions raised by the function are re-raised.
+        """
+        if not self._loop.is_running() or self._loop.in_loop_thread():
+            return function(*args)
+        done = threading.Event()
+        result = []
+
+        def call():
+            try:
+                result.extend([True, function(*args)])
+            except:
+                result.extend([False, sys.exc_info()])
+            done.set()
+
+        self._loop.call_soon_threadsafe(call)
+        done.wait()
+        if result[0]:
+            return result[1]
+        raise result[1][0], result[1][1], result[1][2]
+
+    def update_states(self):
+        """Performs the compute phase of an update cycle (cf. SupporterMonitor.update_states) and
+        starts its I/O phase on the loop. The outcome of the I/O phase is merged during the next
+        update cycle.
+
+        @return:
+            NoneType
+        """
+        started = self._loop.time()
+        plan = self._run_compute_phase()
+
+        def dispatched(result):
+            self._dispatch_results.append(result)
+            self._last_cycle_latency = self._loop.time() - started
+
+        self._dispatcher.execute_dispatch_plan_async(plan, dispatched)
+
+    def _run_scheduled_update(self):
+        try:
+            self.update_states()
+        except:
+            self._logger.exception("Update of the monitor state failed")
+        period = self.get_update_interval()
+        self._next_update += period
+        now = self._loop.time()
+        if now > self._next_update:
+            skipped = int((now - self._next_update) / period) + 1
+            self._next_update += skipped * period
+            self._skipped_updates += skipped
+            self._logger.warning("Update exceeded the update interval of %.3fs, skipped %i update(s)" %
+                                 (period, skipped))
+        if self._update_timer is not None:
+            self._update_timer = self._loop.call_later(self._next_update - now, self._run_scheduled_update)
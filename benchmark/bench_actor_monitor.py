@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Throughput benchmark for the locking SupporterMonitor and the single-writer ActorSupporterMonitor.
+
+Several producer threads (resembling the request threads of the tracker) report peer messages
+concurrently, while the update thread of the monitor runs every 100 ms and another thread renders
+the status page every 50 ms. The benchmark reports the throughput of the producers (messages per
+second until all producers returned) and the end-to-end throughput (messages that were applied
+to the monitored peers per second until all messages have been applied or dropped). For the
+actor, it also reports the max. depth of the ingestion queue and the number of dropped messages,
+both with the default queue capacity and with a capacity that can hold all messages. All
+messages of the benchmark are state-changing, so producers wait for space while the queue with
+the default capacity is full, and messages are only dropped if it stays full for
+ACTOR_ENQUEUE_TIMEOUT seconds.
+
+Run it with: python -m supporter.benchmark.bench_actor_monitor
+"""
+
+import threading
+import time
+
+import supporter.shared as shared
+
+from supporter.actor_monitor import ActorSupporterMonitor
+from supporter.supporter_monitor import MonitorState, SupporterMonitor
+
+PRODUCER_COUNTS = [8, 16, 32]
+PEERS = 2000
+MESSAGES_PER_PRODUCER = 20000
+
+
+def create_monitor(monitor_class, **kwargs):
+    monitor = monitor_class(update_interval=0.1, **kwargs)
+    monitor.register_monitored_peers([('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i,
+                                       shared.PEER_TYPE_LEECHER) for i in xrange(PEERS)])
+    return monitor
+
+
+def produce(monitor, offset):
+    msg_types = [shared.MSG_SUPPORT_REQUIRED] * 4 + [shared.MSG_SUPPORT_NOT_NEEDED]
+    received_peer_message = monitor.received_peer_message
+    for i in xrange(MESSAGES_PER_PRODUCER):
+        received_peer_message(msg_types[i % 5], 'PEER-%i' % ((offset + i) % PEERS))
+
+
+def render_status_pages(monitor, stopped):
+    while not stopped.isSet():
+        MonitorState.retrieve_monitor_state_as_html(monitor)
+        stopped.wait(0.05)
+
+
+def measure(monitor_class, producer_count, **kwargs):
+    """@return:
+        3-tuple of the producer throughput, the end-to-end throughput (both in messages per
+        second) and the monitor
+    """
+    monitor = create_monitor(monitor_class, **kwargs)
+    monitor.start()
+    stopped = threading.Event()
+    renderer = threading.Thread(target=render_status_pages, args=(monitor, stopped))
+    renderer.start()
+    producers = [threading.Thread(target=produce, args=(monitor, i * 997)) for i in xrange(producer_count)]
+    total = producer_count * MESSAGES_PER_PRODUCER
+    ts = time.time()
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    produced = time.time() - ts
+    if isinstance(monitor, ActorSupporterMonitor):
+        while monitor.get_processed_messages() + monitor.get_dropped_messages() < total:
+            time.sleep(0.001)
+        applied_messages = monitor.get_processed_messages()
+    else:
+        applied_messages = total
+    applied = time.time() - ts
+    stopped.set()
+    renderer.join()
+    monitor.close()
+    return total / produced, applied_messages / applied, monitor
+
+
+def run_benchmark():
+    print "%d peers, %d messages per producer" % (PEERS, MESSAGES_PER_PRODUCER)
+    print "%10s %16s %18s %18s %12s %10s" % ("producers", "model", "produced [msg/s]", "applied [msg/s]",
+                                             "max. depth", "dropped")
+    for producer_count in PRODUCER_COUNTS:
+        produced, applied, _ = measure(SupporterMonitor, producer_count)
+        print "%10i %16s %18.0f %18.0f %12s %10s" % (producer_count, "lock", produced, applied, "-", "-")
+        for name, capacity in [("actor", None), ("actor (no drops)", producer_count * MESSAGES_PER_PRODUCER)]:
+            produced, applied, monitor = measure(ActorSupporterMonitor, producer_count, queue_capacity=capacity)
+            print "%10i %16s %18.0f %18.0f %12i %10i" % (producer_count, name, produced, applied,
+                                                         monitor.get_max_queue_depth(),
+                                                         monitor.get_dropped_messages())
+
+
+if __name__ == "__main__":
+    run_benchmark()
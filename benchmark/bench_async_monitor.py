@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the AsyncSupporterMonitor as seen from an event-driven tracker front-end.
+
+The benchmark starts a few hundred local stand-in supporters and lets a front-end report
+announces (peer messages) for a fixed period of time while the monitor runs its update cycles.
+The front-end of the thread-and-lock SupporterMonitor (with a ConcurrentSupporteeListDispatcher)
+has to hand every announce over to a worker thread and wait for its completion, as an
+event-driven front-end does in order not to block on the lock of the monitor. The front-end of
+the AsyncSupporterMonitor reports announces directly on the loop, in batches that are
+interleaved with the I/O of the update cycles. The benchmark reports the announces per second
+and the mean latency of the update cycles (from their start until the outcome of their I/O phase
+was available).
+
+Run it with: python -m supporter.benchmark.bench_async_monitor
+"""
+
+import threading
+import time
+
+from collections import deque
+
+import supporter.shared as shared
+
+from supporter.async_monitor import AsyncSupporterMonitor, EventLoop
+from supporter.supporter_adapter import ConcurrentSupporteeListDispatcher
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.test.stand_in_supporters import StandInSupporter
+
+SUPPORTER_COUNTS = [100, 300]
+SUPPORTER_DELAY = 0.005
+PEERS = 5000
+UPDATE_INTERVAL = 0.25
+DURATION = 3
+BATCH_SIZE = 50
+
+MSG_TYPES = [shared.MSG_SUPPORT_REQUIRED] * 4 + [shared.MSG_SUPPORT_NOT_NEEDED]
+
+
+class TimedSupporterMonitor(SupporterMonitor):
+    """SupporterMonitor that records the duration of its update cycles."""
+
+    def __init__(self, *args, **kwargs):
+        SupporterMonitor.__init__(self, *args, **kwargs)
+        self.cycle_latencies = []
+
+    def update_states(self):
+        ts = time.time()
+        SupporterMonitor.update_states(self)
+        self.cycle_latencies.append(time.time() - ts)
+
+
+class ExecutorHop(object):
+    """Runs calls on a single worker thread and blocks the caller until they completed."""
+
+    def __init__(self):
+        self._calls = deque()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def call(self, function, *args):
+        done = threading.Event()
+        with self._condition:
+            self._calls.append((function, args, done))
+            self._condition.notify()
+        done.wait()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while len(self._calls) == 0:
+                    self._condition.wait()
+                function, args, done = self._calls.popleft()
+            function(*args)
+            done.set()
+
+
+def register(monitor, stand_ins):
+    for i, stand_in in enumerate(stand_ins):
+        monitor.register_monitored_supporter(i, stand_in.supporter.get_addr(), 1, 20)
+    monitor.register_monitored_peers([('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i,
+                                       shared.PEER_TYPE_LEECHER) for i in xrange(PEERS)])
+
+
+def measure_threaded(stand_ins):
+    """@return:
+        2-tuple of the announces per second and the mean cycle latency in seconds
+    """
+    monitor = TimedSupporterMonitor(update_interval=UPDATE_INTERVAL,
+                                    dispatcher_factory=ConcurrentSupporteeListDispatcher)
+    register(monitor, stand_ins)
+    hop = ExecutorHop()
+    monitor.start()
+    announces = 0
+    ts = time.time()
+    while time.time() - ts < DURATION:
+        for _ in xrange(BATCH_SIZE):
+            hop.call(monitor.received_peer_message, MSG_TYPES[announces % 5], 'PEER-%i' % (announces % PEERS))
+            announces += 1
+    elapsed = time.time() - ts
+    monitor.close()
+    return announces / elapsed, sum(monitor.cycle_latencies) / max(len(monitor.cycle_latencies), 1)
+
+
+def measure_async(stand_ins):
+    """@return:
+        2-tuple of the announces per second and the mean cycle latency in seconds
+    """
+    loop = EventLoop()
+    monitor = AsyncSupporterMonitor(loop, update_interval=UPDATE_INTERVAL)
+    register(monitor, stand_ins)
+    monitor.start()
+    announces = [0]
+    latencies = []
+
+    def announce():
+        received_peer_message = monitor.received_peer_message
+        count = announces[0]
+        for i in xrange(count, count + BATCH_SIZE):
+            received_peer_message(MSG_TYPES[i % 5], 'PEER-%i' % (i % PEERS))
+        announces[0] = count + BATCH_SIZE
+        latency = monitor.get_last_cycle_latency()
+        if latency is not None and (len(latencies) == 0 or latency is not latencies[-1]):
+            latencies.append(latency)
+        loop.call_later(0, announce)
+
+    loop.call_later(0, announce)
+    ts = time.time()
+    loop.run(timeout=DURATION)
+    elapsed = time.time() - ts
+    monitor.close()
+    loop.close()
+    return announces[0] / elapsed, sum(latencies) / max(len(latencies), 1)
+
+
+def run_benchmark():
+    print "%d peers, update interval %.2fs, %.1fs per run" % (PEERS, UPDATE_INTERVAL, DURATION)
+    print "%12s %10s %20s %20s" % ("supporters", "monitor", "announces [1/s]", "cycle latency [ms]")
+    for supporter_count in SUPPORTER_COUNTS:
+        stand_ins = [StandInSupporter(i, delay=SUPPORTER_DELAY, max_peer=20) for i in xrange(supporter_count)]
+        for name, measure in [("threaded", measure_threaded), ("async", measure_async)]:
+            throughput, latency = measure(stand_ins)
+            print "%12i %10s %20.0f %20.1f" % (supporter_count, name, throughput, latency * 1e3)
+        for stand_in in stand_ins:
+            stand_in.shutdown()
+
+
+if __name__ == "__main__":
+    run_benchmark()
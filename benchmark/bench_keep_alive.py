@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the XML-RPC transport used to contact supporters.
+
+The benchmark starts a few hundred local stand-in supporters and runs several I/O phases
+(liveness probe and supportee list dispatch for every supporter) with proxies that open a
+fresh TCP connection for every call and with proxies that use PersistentTransport. It
+reports the number of TCP connections opened by the tracker side and the CPU time spent by
+the benchmark process (tracker and stand-ins alike, since both run in the same process).
+
+Run it with: python -m supporter.benchmark.bench_keep_alive
+"""
+
+import os
+import time
+import xmlrpclib
+
+from supporter.supporter_adapter import SupporteeListDispatcher
+from supporter.test.stand_in_supporters import StandInSupporter, StubMonitor
+
+SUPPORTERS = 200
+CYCLES = 5
+
+
+class CountingTransport(xmlrpclib.Transport):
+    """Replicates the former behaviour of a plain proxy, which uses a new connection per call
+    (the stand-in answers with HTTP/1.0 semantics), and counts the opened connections."""
+
+    connections_created = 0
+
+    def make_connection(self, host):
+        CountingTransport.connections_created += 1
+        self._connection = None
+        return xmlrpclib.Transport.make_connection(self, host)
+
+
+class PlainSupporteeListDispatcher(SupporteeListDispatcher):
+
+    def _create_transport(self):
+        return CountingTransport()
+
+    def get_connection_statistics(self):
+        return {'connections_created': CountingTransport.connections_created}
+
+
+def run_cycles(dispatcher_class, keep_alive):
+    stand_ins = [StandInSupporter(i, keep_alive=keep_alive) for i in xrange(SUPPORTERS)]
+    dispatcher = dispatcher_class(StubMonitor([s.supporter for s in stand_ins]))
+    for stand_in in stand_ins:
+        dispatcher.register_proxy(stand_in.supporter)
+    cpu, ts = sum(os.times()[:2]), time.time()
+    for _ in xrange(CYCLES):
+        for stand_in in stand_ins:
+            stand_in.supporter.request_update()
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+    cpu, ts = sum(os.times()[:2]) - cpu, time.time() - ts
+    statistics = dispatcher.get_connection_statistics()
+    dispatcher.close()
+    for stand_in in stand_ins:
+        stand_in.shutdown()
+    return statistics['connections_created'], cpu, ts
+
+
+def run_benchmark():
+    print "%d supporters, %d cycles, 2 calls per supporter and cycle" % (SUPPORTERS, CYCLES)
+    print "%20s %15s %15s %15s" % ("transport", "connections", "cpu [s]", "wall [s]")
+    print "%20s %15i %15.2f %15.2f" % (("plain",) + run_cycles(PlainSupporteeListDispatcher, False))
+    print "%20s %15i %15.2f %15.2f" % (("keep-alive",) + run_cycles(SupporteeListDispatcher, True))
+
+
+if __name__ == "__main__":
+    run_benchmark()
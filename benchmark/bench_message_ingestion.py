@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Throughput benchmark for the ingestion of peer messages by SupporterMonitor.
+
+The tracker reports every peer message via received_peer_message, which acquires the lock of the
+monitor and pins its clock for every single message. received_peer_messages takes a batch of
+messages and does both only once per batch (and coalesces repeated MSG_SUPPORT_NOT_NEEDED
+messages of a peer). The benchmark compares the throughput in messages per second of both
+methods for several batch sizes, as well as the registration of peers one by one against
+register_monitored_peers.
+
+The message stream resembles announces of leechers: every peer sends a few support requests,
+followed by a burst of MSG_SUPPORT_NOT_NEEDED messages once it is served by other peers.
+
+Run it with: python -m supporter.benchmark.bench_message_ingestion
+"""
+
+import gc
+import time
+
+import supporter.shared as shared
+
+from supporter.supporter_monitor import SupporterMonitor
+
+PEERS = 10000
+BATCH_SIZES = [10, 100, 1000, 10000]
+
+
+def create_peers():
+    return [('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i % 60000, shared.PEER_TYPE_LEECHER)
+            for i in xrange(PEERS)]
+
+
+def create_messages(peers):
+    messages = []
+    for peer_id, _, _, _ in peers:
+        messages.extend([(shared.MSG_SUPPORT_REQUIRED, peer_id)] * 2)
+        messages.extend([(shared.MSG_SUPPORT_NOT_NEEDED, peer_id)] * 3)
+    return messages
+
+
+def measure_registration(bulk):
+    """@return:
+        Registered peers per second
+    """
+    peers = create_peers()
+    monitor = SupporterMonitor()
+    gc.collect()
+    ts = time.time()
+    if bulk:
+        monitor.register_monitored_peers(peers)
+    else:
+        for peer in peers:
+            monitor.register_monitored_peer(*peer)
+    return len(peers) / (time.time() - ts)
+
+
+def measure_ingestion(batch_size):
+    """@param batch_size:
+        Number of messages per batch. NoneType to report every message on its own.
+
+    @return:
+        Messages per second
+    """
+    peers = create_peers()
+    monitor = SupporterMonitor()
+    monitor.register_monitored_peers(peers)
+    messages = create_messages(peers)
+    gc.collect()
+    ts = time.time()
+    if batch_size is None:
+        for msg_type, peer_id in messages:
+            monitor.received_peer_message(msg_type, peer_id)
+    else:
+        for i in xrange(0, len(messages), batch_size):
+            monitor.received_peer_messages(messages[i:i + batch_size])
+    return len(messages) / (time.time() - ts)
+
+
+def run_benchmark():
+    print "%d peers, %d messages" % (PEERS, PEERS * 5)
+    print "%20s %20s" % ("registration", "peers/s")
+    print "%20s %20.0f" % ("single", measure_registration(False))
+    print "%20s %20.0f" % ("bulk", measure_registration(True))
+    print "%20s %20s" % ("ingestion", "messages/s")
+    print "%20s %20.0f" % ("single", measure_ingestion(None))
+    for batch_size in BATCH_SIZES:
+        print "%20s %20.0f" % ("batch of %i" % batch_size, measure_ingestion(batch_size))
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the per-tick peer maintenance of SupporterMonitor.update_states.
+
+The benchmark registers 1k, 10k and 100k peers at a SupporterMonitor, of which 1% are watched
+peers whose is-alive timeout expires, and measures the time it takes to update the expired peers.
+The figures are compared against the former implementation, which scanned all monitored peers
+on every tick in order to find timed out peers and to trigger asynchronous state transitions.
+
+Run it with: python -m supporter.benchmark.bench_peer_expiry
+"""
+
+import time
+
+import supporter.shared as shared
+
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.state_machine import DEFAULT_STATE
+
+SWARM_SIZES = [1000, 10000, 100000]
+EXPIRING_FRACTION = 0.01
+IS_ALIVE_TIMEOUT = 1
+
+
+def full_scan_update(monitor):
+    """Replicates the former peer maintenance, which touched every peer on every tick."""
+    clock = monitor.get_clock()
+    ts = clock.now()
+    for mp in [mp for mp in monitor.get_monitored_peers()
+               if (ts - mp.get_ts_last_message()) >= shared.PEER_REMOVAL_TIME]:
+        monitor.unregister_monitored_peer(mp)
+    for mp in monitor.get_monitored_peers():
+        if mp.get_ts_last_request() and (clock.now() - mp.get_ts_last_request() > shared.PEER_RESET_TIME):
+            mp.set_state(DEFAULT_STATE)
+        else:
+            mp.get_state().transition(mp)
+
+
+
+def update_expired_peers(monitor):
+    monitor._update_expired_peers(monitor.get_clock().now())
+
+
+def create_monitor(swarm_size):
+    # the monitor is not started, so the measurements are not disturbed by state updates
+    monitor = SupporterMonitor(IS_ALIVE_TIMEOUT)
+    for i in xrange(swarm_size):
+        peer_id = 'PEER-%i' % i
+        monitor.register_monitored_peer(peer_id, '10.0.%i.%i' % (i / 256 % 256, i % 256),
+                                        1024 + i % 60000, shared.PEER_TYPE_LEECHER)
+        if i < swarm_size * EXPIRING_FRACTION:
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, peer_id)
+    return monitor
+
+
+def measure(update, monitor):
+    ts = time.time()
+    update(monitor)
+    return time.time() - ts
+
+
+def run_benchmark():
+    print "%10s %10s %20s %20s" % ("peers", "expired", "full scan [ms]", "deadline heap [ms]")
+    for swarm_size in SWARM_SIZES:
+        full_scan_monitor = create_monitor(swarm_size)
+        heap_monitor = create_monitor(swarm_size)
+        time.sleep(IS_ALIVE_TIMEOUT + 0.1)
+        full_scan = measure(full_scan_update, full_scan_monitor)
+        heap = measure(update_expired_peers, heap_monitor)
+        print "%10i %10i %20.2f %20.2f" % (swarm_size, swarm_size * EXPIRING_FRACTION, full_scan * 1e3,
+                                           heap * 1e3)
+
+
+if __name__ == "__main__":
+    run_benchmark()
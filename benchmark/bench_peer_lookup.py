@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the message dispatch path of SupporterMonitor.received_peer_message.
+
+The benchmark registers 1k, 10k and 100k peers at a SupporterMonitor and measures the average
+latency of dispatching a message to a randomly chosen peer. The figures are compared against
+the former implementation, which looked up the addressed peer by a linear scan over all
+monitored peers while holding the monitor lock.
+
+Run it with: python -m supporter.benchmark.bench_peer_lookup
+"""
+
+import random
+import time
+
+import supporter.shared as shared
+
+from supporter.supporter_monitor import SupporterMonitor
+
+SWARM_SIZES = [1000, 10000, 100000]
+MESSAGES = 2000
+
+
+def linear_scan_dispatch(monitor, msg_type, peer_id):
+    """Replicates the former message dispatch, which scanned the list of all monitored peers."""
+    monitor._lock.acquire()
+    try:
+        for peer in monitor.get_monitored_peers():
+            if peer_id == peer.get_id():
+                peer.receive_msg(msg_type)
+                break
+    finally:
+        monitor._lock.release()
+
+
+def measure(dispatch, peer_ids):
+    ts = time.time()
+    for peer_id in peer_ids:
+        dispatch(shared.MSG_PEER_REGISTERED, peer_id)
+    return (time.time() - ts) / len(peer_ids)
+
+
+def run_benchmark():
+    print "%10s %20s %20s" % ("peers", "linear scan [us]", "indexed [us]")
+    for swarm_size in SWARM_SIZES:
+        # the monitor is not started, so the measurements are not disturbed by state updates
+        monitor = SupporterMonitor()
+        for i in xrange(swarm_size):
+            monitor.register_monitored_peer('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256),
+                                            1024 + i % 60000, shared.PEER_TYPE_LEECHER)
+        peer_ids = ['PEER-%i' % random.randrange(swarm_size) for _ in xrange(MESSAGES)]
+        linear = measure(lambda msg_type, peer_id: linear_scan_dispatch(monitor, msg_type, peer_id),
+                         peer_ids[:MESSAGES / 10])
+        indexed = measure(monitor.received_peer_message, peer_ids)
+        print "%10i %20.2f %20.2f" % (swarm_size, linear * 1e6, indexed * 1e6)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the memory footprint of MonitoredPeer instances.
+
+The benchmark creates 100k MonitoredPeer instances and reports the number of bytes allocated per
+peer. The figures are compared against a replica of the former representation, which carried an
+instance __dict__ and a per-instance dispatch table of bound message handler methods.
+
+Allocations are measured with tracemalloc if it is available. Otherwise, the growth of the
+resident set size of the process is measured (Linux only), which is less precise. Every
+representation is measured in a forked process, so that freed memory is not reused.
+
+Run it with: python -m supporter.benchmark.bench_peer_memory
+"""
+
+import gc
+import os
+
+import supporter.shared as shared
+
+from supporter.monitored_subjects import MonitoredPeer
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+PEERS = 100000
+
+
+def create_dict_based_peer_class():
+    """Replicates the former MonitoredPeer representation: same methods, but instances carry a
+    __dict__ and get their own dispatch table of bound methods."""
+    namespace = dict((name, value) for name, value in MonitoredPeer.__dict__.items()
+                     if name not in MonitoredPeer.__slots__ and name not in ('__slots__', 'msg_handler'))
+
+    def __init__(self, *args):
+        MonitoredPeer.__dict__['__init__'](self, *args)
+        self.msg_handler = dict((msg_type, getattr(self, handler.__name__))
+                                for msg_type, handler in MonitoredPeer.msg_handler.items())
+
+    def receive_msg(self, msg_type):
+        self._last_received_msg = msg_type
+        self.msg_handler[msg_type]()
+        self.get_state().transition(self)
+
+    namespace['__init__'] = __init__
+    namespace['receive_msg'] = receive_msg
+    return type('DictMonitoredPeer', (object,), namespace)
+
+
+def allocated_bytes():
+    if tracemalloc is not None:
+        return tracemalloc.get_traced_memory()[0]
+    statm = open('/proc/self/statm')
+    try:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    finally:
+        statm.close()
+
+
+def measure(peer_class):
+    gc.collect()
+    before = allocated_bytes()
+    peers = [peer_class('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i % 60000,
+                        shared.PEER_TYPE_LEECHER) for i in xrange(PEERS)]
+    for peer in peers:
+        peer.receive_msg(shared.MSG_PEER_REGISTERED)
+    gc.collect()
+    return float(allocated_bytes() - before) / PEERS
+
+
+def measure_in_child_process(peer_class):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        if tracemalloc is not None:
+            tracemalloc.start()
+        os.write(write_fd, repr(measure(peer_class)))
+        os._exit(0)
+    os.close(write_fd)
+    result = os.read(read_fd, 64)
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    return float(result)
+
+
+def run_benchmark():
+    print "measuring %s for %i peers" % ("tracemalloc allocations" if tracemalloc else "resident set size", PEERS)
+    print "%30s %20s" % ("representation", "bytes per peer")
+    print "%30s %20.1f" % ("__dict__ + bound handlers", measure_in_child_process(create_dict_based_peer_class()))
+    print "%30s %20.1f" % ("__slots__ + class-level table", measure_in_child_process(MonitoredPeer))
+
+
+if __name__ == "__main__":
+    run_benchmark()
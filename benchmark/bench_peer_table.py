@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the asynchronous peer state update of SupporterMonitor with different peer backends.
+
+The benchmark registers 10k, 100k and 1M peers at a SupporterMonitor, of which 1% are watched peers
+whose is-alive timeout expires, and measures the time it takes to update the states of all peers:
+
+    full scan      update every MonitoredPeer object one by one (former implementation)
+    deadline heap  update MonitoredPeer objects whose deadline has passed (default)
+    peer table     evaluate all rows of a NumPy-backed PeerTable with vectorized masks
+
+Swarm sizes can be passed as arguments, e.g.: python -m supporter.benchmark.bench_peer_table 10000 50000
+
+Run it with: python -m supporter.benchmark.bench_peer_table
+"""
+
+import gc
+import sys
+import time
+
+import supporter.shared as shared
+
+from supporter.peer_table import numpy, PeerTable
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.state_machine import DEFAULT_STATE
+
+SWARM_SIZES = [10000, 100000, 1000000]
+EXPIRING_FRACTION = 0.01
+IS_ALIVE_TIMEOUT = 1
+
+
+def full_scan_update(monitor):
+    """Replicates the former peer maintenance, which touched every peer on every tick."""
+    clock = monitor.get_clock()
+    ts = clock.now()
+    for mp in [mp for mp in monitor.get_monitored_peers()
+               if (ts - mp.get_ts_last_message()) >= shared.PEER_REMOVAL_TIME]:
+        monitor.unregister_monitored_peer(mp)
+    for mp in monitor.get_monitored_peers():
+        if mp.get_ts_last_request() and (clock.now() - mp.get_ts_last_request() > shared.PEER_RESET_TIME):
+            mp.set_state(DEFAULT_STATE)
+        else:
+            mp.trigger_transition()
+
+
+
+def update_expired_peers(monitor):
+    monitor._update_expired_peers(monitor.get_clock().now())
+
+
+
+def update_peer_table(monitor):
+    monitor._update_peer_table(monitor.get_clock().now())
+
+
+def create_monitor(swarm_size, peer_table=None):
+    # the monitor is not started, so the measurements are not disturbed by state updates
+    monitor = SupporterMonitor(IS_ALIVE_TIMEOUT, peer_table=peer_table)
+    for i in xrange(swarm_size):
+        peer_id = 'PEER-%i' % i
+        monitor.register_monitored_peer(peer_id, '10.%i.%i.%i' % (i / 65536 % 256, i / 256 % 256, i % 256),
+                                        1024 + i % 60000, shared.PEER_TYPE_LEECHER)
+        if i < swarm_size * EXPIRING_FRACTION:
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, peer_id)
+    time.sleep(IS_ALIVE_TIMEOUT + 0.1)
+    return monitor
+
+
+def measure(update, swarm_size, peer_table=None):
+    monitor = create_monitor(swarm_size, peer_table)
+    gc.collect()
+    ts = time.time()
+    update(monitor)
+    elapsed = time.time() - ts
+    assert monitor.count_peers_by_state(DEFAULT_STATE.__class__) == swarm_size
+    return elapsed
+
+
+def run_benchmark(swarm_sizes):
+    if numpy is None:
+        print "NumPy is not available, skipping the peer table backend"
+    print "%10s %16s %20s %16s" % ("peers", "full scan [ms]", "deadline heap [ms]", "peer table [ms]")
+    for swarm_size in swarm_sizes:
+        full_scan = measure(full_scan_update, swarm_size)
+        heap = measure(update_expired_peers, swarm_size)
+        table = None
+        if numpy is not None:
+            table = measure(update_peer_table, swarm_size, PeerTable(swarm_size))
+        print "%10i %16.2f %20.2f %16s" % (swarm_size, full_scan * 1e3, heap * 1e3,
+                                           "-" if table is None else "%.2f" % (table * 1e3))
+
+
+if __name__ == "__main__":
+    run_benchmark([int(arg) for arg in sys.argv[1:]] or SWARM_SIZES)
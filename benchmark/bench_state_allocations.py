@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for allocations of state objects on the steady-state update path.
+
+The benchmark registers 50k peers at a SupporterMonitor and simulates a swarm in which a share of
+the peers sends support requests in every cycle while others stop sending them and fall back to
+DEFAULT state. It counts the state objects that are allocated during message dispatch and
+update_states as well as the number of state transitions. The former implementation allocated
+a new state object for every transition (and for every idle peer on every tick), while states
+are shared singletons now, so no state objects should be allocated at all.
+
+Run it with: python -m supporter.benchmark.bench_state_allocations
+"""
+
+import time
+
+import supporter.shared as shared
+
+from supporter.monitored_subjects import MonitoredPeer
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.state_machine import State
+
+PEERS = 50000
+CYCLES = 5
+REQUESTING_FRACTION = 0.1
+IS_ALIVE_TIMEOUT = 1
+UPDATE_INTERVAL = 1
+
+
+class Counter(object):
+    def __init__(self):
+        self.state_allocations = 0
+        self.transitions = 0
+
+    def install(self):
+        """Counts allocations of state objects and state transitions of monitored peers."""
+        counter = self
+        state_new = State.__new__
+        set_state = MonitoredPeer.set_state
+
+        def counting_new(cls, *args, **kwargs):
+            counter.state_allocations += 1
+            return state_new(cls)
+
+        def counting_set_state(peer, state):
+            if peer.get_state() is not state:
+                counter.transitions += 1
+            set_state(peer, state)
+
+        State.__new__ = staticmethod(counting_new)
+        MonitoredPeer.set_state = counting_set_state
+
+
+def run_benchmark():
+    # the monitor is not started, update_states is called explicitly
+    monitor = SupporterMonitor(IS_ALIVE_TIMEOUT)
+    for i in xrange(PEERS):
+        monitor.register_monitored_peer('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256),
+                                        1024 + i % 60000, shared.PEER_TYPE_LEECHER)
+    counter = Counter()
+    counter.install()
+
+    requesting = int(PEERS * REQUESTING_FRACTION)
+    print "%10s %20s %20s %15s" % ("cycle", "requesting peers", "state transitions", "allocations")
+    for cycle in xrange(CYCLES):
+        transitions, allocations = counter.transitions, counter.state_allocations
+        # every cycle, another group of peers starts sending support requests, while the group
+        # of the previous cycle stops and times out
+        offset = cycle * requesting
+        ts = time.time()
+        for i in xrange(offset, offset + requesting):
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'PEER-%i' % (i % PEERS))
+        monitor.update_states()
+        print "%10i %20i %20i %15i" % (cycle, requesting, counter.transitions - transitions,
+                                        counter.state_allocations - allocations)
+        time.sleep(max(0, UPDATE_INTERVAL - (time.time() - ts)) + 0.1)
+    monitor.close()
+
+
+if __name__ == "__main__":
+    run_benchmark()
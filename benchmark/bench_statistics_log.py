@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the statistics log of SupporterMonitor on a stalling disk.
+
+The benchmark runs 100 update cycles of a monitor with 10k peers and measures the duration of
+update_states, while every flush of the statistics log stalls for 20 ms. The figures are compared
+against the former implementation, which wrote and flushed the statistics line synchronously
+within the compute phase of the update cycle (i.e. while holding the lock of the monitor). The
+benchmark also reports the size of a record in the text and in the binary format.
+
+Run it with: python -m supporter.benchmark.bench_statistics_log
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+import supporter.shared as shared
+
+from supporter.statistics_log import StatisticsLogWriter
+from supporter.supporter_monitor import SupporterMonitor
+
+PEERS = 10000
+CYCLES = 100
+STALL = 0.02
+
+
+class StallingFile(object):
+    """File whose flush stalls for some time, like a busy disk."""
+
+    def __init__(self, f):
+        self._file = f
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def flush(self):
+        time.sleep(STALL)
+        self._file.flush()
+
+
+class StallingStatisticsLogWriter(StatisticsLogWriter):
+
+    def _open_file(self):
+        StatisticsLogWriter._open_file(self)
+        self._file = StallingFile(self._file)
+
+
+class SynchronousStatisticsLog(object):
+    """Replicates the former statistics log, which was written within the update cycle."""
+
+    def __init__(self, path):
+        self._file = StallingFile(open(path, 'w'))
+
+    def submit(self, monitor_snapshot):
+        counts = monitor_snapshot.state_counts
+        self._file.write("%1.2f\t%i\t%i\t%i\t%i\t%i\t%i\t%i" % (monitor_snapshot.created, counts.default,
+                                                              counts.watched, counts.starving, counts.supported,
+                                                              monitor_snapshot.rpcs_per_cycle,
+                                                              monitor_snapshot.freed_supporters_per_cycle,
+                                                              monitor_snapshot.migrated_peers_per_cycle))
+        self._file.write('\n')
+        self._file.flush()
+
+    def close(self, timeout=None):
+        self._file.close()
+
+
+def measure(statistics_log):
+    """@return:
+        2-tuple of the mean and the max. duration of update_states in seconds
+    """
+    monitor = SupporterMonitor(statistics_log=statistics_log)
+    monitor.register_monitored_peers([('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i,
+                                       shared.PEER_TYPE_LEECHER) for i in xrange(PEERS)])
+    durations = []
+    for _ in xrange(CYCLES):
+        ts = time.time()
+        monitor.update_states()
+        durations.append(time.time() - ts)
+    monitor.close()
+    return sum(durations) / len(durations), max(durations)
+
+
+def run_benchmark():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'statistics.log')
+        print "%d peers, %d cycles, %d ms per flush" % (PEERS, CYCLES, STALL * 1e3)
+        print "%15s %15s %15s %20s" % ("statistics log", "mean [ms]", "max [ms]", "bytes per record")
+        for name, statistics_log in [("former", SynchronousStatisticsLog(path)),
+                                     ("text", StallingStatisticsLogWriter(path)),
+                                     ("binary", StallingStatisticsLogWriter(path, binary=True))]:
+            mean, maximum = measure(statistics_log)
+            print "%15s %15.2f %15.2f %20.1f" % (name, mean * 1e3, maximum * 1e3,
+                                                 os.path.getsize(path) / float(CYCLES))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    run_benchmark()
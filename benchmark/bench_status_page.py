@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the latency of message ingestion while status pages are being rendered.
+
+The benchmark registers 100k peers and starts the monitor, so that update_states runs at the
+normal rate of UPDATE_INTERVAL seconds. For a fixed period of time, a single producer thread
+reports peer messages while another thread renders the HTML status page over and over again.
+It reports the mean, the 99th percentile and the max. latency of received_peer_message as well
+as the mean and the max. duration of update_states. The figures are compared against the
+former implementation, which rendered the status page from the live monitored peers while
+holding the lock of the monitor, and against a run without a status page reader. The status
+page is rendered from the snapshot that the monitor publishes at the end of every update cycle
+now. The reader does not hold the lock at all, and the update cycle only rebuilds the records of
+the peers that changed and copies the chunks of the snapshot that hold them.
+
+Run it with: python -m supporter.benchmark.bench_status_page
+"""
+
+import threading
+import time
+
+import supporter.shared as shared
+
+from supporter.supporter_monitor import MonitorState, SupporterMonitor
+
+PEERS = 100000
+DURATION = 5
+
+MSG_TYPES = [shared.MSG_SUPPORT_REQUIRED] * 4 + [shared.MSG_SUPPORT_NOT_NEEDED]
+
+
+class TimedSupporterMonitor(SupporterMonitor):
+    """SupporterMonitor that records the duration of its update cycles."""
+
+    def __init__(self, *args, **kwargs):
+        SupporterMonitor.__init__(self, *args, **kwargs)
+        self.cycle_durations = []
+
+    def update_states(self):
+        ts = time.time()
+        SupporterMonitor.update_states(self)
+        self.cycle_durations.append(time.time() - ts)
+
+
+def render_under_lock(monitor):
+    """Replicates the former status page, which was generated while holding the lock."""
+    html_string = '<h2>Supporter Monitor State</h2>\n<h3>Monitored Peers</h3>\n'
+    for peer in monitor.get_monitored_peers():
+        html_string += '<tr>\n'
+        html_string += '<td>%s</td>' % peer.get_id()
+        html_string += '<td>%s:%i</td>' % (peer.get_ip(), peer.get_port())
+        html_string += '<td>%s</td>' % str(peer.get_state())
+        html_string += '<td>%s</td>' % peer.get_last_received_msg()
+        html_string += '<td>%i</td>' % peer.get_number_of_support_requests()
+        html_string += '</tr>\n'
+    return html_string
+
+
+def render_status_pages(render, stopped):
+    while not stopped.isSet():
+        render()
+
+
+def measure(render):
+    """@return:
+        5-tuple of the number of messages, the mean, the 99th percentile and the max. latency
+        of received_peer_message and the mean duration of update_states in seconds
+    """
+    monitor = TimedSupporterMonitor()
+    monitor.register_monitored_peers([('PEER-%i' % i, '10.%i.%i.%i' % (i / 65536, i / 256 % 256, i % 256),
+                                       1024 + i % 60000, shared.PEER_TYPE_LEECHER) for i in xrange(PEERS)])
+    monitor.start()
+    stopped = threading.Event()
+    if render is not None:
+        reader = threading.Thread(target=render_status_pages, args=(lambda: render(monitor), stopped))
+        reader.start()
+        time.sleep(0.1)
+    latencies = []
+    i = 0
+    end = time.time() + DURATION
+    while time.time() < end:
+        ts = time.time()
+        monitor.received_peer_message(MSG_TYPES[i % 5], 'PEER-%i' % (i % PEERS))
+        latencies.append(time.time() - ts)
+        i += 1
+    stopped.set()
+    if render is not None:
+        reader.join()
+    monitor.close()
+    latencies.sort()
+    cycles = monitor.cycle_durations or [0.0]
+    return (len(latencies), sum(latencies) / len(latencies), latencies[int(len(latencies) * 0.99)],
+            latencies[-1], sum(cycles) / len(cycles))
+
+
+def run_benchmark():
+    print "%d peers, %d seconds, update interval %d s" % (PEERS, DURATION, shared.UPDATE_INTERVAL)
+    print "%12s %10s %12s %12s %12s %16s" % ("status page", "messages", "mean [us]", "p99 [us]", "max [ms]",
+                                           "update [ms]")
+    for name, render in [("none", None),
+                         ("former", lambda monitor: monitor.call_synchronized(render_under_lock, monitor)),
+                         ("snapshot", MonitorState.retrieve_monitor_state_as_html)]:
+        messages, mean, p99, maximum, update = measure(render)
+        print "%12s %10d %12.1f %12.1f %12.2f %16.2f" % (name, messages, mean * 1e6, p99 * 1e6, maximum * 1e3,
+                                                       update * 1e3)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the rendering of status pages of large swarms.
+
+The benchmark registers 100k peers, publishes a snapshot and renders the HTML status page with
+the former implementation, which built the page by repeated string concatenation, and with the
+streaming renderer (iter_monitor_state_as_html), which yields the page in chunks of
+STATUS_PAGE_CHUNK_ROWS rows. It reports the time until the first chunk is available, the total
+time and the size of the largest string the renderer handed out (i.e. the amount of output that
+has to be held in memory at once). It also reports the figures of the JSON variant and of a page
+of 100 starving peers.
+
+Run it with: python -m supporter.benchmark.bench_status_rendering
+"""
+
+import gc
+import time
+
+import supporter.shared as shared
+
+from supporter.supporter_monitor import MonitorState, SupporterMonitor
+
+PEERS = 100000
+PAGE_SIZE = 100
+
+
+def render_concatenated(monitor):
+    """Replicates the former status page, which was built by repeated string concatenation."""
+    html_string = '<h2>Supporter Monitor State</h2>\n<h3>Monitored Peers</h3>\n'
+    html_string += '<table border=1 cellspacing=1>\n'
+    for peer in monitor.get_snapshot().peers:
+        html_string += '<tr>\n'
+        html_string += '<td>%s</td>' % peer.id
+        html_string += '<td>%s:%i</td>' % (peer.ip, peer.port)
+        html_string += '<td>%s</td>' % peer.state
+        html_string += '<td>%s</td>' % peer.last_received_msg
+        html_string += '<td>%i</td>' % peer.support_requests
+        html_string += '</tr>\n'
+    html_string += '<table>\n'
+    return [html_string]
+
+
+def create_monitor():
+    monitor = SupporterMonitor()
+    monitor.register_monitored_peers([('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i % 60000,
+                                       shared.PEER_TYPE_LEECHER) for i in xrange(PEERS)])
+    for i in xrange(0, PEERS, 10):
+        monitor.received_peer_messages([(shared.MSG_SUPPORT_REQUIRED, 'PEER-%i' % i)] * shared.PEER_REQUIRED_MSGS)
+    monitor.publish_snapshot()
+    return monitor
+
+
+def measure(render):
+    """@return:
+        3-tuple of the time until the first chunk and the total time (both in seconds) as well as
+        the size of the largest chunk in bytes
+    """
+    gc.collect()
+    ts = time.time()
+    chunks = iter(render())
+    largest = len(next(chunks))
+    first = time.time() - ts
+    for chunk in chunks:
+        largest = max(largest, len(chunk))
+    return first, time.time() - ts, largest
+
+
+def run_benchmark():
+    monitor = create_monitor()
+    print "%d peers, %d rows per chunk" % (PEERS, shared.STATUS_PAGE_CHUNK_ROWS)
+    print "%22s %18s %15s %20s" % ("renderer", "first chunk [ms]", "total [ms]", "largest chunk [kB]")
+    for name, render in [("former (concatenated)", lambda: render_concatenated(monitor)),
+                         ("html (streamed)", lambda: MonitorState.iter_monitor_state_as_html(monitor)),
+                         ("json (streamed)", lambda: MonitorState.iter_monitor_state_as_json(monitor)),
+                         ("html (page)", lambda: MonitorState.iter_monitor_state_as_html(monitor, limit=PAGE_SIZE,
+                                                                                         state='Starving'))]:
+        first, total, largest = measure(render)
+        print "%22s %18.2f %15.2f %20.1f" % (name, first * 1e3, total * 1e3, largest / 1024.0)
+
+
+if __name__ == "__main__":
+    run_benchmark()
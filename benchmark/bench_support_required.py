@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Micro-benchmark for the MSG_SUPPORT_REQUIRED hot path of MonitoredPeer.
+
+Every support request appends a timestamp to the sliding window over the last required_msgs
+requests. The former implementation kept the window in a list and sliced off the oldest
+timestamp once the window was full, which copies the whole window for every request. The window
+is a bounded deque now, so a request costs the same regardless of the window size. The benchmark
+compares both implementations for several window sizes.
+
+Run it with: python -m supporter.benchmark.bench_support_required
+"""
+
+import timeit
+
+import supporter.shared as shared
+
+from supporter.monitored_subjects import MonitoredPeer
+
+WINDOW_SIZES = [4, 16, 64, 256]
+REQUESTS = 100000
+REPEAT = 3
+
+
+class ListWindowPeer(MonitoredPeer):
+    """MonitoredPeer that keeps the sliding window in a list (former implementation)."""
+
+    __slots__ = ()
+
+    def reset_support_cycle(self):
+        self._ts_list = []
+        self._support_requests = 0
+
+    def received_support_required_message(self):
+        self.increment_support_requests()
+        self.stop_timeout_timer()
+        self._ts_list.append(self._ts_last_received_msg)
+        if len(self._ts_list) > self._required_msgs:
+            self._ts_list = self._ts_list[1:]
+
+    msg_handler = dict(MonitoredPeer.msg_handler)
+    msg_handler[shared.MSG_SUPPORT_REQUIRED] = received_support_required_message
+
+
+def measure(peer_class, window_size):
+    """@return:
+        Time in microseconds per support request
+    """
+    # the approval time is never exceeded, so the peer stays in STARVING state once the window is full
+    peer = peer_class('PEER', '10.0.0.1', 1024, shared.PEER_TYPE_LEECHER, required_msgs=window_size)
+    receive_msg = peer.receive_msg
+    msg_type = shared.MSG_SUPPORT_REQUIRED
+    for _ in xrange(window_size):
+        receive_msg(msg_type)
+    seconds = min(timeit.repeat(lambda: receive_msg(msg_type), number=REQUESTS, repeat=REPEAT))
+    return seconds / REQUESTS * 1e6
+
+
+def run_benchmark():
+    print "%12s %15s %15s" % ("window size", "list [us]", "deque [us]")
+    for window_size in WINDOW_SIZES:
+        print "%12i %15.3f %15.3f" % (window_size, measure(ListWindowPeer, window_size),
+                                      measure(MonitoredPeer, window_size))
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the maintenance of supportee lists during the assignment phase.
+
+The benchmark activates 1k supporters with 100 slots each and measures the time it takes to
+fill their supportee lists with 100k peers (add_supported_peer) and to evaluate the supportee
+lists after 10% of the peers went back to DEFAULT state (_enforce_update_of_monitored_supporters).
+The figures are compared against the former implementation, which kept supportee lists in plain
+lists (every membership test was a linear scan) and recomputed the tuple hashes of both peers
+on every comparison.
+
+Run it with: python -m supporter.benchmark.bench_supportee_lists
+"""
+
+import gc
+import time
+
+import supporter.shared as shared
+
+from supporter.monitored_subjects import MonitoredPeer, MonitoredSupporter
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.state_machine import DEFAULT_STATE, SUPPORTED_STATE
+
+SUPPORTERS = 1000
+PEERS_PER_SUPPORTER = 100
+RETURNING_FRACTION = 0.1
+
+
+class LegacyPeer(MonitoredPeer):
+    """MonitoredPeer with the former hash and equality implementation."""
+
+    __slots__ = ()
+
+    def __hash__(self):
+        return hash((self._id, self._ip, self._port))
+
+    def __eq__(self, other):
+        assert isinstance(other, MonitoredPeer)
+        return self.__hash__() == other.__hash__()
+
+
+class LegacySupporter(MonitoredSupporter):
+    """MonitoredSupporter with the former hash and equality implementation that keeps its
+    supportee list in a plain list."""
+
+    def __init__(self, supporter_id, addr, min_peer, max_peer):
+        MonitoredSupporter.__init__(self, supporter_id, addr, min_peer, max_peer)
+        self._supported_peers = []
+
+    def __hash__(self):
+        return hash((self._supporterId, self._addr, self._min_peer, self._max_peer))
+
+    def __eq__(self, other):
+        assert isinstance(other, MonitoredSupporter)
+        return self.__hash__() == other.__hash__()
+
+    def add_supported_peer(self, monitored_peer):
+        if monitored_peer not in self._supported_peers:
+            self._updated = True
+            self._supported_peers.append(monitored_peer)
+            if monitored_peer in self._removed_peers:
+                self._removed_peers.discard(monitored_peer)
+            else:
+                self._added_peers.add(monitored_peer)
+
+    def remove_supported_peer(self, monitored_peer):
+        if monitored_peer in self._supported_peers:
+            self._supported_peers.remove(monitored_peer)
+            self._updated = True
+            if monitored_peer in self._added_peers:
+                self._added_peers.discard(monitored_peer)
+            else:
+                self._removed_peers.add(monitored_peer)
+
+    def get_supported_peers(self):
+        return self._supported_peers
+
+
+class LegacyMonitor(SupporterMonitor):
+    """SupporterMonitor with the former evaluation of the supportee lists."""
+
+    def _enforce_update_of_monitored_supporters(self):
+        supporters_to_be_inactivated = []
+        for supporter in self._active_supporters:
+            supporter.update_supported_peer_list()
+            if supporter.assigned_slots() == 0:
+                supporters_to_be_inactivated.append(supporter)
+        self._active_supporters = [s for s in self._active_supporters if s not in supporters_to_be_inactivated]
+
+
+def create_swarm(monitor_class, supporter_class, peer_class):
+    monitor = monitor_class()
+    supporters = []
+    for i in xrange(SUPPORTERS):
+        supporter = supporter_class(i, ('10.1.%i.%i' % (i / 256, i % 256), 1024), 1, PEERS_PER_SUPPORTER)
+        monitor.activate_supporter(supporter)
+        supporters.append(supporter)
+    peers = []
+    for i in xrange(SUPPORTERS * PEERS_PER_SUPPORTER):
+        peer = peer_class('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i % 60000,
+                          shared.PEER_TYPE_LEECHER)
+        peer.set_state(SUPPORTED_STATE)
+        peers.append(peer)
+    return monitor, supporters, peers
+
+
+def measure(monitor_class, supporter_class, peer_class):
+    """@return:
+        2-tuple of the time in seconds it took to fill all supportee lists and to evaluate them
+    """
+    monitor, supporters, peers = create_swarm(monitor_class, supporter_class, peer_class)
+    gc.collect()
+    ts = time.time()
+    for i, peer in enumerate(peers):
+        supporters[i / PEERS_PER_SUPPORTER].add_supported_peer(peer)
+    assignment = time.time() - ts
+
+    step = int(1 / RETURNING_FRACTION)
+    for peer in peers[::step]:
+        peer.set_state(DEFAULT_STATE)
+    gc.collect()
+    ts = time.time()
+    monitor._enforce_update_of_monitored_supporters()
+    evaluation = time.time() - ts
+    assert sum(s.assigned_slots() for s in supporters) == len(peers) - len(peers[::step])
+    return assignment, evaluation
+
+
+def run_benchmark():
+    print "%d supporters x %d peers" % (SUPPORTERS, PEERS_PER_SUPPORTER)
+    print "%15s %20s %20s" % ("", "assignment [ms]", "evaluation [ms]")
+    for name, classes in [("former", (LegacyMonitor, LegacySupporter, LegacyPeer)),
+                          ("current", (SupporterMonitor, MonitoredSupporter, MonitoredPeer))]:
+        assignment, evaluation = measure(*classes)
+        print "%15s %20.2f %20.2f" % (name, assignment * 1e3, evaluation * 1e3)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the activation strategies of SupporterMonitor (cf. activation).
+
+The benchmark generates inactive supporters with synthetic distributions of min_peer/max_peer
+values and asks every strategy which supporters to activate for a number of starving peers. It
+reports the share of starving peers that are covered by the selected supporters, the number of
+selected supporters and the time it took to select them:
+
+    uniform      min_peer and max_peer drawn uniformly
+    homogeneous  all supporters have the same limits
+    bimodal      few large supporters with high min_peer values, many small ones
+    adversarial  many tiny supporters with low min_peer values that exhaust the starving peers
+                 for the greedy strategy before it reaches the large supporters
+
+Run it with: python -m supporter.benchmark.bench_supporter_activation
+"""
+
+import gc
+import random
+import time
+
+from supporter.activation import BranchAndBoundActivationStrategy, GreedyActivationStrategy, \
+    LargestFirstActivationStrategy
+from supporter.monitored_subjects import MonitoredSupporter
+
+SUPPORTER_COUNTS = [10, 100, 1000]
+REPEAT = 5
+
+
+def uniform(rnd):
+    min_peer = rnd.randint(1, 20)
+    return min_peer, rnd.randint(min_peer, 50)
+
+
+def homogeneous(rnd):
+    return 5, 20
+
+
+def bimodal(rnd):
+    if rnd.random() < 0.2:
+        return rnd.randint(20, 40), rnd.randint(60, 100)
+    return rnd.randint(1, 3), rnd.randint(3, 10)
+
+
+def adversarial(rnd):
+    if rnd.random() < 0.5:
+        return 1, 1
+    min_peer = rnd.randint(30, 50)
+    return min_peer, min_peer + rnd.randint(0, 10)
+
+DISTRIBUTIONS = [uniform, homogeneous, bimodal, adversarial]
+STRATEGIES = [("greedy", GreedyActivationStrategy()), ("largest first", LargestFirstActivationStrategy()),
+              ("branch and bound", BranchAndBoundActivationStrategy())]
+
+
+def create_instance(rnd, distribution, supporter_count):
+    """@return:
+        2-tuple of the number of starving peers and a list of inactive MonitoredSupporter instances
+    """
+    supporters = []
+    for i in xrange(supporter_count):
+        min_peer, max_peer = distribution(rnd)
+        supporters.append(MonitoredSupporter(i, ('10.1.%i.%i' % (i / 256, i % 256), 1024), min_peer, max_peer))
+    # the starving peers exceed the capacity of about half of the supporters
+    starving_peers = sum([s.get_max_peer() for s in supporters]) / 2 + 1
+    return starving_peers, supporters
+
+
+def measure(strategy, starving_peers, supporters):
+    """@return:
+        3-tuple of the covered share of starving peers, the number of selected supporters and the
+        time in seconds it took to select them
+    """
+    gc.collect()
+    ts = time.time()
+    selection = strategy.select_supporters(starving_peers, supporters)
+    elapsed = time.time() - ts
+    assert sum([s.get_min_peer() for s in selection]) <= starving_peers
+    covered = min(starving_peers, sum([s.available_slots() for s in selection]))
+    return float(covered) / starving_peers, len(selection), elapsed
+
+
+def run_benchmark():
+    rnd = random.Random(4711)
+    print "%12s %12s %18s %12s %12s %12s" % ("distribution", "supporters", "strategy", "coverage [%]",
+                                             "activated", "time [ms]")
+    for distribution in DISTRIBUTIONS:
+        for supporter_count in SUPPORTER_COUNTS:
+            instances = [create_instance(rnd, distribution, supporter_count) for _ in xrange(REPEAT)]
+            for name, strategy in STRATEGIES:
+                results = [measure(strategy, *instance) for instance in instances]
+                print "%12s %12i %18s %12.2f %12.1f %12.2f" % (
+                    distribution.__name__, supporter_count, name,
+                    sum([r[0] for r in results]) / REPEAT * 100, sum([r[1] for r in results]) / float(REPEAT),
+                    max([r[2] for r in results]) * 1e3)
+    print "branch and bound exhausted its time budget of %.0f ms in %i of %i searches" % (
+        STRATEGIES[2][1].get_time_budget() * 1e3, STRATEGIES[2][1].get_exhausted_budgets(),
+        len(DISTRIBUTIONS) * len(SUPPORTER_COUNTS) * REPEAT)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the assignment of starving peers to active supporters.
+
+The benchmark activates an increasing number of supporters and measures the time it takes to
+assign 2k starving peers to them (_assign_starving_peers_to_active_supporters). The figures are
+compared against the former implementation, which kept the active supporters in a list and
+sorted it twice after every single assignment (O(m * s log s) for m peers and s supporters).
+Active supporters are kept in an indexed max-heap now, which re-keys the supporter that got the
+peer in O(log s).
+
+Run it with: python -m supporter.benchmark.bench_supporter_assignment
+"""
+
+import gc
+import time
+
+import supporter.shared as shared
+
+from supporter.monitored_subjects import MonitoredSupporter
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.state_machine import StarvingState, SupportedState
+
+SUPPORTER_COUNTS = [10, 100, 1000, 5000]
+STARVING_PEERS = 2000
+
+
+class LegacyMonitor(SupporterMonitor):
+    """SupporterMonitor with the former list of active supporters."""
+
+    def __init__(self):
+        SupporterMonitor.__init__(self)
+        self._active_supporters = []
+
+    def get_active_supporters(self):
+        return self._active_supporters
+
+    def order_active_supporters(self):
+        tmp = [(s, s.available_slots()) for s in self._active_supporters]
+        tmp.sort(lambda x, y: cmp(y[1], x[1]))
+        self._active_supporters = [s[0] for s in tmp]
+
+    def remaining_active_supporters_with_capacity(self):
+        return len(self._active_supporters) != 0 and self._active_supporters[0].available_slots() > 0
+
+    def activate_supporter(self, monitored_supporter):
+        self._active_supporters.append(monitored_supporter)
+
+    def assign_peer_to_supporter(self, monitored_peer, monitored_supporter):
+        if monitored_supporter not in self._active_supporters:
+            return
+        monitored_supporter.add_supported_peer(monitored_peer)
+        self.order_active_supporters()
+        monitored_peer.receive_msg(shared.MSG_PEER_SUPPORTED)
+        self.number_of_assignments.setdefault(monitored_peer.get_id(), 1)
+        self.number_of_assignments[monitored_peer.get_id()] += 1
+
+    def _assign_starving_peers_to_active_supporters(self):
+        starving_peers = self.filter_peers_by_state(StarvingState)
+        starving_peers = self.sort_starving_peers(starving_peers)
+        while len(starving_peers) > 0:
+            peer = starving_peers[0]
+            active_supporters = self.get_active_supporters()
+            if self.remaining_active_supporters_with_capacity():
+                self.assign_peer_to_supporter(peer, active_supporters[0])
+                starving_peers.remove(peer)
+                self.order_active_supporters()
+            else:
+                break
+
+
+def create_monitor(monitor_class, supporter_count):
+    monitor = monitor_class()
+    slots = STARVING_PEERS / supporter_count + 1
+    for i in xrange(supporter_count):
+        supporter = MonitoredSupporter(i, ('10.1.%i.%i' % (i / 256, i % 256), 1024), 1, slots)
+        monitor._monitored_supporters[supporter] = None
+        monitor.activate_supporter(supporter)
+    for i in xrange(STARVING_PEERS):
+        peer_id = 'PEER-%i' % i
+        monitor.register_monitored_peer(peer_id, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i % 60000,
+                                        shared.PEER_TYPE_LEECHER)
+        for _ in xrange(shared.PEER_REQUIRED_MSGS):
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, peer_id)
+    return monitor
+
+
+def measure(monitor_class, supporter_count):
+    monitor = create_monitor(monitor_class, supporter_count)
+    gc.collect()
+    ts = time.time()
+    monitor._assign_starving_peers_to_active_supporters()
+    elapsed = time.time() - ts
+    assert monitor.count_peers_by_state(SupportedState) == STARVING_PEERS
+    return elapsed
+
+
+def run_benchmark():
+    print "%d starving peers" % STARVING_PEERS
+    print "%12s %15s %15s" % ("supporters", "former [ms]", "heap [ms]")
+    for supporter_count in SUPPORTER_COUNTS:
+        print "%12i %15.2f %15.2f" % (supporter_count, measure(LegacyMonitor, supporter_count) * 1e3,
+                                      measure(SupporterMonitor, supporter_count) * 1e3)
+
+
+if __name__ == "__main__":
+    run_benchmark()
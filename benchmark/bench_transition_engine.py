@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""Benchmark for the per-message CPU cost of MonitoredPeer.receive_msg with different transition
+engines.
+
+The benchmark replays the same random message stream (support requests, support not needed and
+supported messages) against a set of peers, once with the decentralized StateTransitionEngine,
+which calls the transition method of the peer's current state, and once with the
+TableTransitionEngine, which looks up the successor state in transition tables indexed by the
+state and the last received message. Every run is repeated REPEATS times and the fastest one is
+reported, since a single run is dominated by noise.
+
+Run it with: python -m supporter.benchmark.bench_transition_engine
+"""
+
+import random
+import time
+
+import supporter.shared as shared
+
+from supporter.monitored_subjects import MonitoredPeer
+from supporter.state_machine import StateTransitionEngine, TableTransitionEngine
+
+PEERS = 1000
+MESSAGES = 200000
+REPEATS = 5
+MESSAGE_MIX = [shared.MSG_SUPPORT_REQUIRED] * 6 + [shared.MSG_SUPPORT_NOT_NEEDED] * 2 + \
+              [shared.MSG_PEER_SUPPORTED, shared.MSG_PEER_REGISTERED]
+
+
+def measure(engine, stream):
+    peers = [MonitoredPeer('PEER-%i' % i, '10.0.%i.%i' % (i / 256 % 256, i % 256), 1024 + i,
+                           shared.PEER_TYPE_LEECHER, transition_engine=engine) for i in xrange(PEERS)]
+    ts = time.time()
+    for peer_index, msg_type in stream:
+        peers[peer_index].receive_msg(msg_type)
+    return (time.time() - ts) / len(stream)
+
+
+def run_benchmark():
+    rnd = random.Random(4711)
+    stream = [(rnd.randrange(PEERS), rnd.choice(MESSAGE_MIX)) for _ in xrange(MESSAGES)]
+    print "%20s %20s" % ("engine", "per message [us]")
+    for name, engine in [("states", StateTransitionEngine()), ("table", TableTransitionEngine())]:
+        print "%20s %20.2f" % (name, min([measure(engine, stream) for _ in xrange(REPEATS)]) * 1e6)
+
+
+if __name__ == "__main__":
+    run_benchmark()
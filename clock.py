@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides the clock that SupporterMonitor and MonitoredPeer use for all timestamps.
+
+Timestamps are taken from a monotonic time source by default, so that steps of the wall clock
+(e.g. by NTP) do not cause peers to time out all at once. Python 2 has no time.monotonic, so
+clock_gettime(CLOCK_MONOTONIC) is called via ctypes where available. time.time is used as a
+fallback on platforms that do not provide it.
+
+A Clock can be pinned to a single timestamp for the duration of an update cycle (cf. begin_tick),
+which saves reading the time source for every peer and makes all peers of a cycle agree on the
+current time. ManualClock allows tests to fast-forward time instead of sleeping.
+"""
+
+import time
+
+# POSIX clock ID of CLOCK_MONOTONIC on Linux
+_CLOCK_MONOTONIC = 1
+
+
+def _monotonic_source():
+    """@return:
+        Callable that returns the current value of a monotonic clock in seconds. NoneType if
+        no monotonic clock is available on this platform.
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        clock_gettime = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1').clock_gettime
+        ts = timespec()
+        ts_pointer = ctypes.pointer(ts)
+
+        def monotonic():
+            clock_gettime(_CLOCK_MONOTONIC, ts_pointer)
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+
+        if clock_gettime(_CLOCK_MONOTONIC, ts_pointer) != 0:
+            return None
+        return monotonic
+    except:
+        return None
+
+# returns the current time in seconds. the value is only meaningful relative to other values
+# returned by this function (the reference point is unspecified).
+monotonic = _monotonic_source() or time.time
+
+
+class Clock(object):
+    """Provides the current time to a SupporterMonitor and its monitored peers.
+
+    A clock must not be shared between SupporterMonitor instances, since each monitor pins
+    its clock during its own update cycles.
+    """
+
+    def __init__(self, time_source=None):
+        """Initializes the clock.
+
+        @param time_source:
+            Callable that returns the current time in seconds. Defaults to monotonic.
+        """
+        self._time_source = time_source or monotonic
+        # timestamp of the update cycle that is currently in progress (NoneType if there is none)
+        self._tick_ts = None
+        # number of nested begin_tick calls that have not been ended yet
+        self._tick_depth = 0
+
+    def now(self):
+        """@return:
+            The timestamp of the current update cycle, if one is in progress. The current
+            time of the time source otherwise.
+        """
+        ts = self._tick_ts
+        if ts is None:
+            return self._time_source()
+        return ts
+
+    def read(self):
+        """@return:
+            The current time of the time source, regardless of a pinned timestamp. Unlike now,
+            this method may be called by threads that do not own the clock.
+        """
+        return self._time_source()
+
+    def begin_tick(self, ts=None):
+        """Reads the time source once and pins the clock to that timestamp until end_tick is called.
+        Ticks may be nested, in which case the timestamp of the outermost tick is kept.
+
+        @param ts:
+            Timestamp the clock shall be pinned to instead of the current time of the time
+            source (e.g. the time at which a queued message was received)
+
+        @return:
+            The timestamp of the update cycle
+        """
+        if self._tick_depth == 0:
+            self._tick_ts = self._time_source() if ts is None else ts
+        self._tick_depth += 1
+        return self._tick_ts
+
+    def end_tick(self):
+        """Releases the timestamp that was pinned by the matching call to begin_tick.
+
+        @return:
+            NoneType
+        """
+        assert self._tick_depth > 0
+        self._tick_depth -= 1
+        if self._tick_depth == 0:
+            self._tick_ts = None
+
+
+class ManualClock(Clock):
+    """Clock that only advances when told to. Allows for deterministic tests of timeouts."""
+
+    def __init__(self, start=0.0):
+        """Initializes the clock.
+
+        @param start:
+            Initial time in seconds
+        """
+        Clock.__init__(self, self._get_time)
+        self._time = float(start)
+
+    def _get_time(self):
+        return self._time
+
+    def advance(self, seconds):
+        """Moves the clock forward by the given number of seconds.
+
+        @return:
+            NoneType
+        """
+        assert seconds >= 0
+        self._time += seconds
+
+# used by monitored peers that are not managed by a SupporterMonitor
+DEFAULT_CLOCK = Clock()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides the immutable snapshots of the state of a SupporterMonitor.
+
+The monitor publishes a MonitorSnapshot at the end of every update cycle (cf.
+SupporterMonitor.get_snapshot). A snapshot is never modified afterwards, so readers (status
+pages) may keep and render a snapshot at their own pace without holding the lock of the monitor.
+
+The monitor keeps one PeerRecord per peer and only rebuilds the records of peers that changed
+during the cycle. The records of a snapshot are stored in fixed-size chunks (cf. PeerRecords),
+and the snapshot shares all chunks without changed records with the previous snapshot, so a
+snapshot is published without copying the records of all peers.
+"""
+
+from collections import namedtuple
+from itertools import chain, ifilter
+
+# state of a monitored peer at the time of the snapshot:
+#   id, ip, port: identity and address of the peer
+#   state: name of the state of the peer (e.g. 'Starving', cf. state_machine.State.__str__)
+#   last_received_msg: type of the last message received from the peer
+#   support_requests: number of support requests during the current admission cycle
+#   supporter_id: ID of the supporter the peer is assigned to (NoneType if it is not assigned)
+PeerRecord = namedtuple('PeerRecord', ['id', 'ip', 'port', 'state', 'last_received_msg', 'support_requests',
+                                       'supporter_id'])
+# slot usage of a monitored supporter at the time of the snapshot
+SupporterRecord = namedtuple('SupporterRecord', ['id', 'addr', 'min_peer', 'max_peer', 'assigned_slots',
+                                                 'available_slots', 'active'])
+# number of monitored peers per state
+StateCounts = namedtuple('StateCounts', ['default', 'watched', 'starving', 'supported'])
+# state of a SupporterMonitor at the end of an update cycle:
+#   version: increases by one with every update cycle (0 before the first update cycle)
+#   created: wall clock time at which the snapshot was taken
+#   peers: PeerRecords instance with the records of all peers in the order of their registration
+#   supporters: tuple of SupporterRecord instances in the order of their registration
+#   state_counts: StateCounts instance
+#   rpcs_per_cycle, freed_supporters_per_cycle, migrated_peers_per_cycle: figures of the update
+#   cycle (cf. the resp. getters of SupporterMonitor)
+MonitorSnapshot = namedtuple('MonitorSnapshot', ['version', 'created', 'peers', 'supporters', 'state_counts',
+                                                 'rpcs_per_cycle', 'freed_supporters_per_cycle',
+                                                 'migrated_peers_per_cycle'])
+
+
+class PeerRecords(object):
+    """Immutable sequence of the PeerRecord instances of a snapshot. The records are stored in a
+    tuple of chunks, each of which is a tuple of SNAPSHOT_CHUNK_SIZE slots. Chunks are never
+    modified, so a snapshot shares unchanged chunks with the previous one. Slots of peers that
+    were unregistered (or not registered yet) hold NoneType and are skipped upon iteration.
+    """
+
+    __slots__ = ('_chunks', '_length')
+
+    def __init__(self, chunks=(), length=0):
+        """@param chunks:
+            Tuple of chunks (tuples of PeerRecord instances or NoneType)
+        @param length:
+            Number of PeerRecord instances in the chunks
+        """
+        self._chunks = chunks
+        self._length = length
+
+    def get_chunks(self):
+        """@return:
+            Tuple of the chunks of this sequence
+        """
+        return self._chunks
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        # records are non-empty tuples, so only unused slots are filtered
+        return ifilter(None, chain.from_iterable(self._chunks))
+
+
+def empty_snapshot(created):
+    """@param created:
+        Wall clock time at which the monitor was created
+
+    @return:
+        MonitorSnapshot instance (version 0) of a monitor without peers and supporters
+    """
+    return MonitorSnapshot(0, created, PeerRecords(), (), StateCounts(0, 0, 0, 0), 0, 0, 0)
@@ -4,9 +4,10 @@ __author__ = 'Markus Guenther (markus.guenther@gmail.com)'
 
 """This module provides abstractions for all types of monitorable participants (subjects) in an overlay."""
 
-import time
+from collections import deque, namedtuple, OrderedDict
 
-from supporter.state_machine import DefaultState, State, StarvingState
+from supporter.clock import DEFAULT_CLOCK
+from supporter.state_machine import DefaultState, State, DEFAULT_STATE, STARVING_STATE, DEFAULT_TRANSITION_ENGINE
 from supporter.shared import *
 
 
@@ -14,42 +15,59 @@ class MonitoredPeer(object):
     """The MonitoredPeer class represents the local state of a peer as seen by the SupporterMonitor.
     It handles incoming messages and triggers state transitions as appropriate.
 
-    MonitoredPeer keeps track of the last PEER_REQUIRED_MSGS that were forwarded from a
-    SupporterMonitor instance to it (sliding window over all received messages)."""
+    MonitoredPeer keeps track of the last PEER_REQUIRED_MSGS (or the given number of required
+    messages) that were forwarded from a SupporterMonitor instance to it (sliding window over all
+    received messages)."""
 
-    def __init__(self, peer_id, ip, port, peer_type, is_alive_timeout=None, peer_timeout=None):
+    # a tracker monitors a large number of peers, so instances do not carry a __dict__
+    __slots__ = ('_id', '_ip', '_port', '_peer_type', '_state', '_state_listener', '_last_received_msg',
+                 '_ts_last_received_msg', '_is_alive_timeout', '_peer_timeout', '_timeout_timer',
+                 '_ts_list', '_support_requests', '_transition_engine', '_required_msgs', '_clock',
+                 '_key', '_hash')
+
+    def __init__(self, peer_id, ip, port, peer_type, is_alive_timeout=None, peer_timeout=None,
+                 transition_engine=None, required_msgs=None, clock=None):
+        # provides all timestamps of the peer (cf. clock.Clock)
+        self._clock = clock or DEFAULT_CLOCK
         self._last_received_msg = None
         self._ts_last_received_msg = None  # there is a difference between the request message window
         self._is_alive_timeout = is_alive_timeout or IS_ALIVE_TIMEOUT_BOUND
         self._peer_timeout = peer_timeout or PEER_TIMEOUT_BOUND
         # and this one here! (this is set for ALL message types)
-        self._state = DefaultState(self)
+        self._state_listener = None
+        self._state = DEFAULT_STATE
+        # performs the state transitions (cf. state_machine.StateTransitionEngine)
+        self._transition_engine = transition_engine or DEFAULT_TRANSITION_ENGINE
         self._timeout_timer = None
+        # number of support requests that have to be received within the approval time in order
+        # to transition to the STARVING state (size of the sliding window)
+        self._required_msgs = required_msgs or PEER_REQUIRED_MSGS
+        self._ts_list = deque(maxlen=self._required_msgs)
         self.reset_support_cycle()
         # assign given parameters using class methods (they perform further checks on validity)
         self._set_id(peer_id)
         self._set_ip(ip)
         self._set_port(port)
         self.set_peer_type(peer_type)
-        self.msg_handler = {
-            MSG_PEER_SUPPORTED:     self.received_peer_supported_message,
-            MSG_SUPPORT_NOT_NEEDED: self.received_support_not_needed_message,
-            MSG_SUPPORT_REQUIRED:   self.received_support_required_message,
-            MSG_PEER_REGISTERED:    self.received_peer_registered_message}
+        # the identity of a peer does not change after construction, so its key and hash are
+        # computed only once (peers are compared and hashed on every container operation)
+        self._key = (self._id, self._ip, self._port)
+        self._hash = hash(self._key)
 
     def __hash__(self):
         """The hash of a MonitoredPeer is based on the peer's ID and its address. The implementation
         utilizes the hash function on Python's tuple data type to generate the hash value for
-        a MonitoredPeer object.
+        a MonitoredPeer object. The value is computed once upon construction.
 
         @return:
             Hash value based on the 3-tuple (ID, IP, Port)
         """
-        return hash((self._id, self._ip, self._port))
+        return self._hash
 
     def __eq__(self, other):
-        """Equality test on two MonitoredPeer instances. The test is based on the comparison of
-        the objects hash values and therefore solely relies on the 3-tuple (ID, IP, Port).
+        """Equality test on two MonitoredPeer instances. The test solely relies on the
+        3-tuple (ID, IP, Port). Instances are always equal to themselves, in which case the
+        tuples are not compared at all.
 
         @param other:
             Another instance of MonitoredPeer to which this instance shall be compared to
@@ -57,8 +75,13 @@ class MonitoredPeer(object):
         @return:
             Boolean value indicating whether two instances represent the same state of information.
         """
+        if self is other:
+            return True
         assert isinstance(other, MonitoredPeer)
-        return self.__hash__() == other.__hash__()
+        return self._hash == other._hash and self._key == other._key
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def get_ts_last_message(self):
         """@return:
@@ -89,7 +112,21 @@ class MonitoredPeer(object):
         """
         if len(self._ts_list) == 0:
             return None
-        return self._ts_list[len(self._ts_list) - 1]
+        return self._ts_list[-1]
+
+    def get_required_msgs(self):
+        """@return:
+            The number of support requests that have to be received within the approval time
+            in order to transition to the STARVING state (size of the sliding window)
+        """
+        return self._required_msgs
+
+    def get_status_approval_time(self):
+        """@return:
+            The time interval in seconds in which the required number of support requests
+            have to be received in order to transition to the STARVING state
+        """
+        return self._required_msgs * PEER_REQUEST_TIME
 
     def get_number_of_support_requests(self):
         """@return:
@@ -114,7 +151,7 @@ class MonitoredPeer(object):
         @return:
             NoneType
         """
-        self._ts_list = []
+        self._ts_list.clear()
         self._support_requests = 0
 
     def _set_id(self, peer_id):
@@ -170,6 +207,13 @@ class MonitoredPeer(object):
         """
         return self._port
 
+    def get_address_tuple(self):
+        """@return:
+            3-tuple of the form (ID, IP, Port), which identifies the associated peer in
+            supportee lists
+        """
+        return self._key
+
     def set_peer_type(self, peer_type):
         """Sets the peer type.
 
@@ -201,7 +245,25 @@ class MonitoredPeer(object):
             NoneType
         """
         assert isinstance(state, State)
+        previous_state = self._state
         self._state = state
+        if self._state_listener is not None and previous_state.__class__ is not state.__class__:
+            self._state_listener.peer_state_changed(self, previous_state, state)
+
+    def set_state_listener(self, listener):
+        """Sets the listener that gets notified whenever the MonitoredPeer transitions into
+        a state of a different class or its next deadline (cf. get_next_deadline) changes.
+        The listener has to implement the methods
+        peer_state_changed(monitored_peer, previous_state, new_state) and
+        peer_deadline_changed(monitored_peer, deadline).
+
+        @param listener:
+            The listener to notify on state changes or NoneType to detach the current listener
+
+        @return:
+            NoneType
+        """
+        self._state_listener = listener
 
     def get_state(self):
         """@return:
@@ -230,7 +292,7 @@ class MonitoredPeer(object):
         """
         if self.timeout_timer_stopped():
             return False
-        return (time.time() - self._timeout_timer) >= self._peer_timeout
+        return (self._clock.now() - self._timeout_timer) >= self._peer_timeout
 
     def peer_is_alive(self):
         """Checks if the associated MonitoredPeer is considered as being alive or not.
@@ -243,12 +305,42 @@ class MonitoredPeer(object):
         """
 
         if self.get_ts_last_request() is not None:
-            return (time.time() - self.get_ts_last_request()) < self._is_alive_timeout
+            return (self._clock.now() - self.get_ts_last_request()) < self._is_alive_timeout
         else:
             # if last_request_ts is NoneType, then the peer was just added to the monitor
             # and we have to wait a bit until it actually has send its first message
             return True
 
+    def get_next_deadline(self):
+        """Determines the earliest point in time at which the associated peer may change its state
+        or has to be removed without receiving another message. Until then, asynchronous state
+        updates can skip this peer. Deadlines are derived from PEER_REMOVAL_TIME, PEER_RESET_TIME,
+        the is-alive timeout and the peer timeout. Only the removal applies to peers in DEFAULT
+        state, since they do not change their state on their own.
+
+        @return:
+            Timestamp of the next deadline. NoneType if no message was received so far.
+        """
+        if self._ts_last_received_msg is None:
+            return None
+        deadline = self._ts_last_received_msg + PEER_REMOVAL_TIME
+        if not isinstance(self._state, DefaultState):
+            ts_last_request = self.get_ts_last_request()
+            if ts_last_request is not None:
+                deadline = min(deadline, ts_last_request + min(self._is_alive_timeout, PEER_RESET_TIME))
+            if self._timeout_timer is not None:
+                deadline = min(deadline, self._timeout_timer + self._peer_timeout)
+        return deadline
+
+    def trigger_transition(self):
+        """Triggers the transition of the current state using the transition engine of the
+        MonitoredPeer instance.
+
+        @return:
+            NoneType
+        """
+        self._transition_engine.transition(self)
+
     def receive_msg(self, msg_type):
         """Handler method which gets called whenever a message from a monitored peer was received.
         The method sets the internal state accordingly, calls the appropriate specific message
@@ -266,9 +358,11 @@ class MonitoredPeer(object):
         assert msg_type in [MSG_PEER_SUPPORTED, MSG_SUPPORT_NOT_NEEDED, MSG_SUPPORT_REQUIRED,
                             MSG_PEER_REGISTERED]
         self._last_received_msg = msg_type
-        self._ts_last_received_msg = time.time()
-        self.msg_handler[msg_type]()
-        self.get_state().transition()
+        self._ts_last_received_msg = self._clock.now()
+        self.msg_handler[msg_type](self)
+        self._transition_engine.transition(self)
+        if self._state_listener is not None:
+            self._state_listener.peer_deadline_changed(self, self.get_next_deadline())
 
     def support_aborted(self):
         """Resets the peers state. This may occur the supporter the peer is assigned to
@@ -277,7 +371,10 @@ class MonitoredPeer(object):
         @return:
             NoneType
         """
-        self._state = StarvingState(self)
+        self.set_state(STARVING_STATE)
+        if self._state_listener is not None:
+            # the state was changed without a message, so it has to be checked by the next update
+            self._state_listener.peer_deadline_changed(self, self._clock.now())
 
     def received_support_required_message(self):
         """Handler method for the event that the associated monitored peer sent MSG_SUPPORT_REQUIRED.
@@ -290,11 +387,9 @@ class MonitoredPeer(object):
         self.increment_support_requests()
         self.stop_timeout_timer()
 
-        self._ts_list.append(time.time())
-
-        if len(self._ts_list) > PEER_REQUIRED_MSGS:
-            # slide one step further
-            self._ts_list = self._ts_list[1:]
+        # the oldest timestamp drops out once the sliding window is full. the request is
+        # timestamped with the time at which receive_msg got it.
+        self._ts_list.append(self._ts_last_received_msg)
 
     def received_support_not_needed_message(self):
         """Handler method for the event that the associated monitored peer sent
@@ -332,7 +427,7 @@ class MonitoredPeer(object):
             NoneType
         """
         if self._timeout_timer is None:
-            self._timeout_timer = time.time()
+            self._timeout_timer = self._clock.now()
 
     def stop_timeout_timer(self):
         """Stops the timeout timer.
@@ -348,6 +443,22 @@ class MonitoredPeer(object):
         """
         return self._timeout_timer is None
 
+    # mapping: message type => handler method (shared by all instances)
+    msg_handler = {
+        MSG_PEER_SUPPORTED:     received_peer_supported_message,
+        MSG_SUPPORT_NOT_NEEDED: received_support_not_needed_message,
+        MSG_SUPPORT_REQUIRED:   received_support_required_message,
+        MSG_PEER_REGISTERED:    received_peer_registered_message}
+
+
+# describes a change of the supportee list of a MonitoredSupporter that has to be dispatched:
+#   version: sequence number of the supportee list after the change
+#   full: boolean value, indicating whether the complete list has to be sent (no delta)
+#   peers: tuple of (ID, IP, Port) tuples of all currently supported peers
+#   added: tuple of (ID, IP, Port) tuples of the peers added since the last dispatched version
+#   removed: tuple of (ID, IP, Port) tuples of the peers removed since the last dispatched version
+SupporteeListUpdate = namedtuple('SupporteeListUpdate', ['version', 'full', 'peers', 'added', 'removed'])
+
 
 class MonitoredSupporter(object):
     """The MonitoredSupporter class represents the local state of a monitored supporter as seen
@@ -365,28 +476,40 @@ class MonitoredSupporter(object):
         assert min_peer <= max_peer
         self._min_peer = min_peer
         self._max_peer = max_peer
-        self._supported_peers = []  # holds MonitoredPeer instances
+        # holds MonitoredPeer instances in the order of their assignment (keys of the dict)
+        self._supported_peers = OrderedDict()
         global supported_peers
         supported_peers = self._supported_peers
         # self._is_active = False
         self._updated = True
+        # changes of the supportee list since the last dispatched version (used for deltas)
+        self._added_peers = set()
+        self._removed_peers = set()
+        self._list_version = 0
+        self._full_update_required = True
+        # adaptive liveness probing
+        self._probe_interval = SUPPORTER_PROBE_INTERVAL_MIN
+        self._ts_next_probe = 0
+        # static attributes that identify the supporter (cf. __hash__)
+        self._key = (self._supporterId, self._addr, self._min_peer, self._max_peer)
+        self._hash = hash(self._key)
 
     def __hash__(self):
         """The hash of a MonitoredSupporter is based on the supporter's static attributes: its
         internal ID (we use the swarm-related peer ID, but any ID will do), its address in terms
         of IP address and port number, and the minimum and maximum amount of peers it can supply.
         The implementation utilizes Python's hash function on a newly constructed tuple that
-        covers all static attributes.
+        covers all static attributes. The value is computed once upon construction.
 
         @return:
             Hash value based on the 4-tuple (ID, address, min_peer, max_peer)
         """
-        return hash((self._supporterId, self._addr, self._min_peer, self._max_peer))
+        return self._hash
 
     def __eq__(self, other):
-        """Equality test on two MonitoredSupporter instances. The test is based on the comparison
-        of the objects hash values as returned by __hash__ and therefore solely relies on the
-        4-tuple (ID, address, min_peer, max_peer).
+        """Equality test on two MonitoredSupporter instances. The test solely relies on the
+        4-tuple (ID, address, min_peer, max_peer). Instances are always equal to themselves, in
+        which case the tuples are not compared at all.
 
         @param other:
             Another instance of MonitoredSupporter that shall be compared to this instance
@@ -394,8 +517,13 @@ class MonitoredSupporter(object):
         @return:
             Boolean value indicating whether two instances represent the same state of information.
         """
+        if self is other:
+            return True
         assert isinstance(other, MonitoredSupporter)
-        return self.__hash__() == other.__hash__()
+        return self._hash == other._hash and self._key == other._key
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
     def get_id(self):
         """@return:
@@ -436,7 +564,11 @@ class MonitoredSupporter(object):
         assert monitored_peer is not None
         if monitored_peer not in self._supported_peers:
             self._updated = True
-            self._supported_peers.append(monitored_peer)
+            self._supported_peers[monitored_peer] = None
+            if monitored_peer in self._removed_peers:
+                self._removed_peers.discard(monitored_peer)
+            else:
+                self._added_peers.add(monitored_peer)
 
     def cancel_support_for_all_peers(self):
         """Removes all supported peers from the supporter and resets them to STARVING state.
@@ -444,10 +576,7 @@ class MonitoredSupporter(object):
         @return:
             NoneType
         """
-        collected_peers = []
-        for mp in self._supported_peers:
-            collected_peers.append(mp)
-        for mp in collected_peers:
+        for mp in self._supported_peers.keys():
             self.remove_supported_peer(mp)
             mp.support_aborted()
 
@@ -463,8 +592,12 @@ class MonitoredSupporter(object):
         """
         assert monitored_peer is not None
         if monitored_peer in self._supported_peers:
-            self._supported_peers.remove(monitored_peer)
+            del self._supported_peers[monitored_peer]
             self._updated = True
+            if monitored_peer in self._added_peers:
+                self._added_peers.discard(monitored_peer)
+            else:
+                self._removed_peers.add(monitored_peer)
 
     def available_slots(self):
         """@return:
@@ -484,17 +617,83 @@ class MonitoredSupporter(object):
         """
         return len(self._supported_peers) - self.get_min_peer() >= 0
 
+    def request_update(self):
+        """Marks the supportee list as changed, so that the complete list gets dispatched to the
+        supporter during the next update cycle (e.g., because the last dispatch failed and the
+        supporter's view of the list is unknown).
+
+        @return:
+            NoneType
+        """
+        self._updated = True
+        self._full_update_required = True
+
     def reset_update_counter(self):
         value = self._updated
         self._updated = False
         return value
 
+    def collect_update(self):
+        """Collects the changes of the supportee list since the last call of this method and
+        assigns the next sequence number to the resulting version of the list.
+
+        @return:
+            SupporteeListUpdate instance. NoneType, if the supportee list did not change.
+        """
+        if not self.reset_update_counter():
+            return None
+        full = self._full_update_required
+        if not full and len(self._added_peers) == 0 and len(self._removed_peers) == 0:
+            return None
+        self._list_version += 1
+        update = SupporteeListUpdate(self._list_version, full,
+                                     tuple([peer.get_address_tuple() for peer in self._supported_peers]),
+                                     tuple([peer.get_address_tuple() for peer in self._added_peers]),
+                                     tuple([peer.get_address_tuple() for peer in self._removed_peers]))
+        self._added_peers.clear()
+        self._removed_peers.clear()
+        self._full_update_required = False
+        return update
+
+    def probe_due(self, ts):
+        """@param ts:
+            The current timestamp
+
+        @return:
+            Boolean value, indicating whether the supporter has to be probed for liveness
+        """
+        return ts >= self._ts_next_probe
+
+    def contact_succeeded(self, ts):
+        """Handler method for the event that the supporter responded to a call during the last
+        update cycle. Doubles the probe interval (up to SUPPORTER_PROBE_INTERVAL_MAX), so that
+        healthy supporters are contacted less frequently.
+
+        @param ts:
+            The current timestamp
+
+        @return:
+            NoneType
+        """
+        self._ts_next_probe = ts + self._probe_interval
+        self._probe_interval = min(self._probe_interval * 2, SUPPORTER_PROBE_INTERVAL_MAX)
+
+    def reset_probe_interval(self):
+        """Resets the probe interval to SUPPORTER_PROBE_INTERVAL_MIN, so that the supporter gets
+        probed during the next update cycle.
+
+        @return:
+            NoneType
+        """
+        self._probe_interval = SUPPORTER_PROBE_INTERVAL_MIN
+        self._ts_next_probe = 0
+
     def get_supported_peers(self):
         """@return:
             List of MonitoredPeers instances that are currently assigned to the associated
-            supporter.
+            supporter (in the order of their assignment).
         """
-        return self._supported_peers
+        return self._supported_peers.keys()
 
     def update_supported_peer_list(self):
         """Performs an update of the supportee list. Removes every peer that is in default state.
@@ -502,7 +701,7 @@ class MonitoredSupporter(object):
         Thus, it is not necessary to check for other states.
 
         @return:
-            NoneType
+            List of the MonitoredPeer instances that were removed
         """
         to_be_removed = []
         for peer in self.get_supported_peers():
@@ -510,4 +709,5 @@ class MonitoredSupporter(object):
                 to_be_removed.append(peer)
         for peer in to_be_removed:
             self.remove_supported_peer(peer)
-            self._updated = True
\ No newline at end of file
+            self._updated = True
+        return to_be_removed
\ No newline at end of file
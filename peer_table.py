@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides an optional columnar (struct-of-arrays) backend for monitored peers.
+
+PeerTable keeps the mutable attributes of all monitored peers (state, last received message,
+timestamps, request counters and timeout timers) in NumPy arrays with one row per peer.
+ColumnarMonitoredPeer is a MonitoredPeer whose attributes are a thin view onto a row of such a
+table, so message handling works exactly as with regular MonitoredPeer instances. The periodic
+state evaluation however is performed for all peers at once: the liveness, timeout and request
+window conditions are evaluated as vectorized masks and combined with the transition table that
+is compiled from the states in state_machine.py (cf. TableTransitionEngine). Only peers that
+actually change their state are touched afterwards.
+
+The backend requires NumPy. SupporterMonitor uses it if a PeerTable is passed to its constructor.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from supporter.clock import DEFAULT_CLOCK
+from supporter.monitored_subjects import MonitoredPeer
+from supporter.state_machine import TableTransitionEngine
+from supporter.state_machine import DEFAULT_STATE, WATCHED_STATE, STARVING_STATE, SUPPORTED_STATE
+from supporter.shared import *
+
+# codes that represent states and message types in the table
+STATES = [DEFAULT_STATE, WATCHED_STATE, STARVING_STATE, SUPPORTED_STATE]
+STATE_CODES = dict((state, code) for code, state in enumerate(STATES))
+MESSAGES = [None, MSG_PEER_SUPPORTED, MSG_SUPPORT_NOT_NEEDED, MSG_SUPPORT_REQUIRED, MSG_PEER_REGISTERED]
+MESSAGE_CODES = dict((msg_type, code) for code, msg_type in enumerate(MESSAGES))
+
+NOT_SET = float('nan')  # represents timestamps that are NoneType in MonitoredPeer
+
+
+class PeerTable(object):
+    """Stores the mutable attributes of monitored peers column-wise in NumPy arrays. Rows of
+    removed peers are reused by peers that are added later on."""
+
+    def __init__(self, capacity=1024, required_msgs=None):
+        """Initializes an empty table.
+
+        @param capacity:
+            Initial number of rows. The table grows automatically if it runs out of rows.
+        @param required_msgs:
+            Size of the sliding window over support requests (cf. MonitoredPeer). All peers in
+            the table have to use the same size. Defaults to PEER_REQUIRED_MSGS.
+        """
+        if numpy is None:
+            raise ImportError("PeerTable requires NumPy")
+        assert capacity > 0
+
+        self._required_msgs = required_msgs or PEER_REQUIRED_MSGS
+        self._status_approval_time = self._required_msgs * PEER_REQUEST_TIME
+
+        # the transition table that is evaluated for all peers at once
+        self._engine = TableTransitionEngine()
+        self._capacity = 0
+        self._free_rows = []
+        # mapping: row => ColumnarMonitoredPeer instance or NoneType if the row is unused
+        self._peers = []
+        self.in_use = None
+        self.state = None
+        self.last_msg = None
+        self.ts_last_msg = None
+        self.ts_first_request = None
+        self.ts_last_request = None
+        self.support_requests = None
+        self.timeout_timer = None
+        self.is_alive_timeout = None
+        self.peer_timeout = None
+        # sliding window over the timestamps of the last required_msgs support requests (one ring
+        # buffer per row)
+        self.window = None
+        self.window_start = None
+        self.window_length = None
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        """Grows all columns to the given number of rows.
+
+        @return:
+            NoneType
+        """
+        def column(current, dtype, default, width=None):
+            shape = capacity if width is None else (capacity, width)
+            grown = numpy.empty(shape, dtype=dtype)
+            grown.fill(default)
+            if current is not None:
+                grown[:self._capacity] = current
+            return grown
+
+        self.in_use = column(self.in_use, numpy.bool_, False)
+        self.state = column(self.state, numpy.int8, STATE_CODES[DEFAULT_STATE])
+        self.last_msg = column(self.last_msg, numpy.int8, MESSAGE_CODES[None])
+        self.ts_last_msg = column(self.ts_last_msg, numpy.float64, NOT_SET)
+        self.ts_first_request = column(self.ts_first_request, numpy.float64, NOT_SET)
+        self.ts_last_request = column(self.ts_last_request, numpy.float64, NOT_SET)
+        self.support_requests = column(self.support_requests, numpy.int32, 0)
+        self.timeout_timer = column(self.timeout_timer, numpy.float64, NOT_SET)
+        self.is_alive_timeout = column(self.is_alive_timeout, numpy.float64, IS_ALIVE_TIMEOUT_BOUND)
+        self.peer_timeout = column(self.peer_timeout, numpy.float64, PEER_TIMEOUT_BOUND)
+        self.window = column(self.window, numpy.float64, NOT_SET, self._required_msgs)
+        self.window_start = column(self.window_start, numpy.int32, 0)
+        self.window_length = column(self.window_length, numpy.int32, 0)
+        self._peers.extend([None] * (capacity - self._capacity))
+        self._free_rows.extend(reversed(xrange(self._capacity, capacity)))
+        self._capacity = capacity
+
+    def get_required_msgs(self):
+        """@return:
+            Size of the sliding window over support requests
+        """
+        return self._required_msgs
+
+    def __len__(self):
+        """@return:
+            The number of peers in the table
+        """
+        return self._capacity - len(self._free_rows)
+
+    def add_peer(self, monitored_peer):
+        """Allocates a row for the given peer. The row is initialized with default values.
+
+        @param monitored_peer:
+            ColumnarMonitoredPeer instance that stores its attributes in the allocated row
+
+        @return:
+            The allocated row
+        """
+        if len(self._free_rows) == 0:
+            self._grow(2 * self._capacity)
+        row = self._free_rows.pop()
+        self._peers[row] = monitored_peer
+        self.in_use[row] = True
+        self.state[row] = STATE_CODES[DEFAULT_STATE]
+        self.last_msg[row] = MESSAGE_CODES[None]
+        self.ts_last_msg[row] = NOT_SET
+        self.timeout_timer[row] = NOT_SET
+        self.clear_window(row)
+        return row
+
+    def remove_peer(self, monitored_peer):
+        """Releases the row of the given peer. The peer must not be used afterwards.
+
+        @param monitored_peer:
+            ColumnarMonitoredPeer instance whose row shall be released
+
+        @return:
+            NoneType
+        """
+        row = monitored_peer.get_row()
+        if self._peers[row] is monitored_peer:
+            self._peers[row] = None
+            self.in_use[row] = False
+            self._free_rows.append(row)
+
+    def clear_window(self, row):
+        """Empties the sliding window over the support requests of the given row and resets its
+        number of support requests.
+
+        @return:
+            NoneType
+        """
+        self.window_start[row] = 0
+        self.window_length[row] = 0
+        self.ts_first_request[row] = NOT_SET
+        self.ts_last_request[row] = NOT_SET
+        self.support_requests[row] = 0
+
+    def append_to_window(self, row, ts):
+        """Appends the given timestamp to the sliding window of the given row. The oldest timestamp
+        drops out of the window if it already holds required_msgs timestamps.
+
+        @return:
+            NoneType
+        """
+        start = self.window_start[row]
+        length = self.window_length[row]
+        if length < self._required_msgs:
+            self.window[row, (start + length) % self._required_msgs] = ts
+            self.window_length[row] = length + 1
+        else:
+            self.window[row, start] = ts
+            start = (start + 1) % self._required_msgs
+            self.window_start[row] = start
+        self.ts_first_request[row] = self.window[row, start]
+        self.ts_last_request[row] = ts
+
+    def update_states(self, ts=None):
+        """Performs the asynchronous state update for all peers in the table. Conditions are
+        evaluated as vectorized masks over all rows. Peers that change their state are updated
+        through their regular interface, so that state listeners get notified.
+
+        @param ts:
+            The current timestamp. Defaults to the current time of clock.DEFAULT_CLOCK.
+
+        @return:
+            List of ColumnarMonitoredPeer instances for which the last activity was reported
+            more than PEER_REMOVAL_TIME seconds ago and that have to be removed
+        """
+        ts = DEFAULT_CLOCK.now() if ts is None else ts
+        n = self._capacity
+        state = self.state
+        ts_last_request = self.ts_last_request
+        has_requests = ~numpy.isnan(ts_last_request)
+
+        old_settings = numpy.seterr(invalid='ignore')
+        try:
+            removed = self.in_use & ((ts - self.ts_last_msg) >= PEER_REMOVAL_TIME)
+            candidates = self.in_use & ~removed
+            # peers that did not send a request for PEER_RESET_TIME seconds are forced back to DEFAULT
+            reset_to_default = candidates & has_requests & ((ts - ts_last_request) > PEER_RESET_TIME)
+            candidates &= ~reset_to_default
+            successors = state.copy()
+            successors[reset_to_default] = STATE_CODES[DEFAULT_STATE]
+            resets = numpy.zeros(n, dtype=numpy.bool_)
+            uncovered = numpy.zeros(n, dtype=numpy.bool_)
+            conditions = _Conditions(self, ts)
+            for code, current_state in enumerate(STATES):
+                in_state = candidates & (state == code)
+                if not in_state.any():
+                    continue
+                names = self._engine.get_conditions(current_state)
+                covered = numpy.zeros(n, dtype=numpy.bool_)
+                for key, (successor, reset) in self._engine.get_transitions(current_state).iteritems():
+                    mask = in_state.copy()
+                    for name, value in zip(names, key if len(names) > 1 else (key,)):
+                        mask &= conditions.get(name, value)
+                    covered |= mask
+                    if successor is not None:
+                        successors[mask] = STATE_CODES[successor]
+                    if reset:
+                        resets |= mask
+                uncovered |= in_state & ~covered
+        finally:
+            numpy.seterr(**old_settings)
+
+        for row in numpy.flatnonzero((successors != state) | resets):
+            mp = self._peers[row]
+            mp.set_state(STATES[successors[row]])
+            if resets[row]:
+                mp.reset_support_cycle()
+        for row in numpy.flatnonzero(uncovered):
+            # combination of conditions the transition table does not know
+            self._peers[row].trigger_transition()
+        return [self._peers[row] for row in numpy.flatnonzero(removed)]
+
+
+class _Conditions(object):
+    """Evaluates the conditions of TableTransitionEngine for all rows of a PeerTable. Every
+    condition is evaluated at most once per update."""
+
+    def __init__(self, table, ts):
+        self._table = table
+        self._ts = ts
+        self._cache = {}
+
+    def get(self, name, value):
+        """@return:
+            Boolean array that indicates for each row whether the condition with the given
+            name has the given value
+        """
+        if name == 'last_received_msg':
+            return self._evaluate(name) == MESSAGE_CODES[value]
+        if value:
+            return self._evaluate(name)
+        return ~self._evaluate(name)
+
+    def _evaluate(self, name):
+        if name not in self._cache:
+            self._cache[name] = getattr(self, '_' + name)()
+        return self._cache[name]
+
+    def _last_received_msg(self):
+        return self._table.last_msg
+
+    def _alive(self):
+        ts_last_request = self._table.ts_last_request
+        return numpy.isnan(ts_last_request) | \
+            ((self._ts - ts_last_request) < self._table.is_alive_timeout)
+
+    def _timed_out(self):
+        timeout_timer = self._table.timeout_timer
+        return ~numpy.isnan(timeout_timer) & \
+            ((self._ts - timeout_timer) >= self._table.peer_timeout)
+
+    def _request_window_opened(self):
+        return ~numpy.isnan(self._table.ts_first_request) & \
+            (self._table.support_requests == 1)
+
+    def _request_window_approved(self):
+        ts_first_request = self._table.ts_first_request
+        return ~numpy.isnan(ts_first_request) & \
+            ((self._table.ts_last_request - ts_first_request) <= self._table._status_approval_time) & \
+            (self._table.support_requests >= self._table.get_required_msgs())
+
+
+def _column_property(column, to_python=None, to_column=None):
+    """Creates a property that maps an attribute of MonitoredPeer onto a column of the peer's row."""
+    def getter(self):
+        value = getattr(self._table, column)[self._row]
+        return to_python(value) if to_python else value
+
+    def setter(self, value):
+        getattr(self._table, column)[self._row] = to_column(value) if to_column else value
+    return property(getter, setter)
+
+
+def _timestamp_to_python(value):
+    return None if numpy.isnan(value) else float(value)
+
+
+def _timestamp_to_column(value):
+    return NOT_SET if value is None else value
+
+
+class ColumnarMonitoredPeer(MonitoredPeer):
+    """MonitoredPeer whose mutable attributes are stored in a row of a PeerTable. Static
+    attributes (ID, address, peer type) and listeners are kept in the instance."""
+
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, peer_id, ip, port, peer_type, is_alive_timeout=None, peer_timeout=None,
+                 transition_engine=None, required_msgs=None, clock=None):
+        """Allocates a row in the given table and initializes the peer.
+
+        @param table:
+            PeerTable instance that stores the attributes of the peer
+        """
+        assert required_msgs is None or required_msgs == table.get_required_msgs()
+        self._table = table
+        self._row = table.add_peer(self)
+        MonitoredPeer.__init__(self, peer_id, ip, port, peer_type, is_alive_timeout, peer_timeout,
+                               transition_engine, table.get_required_msgs(), clock)
+
+    _state = _column_property('state', lambda code: STATES[code], lambda state: STATE_CODES[state])
+    _last_received_msg = _column_property('last_msg', lambda code: MESSAGES[code],
+                                          lambda msg_type: MESSAGE_CODES[msg_type])
+    _ts_last_received_msg = _column_property('ts_last_msg', _timestamp_to_python, _timestamp_to_column)
+    _timeout_timer = _column_property('timeout_timer', _timestamp_to_python, _timestamp_to_column)
+    _support_requests = _column_property('support_requests', int)
+    _is_alive_timeout = _column_property('is_alive_timeout', float)
+    _peer_timeout = _column_property('peer_timeout', float)
+
+    def get_row(self):
+        """@return:
+            The row of the PeerTable that stores the attributes of this peer
+        """
+        return self._row
+
+    def get_ts_first_request(self):
+        """See MonitoredPeer.get_ts_first_request."""
+        return _timestamp_to_python(self._table.ts_first_request[self._row])
+
+    def get_ts_last_request(self):
+        """See MonitoredPeer.get_ts_last_request."""
+        return _timestamp_to_python(self._table.ts_last_request[self._row])
+
+    def reset_support_cycle(self):
+        """See MonitoredPeer.reset_support_cycle."""
+        self._table.clear_window(self._row)
+
+    def received_support_required_message(self):
+        """See MonitoredPeer.received_support_required_message."""
+        self.increment_support_requests()
+        self.stop_timeout_timer()
+        self._table.append_to_window(self._row, self._ts_last_received_msg)
+
+    # the handlers of MonitoredPeer.msg_handler have to be rebound to the overridden methods
+    msg_handler = dict(MonitoredPeer.msg_handler)
+    msg_handler[MSG_SUPPORT_REQUIRED] = received_support_required_message
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides an indexed max-heap, i.e. a priority queue whose items can change their
+priority or be removed in O(log n) time.
+
+SupporterMonitor keeps its active supporters in an IndexedMaxHeap keyed by their available slots,
+so that the supporter with the most available slots is found in O(1) and re-keyed in O(log s)
+after each assignment, instead of re-sorting all active supporters.
+"""
+
+
+class IndexedMaxHeap(object):
+    """Binary max-heap over hashable items. Items with equal priority are ordered by the time of
+    their insertion (first in, first out). Each item can be contained only once."""
+
+    def __init__(self):
+        # heap entries are lists of the form [priority, sequence number, item]
+        self._heap = []
+        # mapping: item => position of its entry in the heap
+        self._positions = {}
+        # increases with every insertion, breaks ties between equal priorities
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def __iter__(self):
+        """@return:
+            Iterator over all items in no particular order
+        """
+        return iter([entry[2] for entry in self._heap])
+
+    def push(self, item, priority):
+        """Inserts the given item with the given priority.
+
+        @return:
+            NoneType
+        """
+        assert item not in self._positions
+        self._sequence += 1
+        self._heap.append([priority, self._sequence, item])
+        self._positions[item] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def update(self, item, priority):
+        """Changes the priority of the given item, which must be contained in the heap.
+
+        @return:
+            NoneType
+        """
+        position = self._positions[item]
+        entry = self._heap[position]
+        if priority == entry[0]:
+            return
+        increased = priority > entry[0]
+        entry[0] = priority
+        if increased:
+            self._sift_up(position)
+        else:
+            self._sift_down(position)
+
+    def remove(self, item):
+        """Removes the given item from the heap. Raises KeyError if the item is not contained.
+
+        @return:
+            NoneType
+        """
+        position = self._positions.pop(item)
+        last = self._heap.pop()
+        if position < len(self._heap):
+            # move the last entry into the gap and restore the heap property
+            self._heap[position] = last
+            self._positions[last[2]] = position
+            self._sift_up(position)
+            self._sift_down(self._positions[last[2]])
+
+    def peek(self):
+        """@return:
+            The item with the highest priority. NoneType if the heap is empty.
+        """
+        if len(self._heap) == 0:
+            return None
+        return self._heap[0][2]
+
+    def get_priority(self, item):
+        """@return:
+            The priority of the given item, which must be contained in the heap
+        """
+        return self._heap[self._positions[item]][0]
+
+    def items(self):
+        """@return:
+            List of all items in order of decreasing priority
+        """
+        return [entry[2] for entry in sorted(self._heap, key=lambda entry: (-entry[0], entry[1]))]
+
+    def _precedes(self, a, b):
+        return a[0] > b[0] or (a[0] == b[0] and a[1] < b[1])
+
+    def _sift_up(self, position):
+        heap = self._heap
+        entry = heap[position]
+        while position > 0:
+            parent = (position - 1) >> 1
+            if not self._precedes(entry, heap[parent]):
+                break
+            heap[position] = heap[parent]
+            self._positions[heap[position][2]] = position
+            position = parent
+        heap[position] = entry
+        self._positions[entry[2]] = position
+
+    def _sift_down(self, position):
+        heap = self._heap
+        size = len(heap)
+        entry = heap[position]
+        while True:
+            child = 2 * position + 1
+            if child >= size:
+                break
+            if child + 1 < size and self._precedes(heap[child + 1], heap[child]):
+                child += 1
+            if not self._precedes(heap[child], entry):
+                break
+            heap[position] = heap[child]
+            self._positions[heap[position][2]] = position
+            position = child
+        heap[position] = entry
+        self._positions[entry[2]] = position
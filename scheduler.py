@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides a long-lived scheduler thread that executes a task at a fixed rate.
+
+Ticks are scheduled relative to the time the scheduler was started (not relative to the end of
+the previous execution), so the interval between two ticks does not drift by the execution time
+of the task. If an execution takes longer than the period, the ticks that were missed in the
+meantime are skipped and counted as overruns instead of being executed back-to-back. Ticks are
+computed on a monotonic clock, so steps of the wall clock do not affect the schedule.
+"""
+
+import logging
+import threading
+
+from supporter.clock import monotonic
+
+
+class FixedRateScheduler(object):
+    """Executes a task periodically on a single daemon thread with drift-compensated ticks."""
+
+    def __init__(self, task, period, name="FixedRateScheduler"):
+        """Initializes the scheduler. The task is not executed until start() is called.
+
+        @param task:
+            Callable that takes no arguments and is executed once per tick
+        @param period:
+            Time between two consecutive ticks in seconds
+        @param name:
+            Name of the scheduler thread
+        """
+        assert period > 0
+
+        self._logger = logging.getLogger("Tracker.FixedRateScheduler")
+        self._task = task
+        self._period = period
+        self._name = name
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        # number of executed ticks
+        self._ticks = 0
+        # number of ticks that were skipped because an execution of the task exceeded the period
+        self._overruns = 0
+
+    def start(self):
+        """Starts the scheduler thread. The first tick happens one period after this call.
+        Calling start() on a running scheduler has no effect.
+
+        @return:
+            NoneType
+        """
+        self._lock.acquire()
+        try:
+            if self.is_running():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=self._name)
+            # the scheduler must not keep the process alive once the main thread has finished
+            self._thread.setDaemon(True)
+            self._thread.start()
+        finally:
+            self._lock.release()
+
+    def stop(self, timeout=None):
+        """Stops the scheduler thread. An execution of the task that is currently in progress
+        is completed before the thread terminates.
+
+        @param timeout:
+            Time in seconds to wait for the scheduler thread to terminate. Waits until the
+            thread has terminated if set to NoneType.
+
+        @return:
+            NoneType
+        """
+        self._lock.acquire()
+        try:
+            thread = self._thread
+            self._stopped.set()
+        finally:
+            self._lock.release()
+        if thread is not None and thread is not threading.currentThread():
+            thread.join(timeout)
+
+    def is_running(self):
+        """@return:
+            True, if the scheduler thread is alive and has not been asked to stop. False otherwise.
+        """
+        return self._thread is not None and self._thread.isAlive() and not self._stopped.isSet()
+
+    def get_period(self):
+        """@return:
+            Time between two consecutive ticks in seconds
+        """
+        return self._period
+
+    def get_ticks(self):
+        """@return:
+            Number of ticks for which the task has been executed
+        """
+        return self._ticks
+
+    def get_overruns(self):
+        """@return:
+            Number of ticks that were skipped because an execution of the task took longer
+            than the period
+        """
+        return self._overruns
+
+    def _run(self):
+        """Main loop of the scheduler thread.
+
+        @return:
+            NoneType
+        """
+        next_tick = monotonic() + self._period
+        while True:
+            delay = next_tick - monotonic()
+            if delay > 0:
+                self._stopped.wait(delay)
+            if self._stopped.isSet():
+                break
+            try:
+                self._task()
+            except:
+                self._logger.exception("Scheduled task failed")
+            self._ticks += 1
+            next_tick += self._period
+            now = monotonic()
+            if now > next_tick:
+                skipped = int((now - next_tick) / self._period) + 1
+                next_tick += skipped * self._period
+                self._overruns += skipped
+                self._logger.warning("Scheduled task exceeded its period of %.3fs, skipped %i tick(s)" %
+                                     (self._period, skipped))
@@ -17,10 +17,47 @@ PEER_REQUIRED_MSGS = 4
 # requests, so it can transition to the STARVING state. the value is based on the total number
 # of required requests (for every request, we assume 1 second), and a typical RTT value which
 # is taken into account for every made request)
-PEER_STATUS_APPROVAL_TIME = PEER_REQUIRED_MSGS * (1 + 0.150)
+PEER_REQUEST_TIME = 1 + 0.150
+PEER_STATUS_APPROVAL_TIME = PEER_REQUIRED_MSGS * PEER_REQUEST_TIME
 PEER_REMOVAL_TIME = 45  # removes a monitored peer if the last activity was reported more
 # than PEER_REMOVAL_TIME seconds ago
+PEER_RESET_TIME = 10  # forces a peer back to DEFAULT state if its last support request was
+# received more than PEER_RESET_TIME seconds ago
+
+UPDATE_INTERVAL = 1  # seconds between two asynchronous state updates of the supporter monitor
 
 PEER_TYPE_SEEDER = 0
 PEER_TYPE_LEECHER = 1
-PEER_TYPES = [PEER_TYPE_SEEDER, PEER_TYPE_LEECHER]
\ No newline at end of file
+PEER_TYPES = [PEER_TYPE_SEEDER, PEER_TYPE_LEECHER]
+SUPPORTER_DISPATCH_WORKERS = 8  # number of threads that contact supporters concurrently
+SUPPORTER_CONNECT_TIMEOUT = 0.25  # seconds to establish a connection to a supporter
+SUPPORTER_READ_TIMEOUT = 0.5  # seconds to wait for the response of a supporter
+SUPPORTER_DISPATCH_DEADLINE = 0.8  # seconds after which the I/O phase of an update cycle stops
+# waiting for outstanding supporter calls (should be lower than UPDATE_INTERVAL)
+SUPPORTER_PROBE_INTERVAL_MIN = 1  # seconds between liveness probes of a supporter that was just
+# registered or that did not respond as expected
+SUPPORTER_PROBE_INTERVAL_MAX = 8  # seconds between liveness probes of a healthy supporter. the probe
+# interval doubles with every successful contact up to this bound. supporters that receive a supportee
+# list update are not probed at all, since the update call proves that they are alive.
+SUPPORTER_ACTIVATION_TIME_BUDGET = 0.05  # seconds the exact activation strategy may search for the best
+# set of supporters to activate during an update cycle, before it falls back to the best set found so far
+SUPPORTER_MIGRATION_BUDGET = 16  # max. number of supported peers that are migrated between active supporters
+# per update cycle in order to empty out and inactivate underused supporters (0 disables the consolidation)
+ACTOR_QUEUE_CAPACITY = 65536  # max. number of peer messages that may wait in the ingestion queue of an
+# ActorSupporterMonitor. producers of state-changing messages (MSG_SUPPORT_REQUIRED, MSG_SUPPORT_NOT_NEEDED)
+# wait for space while the queue is full, all other messages that arrive while the queue is full are dropped.
+ACTOR_ENQUEUE_TIMEOUT = 1.0  # max. number of seconds a producer of a state-changing message waits for space in
+# the full ingestion queue of a running ActorSupporterMonitor before the message is dropped (0 disables waiting)
+ACTOR_BATCH_SIZE = 1024  # max. number of queued peer messages the owner thread of an ActorSupporterMonitor
+# processes before it checks for due updates and submitted calls
+STATISTICS_LOG_PATH = 'supporter_statistics.log'  # default path of the statistics log of a supporter monitor
+STATISTICS_LOG_CAPACITY = 4096  # max. number of statistics records that wait for being written to disk.
+# records that are submitted while the buffer is full are dropped.
+STATISTICS_LOG_MAX_BYTES = 16 * 1024 * 1024  # size in bytes after which the statistics log is rotated
+STATISTICS_LOG_MAX_AGE = 24 * 60 * 60  # seconds after which the statistics log is rotated
+STATISTICS_LOG_BACKUP_COUNT = 5  # number of rotated statistics logs that are kept
+STATISTICS_LOG_IDLE_TIMEOUT = 5  # seconds after which an idle statistics log writer stops its thread
+STATUS_PAGE_CHUNK_ROWS = 256  # number of peers or supporters that are rendered into a single chunk of a
+# streamed status page (cf. MonitorState.iter_monitor_state_as_html)
+SNAPSHOT_CHUNK_SIZE = 64  # number of peer records per chunk of a monitor snapshot. only chunks with records of
+# peers that changed during an update cycle are copied when the snapshot of the cycle is published.
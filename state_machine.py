@@ -22,28 +22,26 @@ A peer will go from starving state to supported state if a supporter was assigne
 sending requests and dispatch a supplied request to the monitoring component if the overlay is capable of providing
 the missing chunks as required for an uninterruptible video playback."""
 
+from operator import methodcaller
+
 from supporter.shared import *
 
 
 class State(object):
     """State is the abstract base class for all states that can be assigned to a monitored
-    peer. There is a bidirectional dependency between State and MonitoredPeer, so each
-    MonitoredPeer knows its state, and each State knows the MonitoredPeer it belongs to."""
-
-    def __init__(self, monitored_peer):
-        assert monitored_peer is not None
-        self._monitored_peer = monitored_peer
+    peer. States do not hold any data, so there is exactly one instance per state class
+    (cf. DEFAULT_STATE, WATCHED_STATE, STARVING_STATE, SUPPORTED_STATE) which is shared by all
+    MonitoredPeer instances. The peer is passed to the state upon every transition."""
 
-    def get_monitored_peer(self):
-        """
-        @return: The associated MonitoredPeer object
-        """
-        return self._monitored_peer
+    __slots__ = ()
 
-    def transition(self):
+    def transition(self, monitored_peer):
         """Checks if a transition to successor states is possible from the current state
         and performs this transition. This method has to be overriden in implementing classes.
 
+        @param monitored_peer:
+            The MonitoredPeer that resides in this state
+
         @return:
             NoneType
         """
@@ -59,19 +57,17 @@ class DefaultState(State):
     further support.
     """
 
-    def __init__(self, monitored_peer):
-        State.__init__(self, monitored_peer)
+    __slots__ = ()
 
-    def transition(self):
+    def transition(self, m):
         """Checks if the MonitoredPeer can transition to the WATCHED state. See State.transition
         for further documentation.
 
         @return:
             NoneType
         """
-        m = self.get_monitored_peer()
         if m.get_ts_first_request() is not None and m.get_number_of_support_requests() == 1:
-            m.set_state(WatchedState(m))
+            m.set_state(WATCHED_STATE)
 
     def __str__(self):
         return 'Default'
@@ -83,40 +79,35 @@ class WatchedState(State):
     back to the DEFAULT state from WATCHED state.
     """
 
-    def __init__(self, monitored_peer):
-        State.__init__(self, monitored_peer)
+    __slots__ = ()
 
-    def transition(self):
+    def transition(self, m):
         """Checks if the MonitoredPeer can transition back to the DEFAULT state or forward
         to the STARVING state. The transition to the DEFAULT state happens immediately and thus
         does not rely on the peer timeout (cf. constant PEER_TIMEOUT_BOUND). For the transition
         to the STARVING state, a certain number of support requests
-        (cf. constant PEER_REQUIRED_MSGS) have to be arrived in a certain time
-        window (cf. constant PEER_STATUS_APPROVAL_TIME).
+        (cf. MonitoredPeer.get_required_msgs) have to be arrived in a certain time
+        window (cf. MonitoredPeer.get_status_approval_time).
 
         @return:
             NoneType
         """
-        m = self.get_monitored_peer()
-
         if not m.peer_is_alive():
-            m.set_state(DefaultState(m))
+            m.set_state(DEFAULT_STATE)
             m.reset_support_cycle()
         elif m.get_last_received_msg() == MSG_SUPPORT_NOT_NEEDED:
             # the transition from WATCHED -> DEFAULT is not dependent on the timeout
-            m.set_state(DefaultState(m))
+            m.set_state(DEFAULT_STATE)
         elif m.get_last_received_msg() == MSG_SUPPORT_REQUIRED:
             # this is the regular case (WATCHED -> STARVING
-            if self.support_requests_are_within_approval_interval() and self.minimum_support_requests_reached():
-                m.set_state(StarvingState(m))
+            if self.support_requests_are_within_approval_interval(m) and self.minimum_support_requests_reached(m):
+                m.set_state(STARVING_STATE)
 
-    def support_requests_are_within_approval_interval(self):
-        m = self.get_monitored_peer()
-        return (m.get_ts_last_request() - m.get_ts_first_request()) <= PEER_STATUS_APPROVAL_TIME
+    def support_requests_are_within_approval_interval(self, m):
+        return (m.get_ts_last_request() - m.get_ts_first_request()) <= m.get_status_approval_time()
 
-    def minimum_support_requests_reached(self):
-        m = self.get_monitored_peer()
-        return m.get_number_of_support_requests() >= PEER_REQUIRED_MSGS
+    def minimum_support_requests_reached(self, m):
+        return m.get_number_of_support_requests() >= m.get_required_msgs()
 
     def __str__(self):
         return 'Watched'
@@ -128,10 +119,9 @@ class StarvingState(State):
     back to the DEFAULT state from STARVING state.
     """
 
-    def __init__(self, monitored_peer):
-        State.__init__(self, monitored_peer)
+    __slots__ = ()
 
-    def transition(self):
+    def transition(self, m):
         """Checks if the associated MonitoredPeer can transition back to the DEFAULT state
         (in case the support is no longer required) or transition forward to the SUPPORTED
         state. The transition to the DEFAULT state happens immediately and thus does not
@@ -142,18 +132,17 @@ class StarvingState(State):
         @return:
             NoneType
         """
-        m = self.get_monitored_peer()
         msg_type = m.get_last_received_msg()
 
         if not m.peer_is_alive():
-            m.set_state(DefaultState(m))
+            m.set_state(DEFAULT_STATE)
             m.reset_support_cycle()
         elif msg_type == MSG_SUPPORT_NOT_NEEDED:
             # the transition from STARVING -> DEFAULT is not dependent on the timeout
-            m.set_state(DefaultState(m))
+            m.set_state(DEFAULT_STATE)
 
         if msg_type == MSG_PEER_SUPPORTED:
-            m.set_state(SupportedState(m))
+            m.set_state(SUPPORTED_STATE)
 
     def __str__(self):
         return 'Starving'
@@ -163,10 +152,9 @@ class SupportedState(State):
     """Realizes the SUPPORTED state of a MonitoredPeer as described in (Gerlach, 2010).
     """
 
-    def __init__(self, monitored_peer):
-        State.__init__(self, monitored_peer)
+    __slots__ = ()
 
-    def transition(self):
+    def transition(self, m):
         """Checks if the associated MonitoredPeer can transition back to the DEFAULT state.
         This transition occurs, if the peer does not longer rely on the support of a
         server and waited some more time after the NO SUPPORT REQUIRED message was received by
@@ -175,14 +163,318 @@ class SupportedState(State):
         @return:
             NoneType
         """
-        m = self.get_monitored_peer()
         msg_type = m.get_last_received_msg()
 
         if not m.peer_is_alive():
-            m.set_state(DefaultState(m))
+            m.set_state(DEFAULT_STATE)
             m.reset_support_cycle()
         elif msg_type == MSG_SUPPORT_NOT_NEEDED and m.peer_timed_out() or not m.peer_is_alive():
-            m.set_state(DefaultState(m))
+            m.set_state(DEFAULT_STATE)
 
     def __str__(self):
-        return 'Supported'
\ No newline at end of file
+        return 'Supported'
+
+
+# the shared state instances that get assigned to monitored peers
+DEFAULT_STATE = DefaultState()
+WATCHED_STATE = WatchedState()
+STARVING_STATE = StarvingState()
+SUPPORTED_STATE = SupportedState()
+
+
+class StateTransitionEngine(object):
+    """Triggers state transitions of monitored peers. This engine delegates every transition
+    to the State instance the peer currently resides in (see State.transition), which is the
+    decentralized approach described in the module documentation."""
+
+    def transition(self, monitored_peer):
+        """Checks if a transition to successor states is possible from the current state
+        of the given peer and performs this transition.
+
+        @param monitored_peer:
+            The MonitoredPeer for which the transition shall be performed
+
+        @return:
+            NoneType
+        """
+        monitored_peer.get_state().transition(monitored_peer)
+
+
+class TableTransitionEngine(StateTransitionEngine):
+    """Triggers state transitions of monitored peers using transition tables, which map the
+    current state, the last received message and a few conditions of a peer to its successor
+    state.
+
+    The tables are compiled from the State implementations themselves: every state is probed with
+    all relevant combinations of peer conditions (last received message, liveness, timeout,
+    request window) and the resulting successor state is recorded. The rules of a state are
+    indexed by the last received message first (if the transitions of the state depend on it at
+    all), and every sub-table only keeps the conditions that influence the transitions for that
+    message, so that only these are evaluated at runtime (e.g. the request window is only checked
+    for WATCHED peers whose last message was MSG_SUPPORT_REQUIRED). Peers in states that are
+    unknown to the table fall back to the decentralized transition of their state.
+
+    The engine mainly serves as the source of the rules for the vectorized evaluation of
+    peer_table.PeerTable. For single peers, it is about as fast as the decentralized transitions
+    of the states (cf. benchmark/bench_transition_engine.py), since most of the cost is the
+    evaluation of the conditions, which both engines restrict to the ones they need.
+    """
+
+    def __init__(self, states=None):
+        """Compiles the transition table.
+
+        @param states:
+            List of State instances for which transition rules shall be compiled. Defaults to
+            DEFAULT_STATE, WATCHED_STATE, STARVING_STATE and SUPPORTED_STATE.
+        """
+        # mapping: State instance => (rules by last received message or NoneType, rule that applies
+        # regardless of the message or NoneType, condition names, flat transition table). a rule is
+        # a 2-tuple of the form (key function, {key: outcome}), or (NoneType, outcome) if the
+        # outcome does not depend on any further condition. an outcome is a 2-tuple of the form
+        # (successor state or NoneType, reset support cycle)
+        self._rules = {}
+        for state in states or [DEFAULT_STATE, WATCHED_STATE, STARVING_STATE, SUPPORTED_STATE]:
+            self._rules[state] = _compile_rules(state)
+
+    def get_conditions(self, state):
+        """@param state:
+            State instance for which the transition rules were compiled
+
+        @return:
+            Tuple of condition names the transitions from the given state depend on
+        """
+        return self._rules[state][2]
+
+    def get_transitions(self, state):
+        """@param state:
+            State instance for which the transition rules were compiled
+
+        @return:
+            Dictionary that maps the values of the conditions returned by get_conditions (a
+            tuple, or the value itself if there is only one condition) to a 2-tuple of the
+            form (successor state or NoneType, boolean value indicating whether the support
+            cycle is reset)
+        """
+        return self._rules[state][3]
+
+    def transition(self, monitored_peer):
+        """Looks up the successor state of the given peer in the transition table and performs
+        the transition. See StateTransitionEngine.transition for further documentation.
+
+        @param monitored_peer:
+            The MonitoredPeer for which the transition shall be performed
+
+        @return:
+            NoneType
+        """
+        state = monitored_peer.get_state()
+        rules = self._rules.get(state)
+        if rules is None:
+            state.transition(monitored_peer)
+            return
+        rule = rules[1]
+        if rule is None:
+            rule = rules[0].get(monitored_peer.get_last_received_msg())
+            if rule is None:
+                # message that did not occur while probing the state
+                state.transition(monitored_peer)
+                return
+        key_function, outcome = rule
+        if key_function is not None:
+            outcome = outcome.get(key_function(monitored_peer))
+            if outcome is None:
+                # combination of conditions that did not occur while probing the state
+                state.transition(monitored_peer)
+                return
+        if outcome[0] is not None:
+            monitored_peer.set_state(outcome[0])
+        if outcome[1]:
+            monitored_peer.reset_support_cycle()
+
+
+def _request_window_opened(m):
+    return m.get_ts_first_request() is not None and m.get_number_of_support_requests() == 1
+
+
+def _request_window_approved(m):
+    ts_first_request = m.get_ts_first_request()
+    return (ts_first_request is not None and
+            (m.get_ts_last_request() - ts_first_request) <= m.get_status_approval_time() and
+            m.get_number_of_support_requests() >= m.get_required_msgs())
+
+
+# conditions of a peer that state transitions may depend on (name, evaluation function)
+_CONDITIONS = (('last_received_msg', methodcaller('get_last_received_msg')),
+               ('alive', methodcaller('peer_is_alive')),
+               ('timed_out', methodcaller('peer_timed_out')),
+               ('request_window_opened', _request_window_opened),
+               ('request_window_approved', _request_window_approved))
+
+
+class _ProbePeer(object):
+    """Stands in for a MonitoredPeer with fixed conditions while compiling transition tables.
+    Records the successor state and whether the support cycle was reset."""
+
+    def __init__(self, state, ts_first_request, ts_last_request, support_requests, last_received_msg,
+                 alive, timed_out):
+        self.state = state
+        self.successor = None
+        self.reset = False
+        self._ts_first_request = ts_first_request
+        self._ts_last_request = ts_last_request
+        self._support_requests = support_requests
+        self._last_received_msg = last_received_msg
+        self._alive = alive
+        self._timed_out = timed_out
+
+    def get_state(self):
+        return self.state
+
+    def set_state(self, state):
+        self.successor = state
+
+    def reset_support_cycle(self):
+        self.reset = True
+
+    def get_ts_first_request(self):
+        return self._ts_first_request
+
+    def get_ts_last_request(self):
+        return self._ts_last_request
+
+    def get_number_of_support_requests(self):
+        return self._support_requests
+
+    def get_required_msgs(self):
+        return PEER_REQUIRED_MSGS
+
+    def get_status_approval_time(self):
+        return PEER_STATUS_APPROVAL_TIME
+
+    def get_last_received_msg(self):
+        return self._last_received_msg
+
+    def peer_is_alive(self):
+        return self._alive
+
+    def peer_timed_out(self):
+        return self._timed_out
+
+
+def _probe_peers(state):
+    """Generates probe peers covering all combinations of peer conditions for the given state."""
+    for ts_first_request, ts_last_request in [(None, None), (0.0, 0.0), (0.0, PEER_STATUS_APPROVAL_TIME + 1)]:
+        for support_requests in set([0, 1, PEER_REQUIRED_MSGS - 1, PEER_REQUIRED_MSGS]):
+            for msg_type in [None, MSG_PEER_SUPPORTED, MSG_SUPPORT_NOT_NEEDED, MSG_SUPPORT_REQUIRED,
+                             MSG_PEER_REGISTERED]:
+                for alive in [True, False]:
+                    for timed_out in [True, False]:
+                        yield _ProbePeer(state, ts_first_request, ts_last_request, support_requests,
+                                         msg_type, alive, timed_out)
+
+
+def _project(table, indices):
+    """Projects the keys of the given transition table onto the conditions with the given indices.
+
+    @return:
+        The projected table. NoneType if the outcome of a transition is not determined by these
+        conditions alone.
+    """
+    projected = {}
+    for key, outcome in table.iteritems():
+        if projected.setdefault(tuple([key[i] for i in indices]), outcome) != outcome:
+            return None
+    return projected
+
+
+def _reduce(table, indices):
+    """Drops the conditions that do not influence the outcome of a transition from the keys of
+    the given transition table.
+
+    @param indices:
+        Indices of the conditions in the keys of the table that shall be considered
+
+    @return:
+        2-tuple of the form (indices of the relevant conditions, projected transition table)
+    """
+    relevant = list(indices)
+    for index in indices:
+        remaining = [i for i in relevant if i != index]
+        if _project(table, remaining) is not None:
+            relevant = remaining
+    return relevant, _project(table, relevant)
+
+
+def _key_function(indices):
+    """@return:
+        Function that evaluates the conditions with the given indices for a peer. Single
+        conditions are not wrapped into a tuple.
+    """
+    conditions = [_CONDITIONS[i][1] for i in indices]
+    if len(conditions) == 1:
+        return conditions[0]
+    elif len(conditions) == 2:
+        c0, c1 = conditions
+        return lambda m: (c0(m), c1(m))
+    elif len(conditions) == 3:
+        c0, c1, c2 = conditions
+        return lambda m: (c0(m), c1(m), c2(m))
+    return lambda m: tuple([condition(m) for condition in conditions])
+
+
+def _compile_rule(table, indices):
+    """Compiles a rule from the given transition table that only evaluates the conditions which
+    influence the outcome.
+
+    @return:
+        2-tuple of the form (key function, transition table), or (NoneType, outcome) if the
+        outcome does not depend on any of the conditions
+    """
+    relevant, table = _reduce(table, indices)
+    if not relevant:
+        return None, table[()]
+    if len(relevant) == 1:
+        table = dict((key[0], outcome) for key, outcome in table.iteritems())
+    return _key_function(relevant), table
+
+
+def _compile_rules(state):
+    """Compiles the transition rules of the given state by probing it.
+
+    @return:
+        4-tuple of the form (rules by last received message or NoneType, rule that applies
+        regardless of the message or NoneType, condition names, flat transition table)
+    """
+    table = {}
+    for probe in _probe_peers(state):
+        try:
+            state.transition(probe)
+        except TypeError:
+            # the conditions of this probe are inconsistent (e.g. a request window without a
+            # first request) and do not occur at runtime
+            continue
+        key = tuple([condition(probe) for _, condition in _CONDITIONS])
+        outcome = (probe.successor, probe.reset)
+        assert table.setdefault(key, outcome) == outcome, \
+            "transitions of %s depend on conditions that are not covered by the table" % state
+
+    # the flat table (cf. get_transitions) drops conditions that do not influence the outcome
+    relevant, flat_table = _reduce(table, range(len(_CONDITIONS)))
+    if len(relevant) == 1:
+        # single conditions are not wrapped into a tuple
+        flat_table = dict((key[0], outcome) for key, outcome in flat_table.iteritems())
+    conditions = tuple([_CONDITIONS[i][0] for i in relevant])
+
+    # index the rules by the last received message (the first condition) if it matters at all
+    if 0 not in relevant:
+        return None, _compile_rule(table, range(1, len(_CONDITIONS))), conditions, flat_table
+    by_msg = {}
+    for key, outcome in table.iteritems():
+        by_msg.setdefault(key[0], {})[key] = outcome
+    for msg_type, msg_table in by_msg.items():
+        by_msg[msg_type] = _compile_rule(msg_table, range(1, len(_CONDITIONS)))
+    return by_msg, None, conditions, flat_table
+
+
+# the engine that is used by monitored peers if no other engine is configured
+DEFAULT_TRANSITION_ENGINE = StateTransitionEngine()
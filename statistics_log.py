@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides the writer of the statistics log of a SupporterMonitor.
+
+The monitor hands the snapshot it publishes at the end of every update cycle (cf.
+SupporterMonitor.get_snapshot) to a StatisticsLogWriter via MonitorState.snapshot. The writer
+only extracts the figures of the snapshot into a record and appends it to a bounded buffer, so
+no disk I/O happens while the monitor holds its lock. A background thread writes the buffered
+records to the log file and rotates the file once it exceeds a size or an age. If the disk
+stalls for so long that the buffer fills up, further records are dropped (cf.
+get_dropped_records) instead of blocking the monitor.
+
+Records are written as tab-separated text lines by default. Long-running deployments may use a
+compact binary format instead, in which every record is a fixed-width struct (cf. BINARY_RECORD
+and read_binary_records). A record consists of the creation time of the snapshot (wall clock),
+the number of peers in DEFAULT, WATCHED, STARVING and SUPPORTED state, the number of RPCs, freed
+supporters and migrated peers of the update cycle.
+
+The background thread is started with the first record and exits once it has been idle for
+STATISTICS_LOG_IDLE_TIMEOUT seconds, so writers of monitors that are no longer updated do not
+keep a thread alive. SupporterMonitor.close closes the writer and waits for the thread to write
+the remaining records.
+"""
+
+import logging
+import os
+import struct
+import threading
+
+from collections import deque
+
+from supporter.clock import Clock, monotonic
+from supporter.shared import *
+
+# binary record: creation time (double), 4 peer counts, RPCs, freed supporters and migrated peers
+# (unsigned 32 bit integers), little endian without padding (36 bytes)
+BINARY_RECORD = struct.Struct('<d7I')
+
+
+def read_binary_records(path):
+    """Reads a statistics log that was written in the binary format.
+
+    @param path:
+        Path of the log file
+
+    @return:
+        Iterator over 8-tuples (cf. module documentation)
+    """
+    with open(path, 'rb') as log:
+        while True:
+            data = log.read(BINARY_RECORD.size)
+            if len(data) < BINARY_RECORD.size:
+                return
+            yield BINARY_RECORD.unpack(data)
+
+
+def _format_text(record):
+    return "%1.2f\t%i\t%i\t%i\t%i\t%i\t%i\t%i\n" % record
+
+
+class StatisticsLogWriter(object):
+    """Writes the statistics of a SupporterMonitor to a rotating log file on a background thread."""
+
+    def __init__(self, path=None, capacity=None, max_bytes=None, max_age=None, backup_count=None, binary=False,
+                 clock=None):
+        """Initializes the writer. The log file is created (or truncated) when the first record
+        is written.
+
+        @param path:
+            Path of the log file (defaults to STATISTICS_LOG_PATH)
+        @param capacity:
+            Max. number of records that wait for being written (defaults to STATISTICS_LOG_CAPACITY)
+        @param max_bytes:
+            Size in bytes after which the log file is rotated (defaults to STATISTICS_LOG_MAX_BYTES,
+            0 disables the size-based rotation)
+        @param max_age:
+            Time in seconds after which the log file is rotated (defaults to STATISTICS_LOG_MAX_AGE,
+            0 disables the time-based rotation)
+        @param backup_count:
+            Number of rotated log files that are kept as <path>.1 (newest) to <path>.<backup_count>
+            (defaults to STATISTICS_LOG_BACKUP_COUNT). If set to 0, the log file is truncated upon
+            rotation.
+        @param binary:
+            Writes records in the binary format if set to True (cf. BINARY_RECORD)
+        @param clock:
+            clock.Clock instance that provides the time for the time-based rotation
+        """
+        self._logger = logging.getLogger("Tracker.StatisticsLogWriter")
+        self._path = path or STATISTICS_LOG_PATH
+        self._capacity = capacity or STATISTICS_LOG_CAPACITY
+        self._max_bytes = STATISTICS_LOG_MAX_BYTES if max_bytes is None else max_bytes
+        self._max_age = STATISTICS_LOG_MAX_AGE if max_age is None else max_age
+        self._backup_count = STATISTICS_LOG_BACKUP_COUNT if backup_count is None else backup_count
+        self._encode = binary and (lambda record: BINARY_RECORD.pack(*record)) or _format_text
+        self._clock = clock or Clock()
+        # records that have not been taken by the writer thread yet. guarded by the condition,
+        # which is only held for appending and taking records, never during disk I/O.
+        self._records = deque()
+        self._condition = threading.Condition()
+        # number of submitted records that have not been written (or discarded) yet
+        self._pending = 0
+        self._thread = None
+        self._closed = False
+        # the log file and its state are only accessed by the writer thread (or by close() if
+        # no writer thread is running)
+        self._file = None
+        self._file_size = 0
+        self._file_opened_at = None
+        self._truncate = True
+        self._written_records = 0
+        self._dropped_records = 0
+        self._rotations = 0
+
+    def get_path(self):
+        """@return:
+            The path of the log file
+        """
+        return self._path
+
+    def get_written_records(self):
+        """@return:
+            The number of records that were written to the log
+        """
+        return self._written_records
+
+    def get_dropped_records(self):
+        """@return:
+            The number of records that were dropped because the buffer was full, the writer was
+            closed or the log file could not be written
+        """
+        return self._dropped_records
+
+    def get_rotations(self):
+        """@return:
+            The number of rotations of the log file
+        """
+        return self._rotations
+
+    def submit(self, monitor_snapshot):
+        """Queues the figures of the given snapshot for being written to the log. This method does
+        not perform any disk I/O and returns immediately.
+
+        @param monitor_snapshot:
+            monitor_snapshot.MonitorSnapshot instance
+
+        @return:
+            True, if the record was queued. False, if it was dropped.
+        """
+        counts = monitor_snapshot.state_counts
+        record = (monitor_snapshot.created, counts.default, counts.watched, counts.starving, counts.supported,
+                  monitor_snapshot.rpcs_per_cycle, monitor_snapshot.freed_supporters_per_cycle,
+                  monitor_snapshot.migrated_peers_per_cycle)
+        self._condition.acquire()
+        try:
+            if self._closed or len(self._records) >= self._capacity:
+                self._dropped_records += 1
+                return False
+            self._records.append(record)
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="StatisticsLogWriter")
+                self._thread.daemon = True
+                self._thread.start()
+            else:
+                self._condition.notifyAll()
+            return True
+        finally:
+            self._condition.release()
+
+    def flush(self, timeout=None):
+        """Waits until all records that were submitted up to now have been written.
+
+        @param timeout:
+            Time in seconds to wait at most. Waits until all records have been written if set
+            to NoneType.
+
+        @return:
+            True, if all records have been written. False, if the timeout expired.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        self._condition.acquire()
+        try:
+            while self._pending > 0:
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+            return True
+        finally:
+            self._condition.release()
+
+    def close(self, timeout=None):
+        """Writes all queued records and closes the log file. Records that are submitted
+        afterwards are dropped.
+
+        @param timeout:
+            Time in seconds to wait for the queued records to be written. Does not wait at all if
+            set to 0 (the writer thread closes the log file once it is done) and waits until all
+            records have been written if set to NoneType.
+
+        @return:
+            NoneType
+        """
+        self._condition.acquire()
+        try:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is None:
+                self._close_file()
+            else:
+                self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        if thread is not None and timeout != 0:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._condition.acquire()
+            try:
+                if len(self._records) == 0 and not self._closed:
+                    self._condition.wait(STATISTICS_LOG_IDLE_TIMEOUT)
+                if len(self._records) == 0:
+                    # idle or closed. the next submit starts a new thread.
+                    self._thread = None
+                    if self._closed:
+                        self._close_file()
+                    return
+                records, self._records = self._records, deque()
+            finally:
+                self._condition.release()
+
+            written = True
+            try:
+                self._write_records(records)
+            except:
+                self._logger.exception("Writing %i records to the statistics log %s failed" %
+                                       (len(records), self._path))
+                written = False
+                self._close_file()
+
+            self._condition.acquire()
+            try:
+                if written:
+                    self._written_records += len(records)
+                else:
+                    self._dropped_records += len(records)
+                self._pending -= len(records)
+                self._condition.notifyAll()
+            finally:
+                self._condition.release()
+
+    def _write_records(self, records):
+        """Writes the given records to the log file and rotates it if necessary. Called by the
+        writer thread only.
+
+        @return:
+            NoneType
+        """
+        if self._file is not None and self._rotation_due():
+            self._rotate()
+        if self._file is None:
+            self._open_file()
+        data = ''.join([self._encode(record) for record in records])
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+
+    def _rotation_due(self):
+        if self._max_bytes > 0 and self._file_size >= self._max_bytes:
+            return True
+        return self._max_age > 0 and self._clock.read() - self._file_opened_at >= self._max_age
+
+    def _open_file(self):
+        """Opens the log file. It is truncated when it is opened for the first time or after a
+        rotation and appended to otherwise (e.g. after a write error).
+
+        @return:
+            NoneType
+        """
+        self._file = open(self._path, self._truncate and 'wb' or 'ab')
+        self._truncate = False
+        self._file_size = os.fstat(self._file.fileno()).st_size
+        self._file_opened_at = self._clock.read()
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except:
+                self._logger.exception("Closing the statistics log %s failed" % self._path)
+            self._file = None
+
+    def _rotate(self):
+        """Closes the log file and renames it to <path>.1, after renaming the existing backups
+        <path>.i to <path>.(i+1). The oldest backup is removed.
+
+        @return:
+            NoneType
+        """
+        self._close_file()
+        if self._backup_count > 0:
+            for i in xrange(self._backup_count - 1, 0, -1):
+                source = "%s.%i" % (self._path, i)
+                if os.path.exists(source):
+                    os.rename(source, "%s.%i" % (self._path, i + 1))
+            os.rename(self._path, self._path + ".1")
+        self._truncate = True
+        self._rotations += 1
@@ -4,12 +4,41 @@ __author__ = 'Markus Guenther (markus.guenther@gmail.com)'
 
 """
 This module implements an XMLRPC-based adapter for sending serializable data to supporter server.
+
+Supportee lists are dispatched using the following protocol. A supporter that understands
+supportee list deltas exposes receive_peer_list(peer_list, version), which replaces its list,
+and receive_peer_delta(version, added, removed), which applies a delta to the list of version
+(version - 1) and returns False if the supporter holds a different version (sequence gap).
+Supporters that only expose receive_peer_list(peer_list) always receive the complete list.
 """
 
+import httplib
 import logging
-import sys
+import Queue
+import socket
+import threading
 import xmlrpclib
 
+from collections import namedtuple
+
+from supporter.clock import monotonic
+from supporter.shared import *
+
+# immutable outcome of the compute phase of an update cycle:
+#   updates: tuple of 3-tuples (MonitoredSupporter, proxy, SupporteeListUpdate). the dispatch of
+#   an update doubles as liveness probe for the resp. supporter.
+#   probes: tuple of 2-tuples (MonitoredSupporter, proxy) for supporters without an update in
+#   this cycle whose probe interval elapsed
+DispatchPlan = namedtuple('DispatchPlan', ['updates', 'probes'])
+# outcome of the I/O phase of an update cycle, which gets merged back in the next cycle:
+#   dead_supporters: tuple of MonitoredSupporter instances that did not respond
+#   failed_dispatches: tuple of MonitoredSupporter instances that did not receive their list
+#   update (or rejected a delta), so that they get their complete list in the next cycle
+#   contacted_supporters: tuple of MonitoredSupporter instances that responded
+#   rpc_count: number of XML-RPC requests issued during the I/O phase
+DispatchResult = namedtuple('DispatchResult', ['dead_supporters', 'failed_dispatches', 'contacted_supporters',
+                                               'rpc_count'])
+
 
 class SupporteeListDispatcher(object):
     """This class implements a strategy to dispatch supportee lists to specific supporter
@@ -22,6 +51,14 @@ class SupporteeListDispatcher(object):
         self._logger = logging.getLogger("Tracker.SupporterMonitor.XMLRPC")
         # mapping: hash(MonitoredSupporter) => XML/RPC proxy for that supporter
         self._proxies = {}
+        # mapping: hash(MonitoredSupporter) => PersistentTransport used by the proxy
+        self._transports = {}
+        # mapping: hash(MonitoredSupporter) => boolean value, indicating whether the supporter
+        # accepts supportee list deltas (not present as long as this is unknown)
+        self._delta_capable = {}
+        # mapping: hash(MonitoredSupporter) => number of connections the transport had created
+        # when the last update was delivered (a new connection results in a complete list)
+        self._connections_at_last_update = {}
 
     def register_proxy(self, supporter):
         """Creates a proxy for the given supporter.
@@ -33,7 +70,27 @@ class SupporteeListDispatcher(object):
             NoneType
         """
         proxy_uri = "http://%s:%i" % (supporter.get_addr()[0], supporter.get_addr()[1] + 1)
-        self._proxies[supporter] = xmlrpclib.ServerProxy(proxy_uri)
+        transport = self._create_transport()
+        self._transports[supporter] = transport
+        self._proxies[supporter] = xmlrpclib.ServerProxy(proxy_uri, transport=transport)
+
+    def _create_transport(self):
+        """@return:
+            XML-RPC transport for a newly registered supporter, which keeps its connection
+            to the supporter alive across calls
+        """
+        return PersistentTransport()
+
+    def get_connection_statistics(self):
+        """@return:
+            Dictionary with the counters connections_created, connections_reused, reconnects and
+            requests, summed up over the transports of all registered supporters
+        """
+        statistics = {'connections_created': 0, 'connections_reused': 0, 'reconnects': 0, 'requests': 0}
+        for transport in self._transports.values():
+            for key, value in transport.get_statistics().items():
+                statistics[key] += value
+        return statistics
 
     def unregister_proxy(self, supporter):
         """Dereferences the proxy for the given supporter (if the proxy was created prior
@@ -49,45 +106,459 @@ class SupporteeListDispatcher(object):
         if self._proxies.has_key(supporter):
             self._proxies[supporter] = None
             del self._proxies[supporter]
+            self._transports.pop(supporter).close()
+            self._delta_capable.pop(supporter, None)
+            self._connections_at_last_update.pop(supporter, None)
+
+    def close(self, timeout=None):
+        """Closes the connections to all registered supporters. The dispatcher must not be used
+        afterwards.
 
-    def query_all_supporters(self):
-        """Queries all registered supporters in order to check if they are still alive. If a
-        supporter is considered as being dead, it will be marked for removal from the
-        supporter monitor.
+        @param timeout:
+            Time in seconds to wait for dispatches that are still in progress (not used by this
+            dispatcher, since it dispatches on the calling thread)
 
         @return:
             NoneType
         """
+        for transport in self._transports.values():
+            transport.close()
+
+    def create_dispatch_plan(self):
+        """Collects the supportee list updates of all monitored supporters that changed since
+        the last dispatch as well as the supporters that have to be probed for liveness. A
+        supporter that receives an update is not probed separately, since the update call also
+        proves that the supporter is alive. Supporters without an update are only probed once
+        their (adaptive) probe interval elapsed. This method has to be called while holding the
+        lock of the SupporterMonitor. It does not perform any network I/O, so that the resulting
+        plan can be executed outside of the critical section
+        (cf. SupporteeListDispatcher.execute_dispatch_plan).
+
+        @return:
+            DispatchPlan instance
+        """
+        updates = []
+        probes = []
+        # the plan is created during the update cycle, so this is the timestamp of the cycle
+        ts = self._monitor.get_clock().now()
         for supporter in self._monitor.get_monitored_supporters():
-            proxy = self._proxies[supporter]
+            proxy = self._proxies.get(supporter)
+            if proxy is None:
+                continue
+            update = supporter.collect_update()
+            if update is not None:
+                updates.append((supporter, proxy, update))
+            elif supporter.probe_due(ts):
+                probes.append((supporter, proxy))
+        return DispatchPlan(tuple(updates), tuple(probes))
+
+    def execute_dispatch_plan(self, plan):
+        """Queries all supporters of the given plan in order to check if they are still alive
+        and dispatches the supportee list updates of the plan via the XML-RPC proxy interface to
+        the resp. supporter. This method performs blocking network I/O and must not be called
+        while holding the lock of the SupporterMonitor.
+
+        @param plan:
+            DispatchPlan instance as returned by SupporteeListDispatcher.create_dispatch_plan
+
+        @return:
+            DispatchResult instance, which holds the supporters that did not respond to
+            the liveness probe and the supporters whose supportee list could not be delivered
+        """
+        dead_supporters = []
+        failed_dispatches = []
+        contacted_supporters = []
+        requests = self._count_requests()
+        for supporter, proxy in plan.probes:
             try:
                 proxy.is_alive()
+                contacted_supporters.append(supporter)
+            except:
+                self._logger.info("Supporter at %s:%i is not responding. Marking it for unregistering." %
+                                  supporter.get_addr())
+                dead_supporters.append(supporter)
+
+        for supporter, proxy, update in plan.updates:
+            try:
+                if not self._send_update(supporter, proxy, update):
+                    failed_dispatches.append(supporter)
+                contacted_supporters.append(supporter)
+            except:
+                self._logger.info("Failed to send supportee list to supporter at %s:%i. Marking it for "
+                                  "unregistering." % supporter.get_addr())
+                dead_supporters.append(supporter)
+                failed_dispatches.append(supporter)
+        return DispatchResult(tuple(dead_supporters), tuple(failed_dispatches), tuple(contacted_supporters),
+                              self._count_requests() - requests)
+
+    def _count_requests(self):
+        """@return:
+            The number of XML-RPC requests issued so far over the transports of all registered
+            supporters
+        """
+        return sum([transport.requests for transport in self._transports.values()])
+
+    def _send_update(self, supporter, proxy, update):
+        """Sends the given supportee list update to the supporter. A delta is only sent if the
+        supporter is known to accept deltas and if the connection to the supporter was not
+        re-established since the last delivered update. Otherwise, the complete list is sent.
+
+        @param supporter:
+            MonitoredSupporter instance representing the receiver of the update
+        @param proxy:
+            XML-RPC proxy for the supporter
+        @param update:
+            SupporteeListUpdate instance
+
+        @return:
+            Boolean value, indicating whether the update was accepted. Communication errors
+            are raised to the caller, since they indicate that the supporter is not alive.
+        """
+        transport = self._transports.get(supporter)
+        connections = transport is not None and transport.connections_created or 0
+        if not update.full and self._delta_capable.get(supporter) and \
+                self._connections_at_last_update.get(supporter) == connections:
+            if not proxy.receive_peer_delta(update.version, list(update.added), list(update.removed)):
+                self._logger.info("Supporter at %s:%i rejected delta %i. Sending the complete list next time." %
+                                  (supporter.get_addr() + (update.version,)))
+                return False
+            self._logger.debug("Let supporter %s support peers %s (delta %i: +%s -%s)" %
+                               (supporter.get_addr(), list(update.peers), update.version,
+                                list(update.added), list(update.removed)))
+        else:
+            self._send_complete_list(supporter, proxy, update)
+            self._logger.debug("Let supporter %s support peers %s" % (supporter.get_addr(), list(update.peers)))
+        self._connections_at_last_update[supporter] = transport is not None and transport.connections_created or 0
+        return True
+
+    def _send_complete_list(self, supporter, proxy, update):
+        if self._delta_capable.get(supporter, True):
+            try:
+                proxy.receive_peer_list(list(update.peers), update.version)
+                self._delta_capable[supporter] = True
+                return
+            except xmlrpclib.Fault:
+                # the supporter does not know about versioned supportee lists
+                self._delta_capable[supporter] = False
+        proxy.receive_peer_list(list(update.peers))
+
+
+class TimeoutHTTPConnection(httplib.HTTPConnection):
+    """HTTP connection that applies distinct timeouts to establishing the connection and to
+    waiting for data from the remote side."""
+
+    def __init__(self, host, connect_timeout, read_timeout):
+        httplib.HTTPConnection.__init__(self, host, timeout=connect_timeout)
+        self._read_timeout = read_timeout
+
+    def connect(self):
+        httplib.HTTPConnection.connect(self)
+        self.sock.settimeout(self._read_timeout)
+
+
+class PersistentTransport(xmlrpclib.Transport):
+    """XML-RPC transport that keeps HTTP/1.1 connections to a supporter open and reuses them
+    across calls (and thus across update cycles). Idle connections are kept in a small pool, so
+    that the transport can be used by several threads at the same time. If a reused connection
+    turns out to be broken (e.g. because the supporter closed it in the meantime), the call is
+    transparently repeated on a fresh connection. Connection establishment and reads are subject
+    to the given timeouts (NoneType results in blocking sockets).
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, max_idle_connections=2):
+        xmlrpclib.Transport.__init__(self)
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._max_idle_connections = max_idle_connections
+        self._idle_connections = []
+        self._pool_lock = threading.Lock()
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.reconnects = 0
+        self.requests = 0
+
+    def get_statistics(self):
+        """@return:
+            Dictionary with the counters connections_created, connections_reused, reconnects
+            and requests
+        """
+        return {'connections_created': self.connections_created,
+                'connections_reused': self.connections_reused,
+                'reconnects': self.reconnects,
+                'requests': self.requests}
+
+    def request(self, host, handler, request_body, verbose=0):
+        self.requests += 1
+        connection, reused = self._checkout_connection(host)
+        try:
+            return self._single_request(connection, host, handler, request_body, verbose)
+        except socket.timeout:
+            connection.close()
+            raise
+        except (socket.error, httplib.HTTPException):
+            connection.close()
+            if not reused:
+                raise
+        # the supporter closed the idle connection in the meantime, so we have to reconnect
+        self.reconnects += 1
+        connection = self._create_connection(host)
+        try:
+            return self._single_request(connection, host, handler, request_body, verbose)
+        except (socket.error, httplib.HTTPException):
+            connection.close()
+            raise
+
+    def _single_request(self, connection, host, handler, request_body, verbose):
+        if verbose:
+            connection.set_debuglevel(1)
+        self.send_request(connection, handler, request_body)
+        self.send_host(connection, host)
+        self.send_user_agent(connection)
+        self.send_content(connection, request_body)
+
+        response = connection.getresponse(buffering=True)
+        if response.status != 200:
+            response.read()
+            connection.close()
+            raise xmlrpclib.ProtocolError(host + handler, response.status, response.reason, response.msg)
+        self.verbose = verbose
+        try:
+            result = self.parse_response(response)
+        except xmlrpclib.Fault:
+            # the response was read completely, so the connection can still be used
+            self._release_connection(connection, response)
+            raise
+        self._release_connection(connection, response)
+        return result
+
+    def _release_connection(self, connection, response):
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin_connection(connection)
+
+    def _checkout_connection(self, host):
+        self._pool_lock.acquire()
+        try:
+            if len(self._idle_connections) > 0:
+                self.connections_reused += 1
+                return self._idle_connections.pop(), True
+        finally:
+            self._pool_lock.release()
+        return self._create_connection(host), False
+
+    def _checkin_connection(self, connection):
+        self._pool_lock.acquire()
+        try:
+            if len(self._idle_connections) < self._max_idle_connections:
+                self._idle_connections.append(connection)
+                return
+        finally:
+            self._pool_lock.release()
+        connection.close()
+
+    def _create_connection(self, host):
+        chost, self._extra_headers, _ = self.get_host_info(host)
+        self._pool_lock.acquire()
+        try:
+            self.connections_created += 1
+        finally:
+            self._pool_lock.release()
+        return TimeoutHTTPConnection(chost, self._connect_timeout, self._read_timeout)
+
+    def close(self):
+        """Closes all idle connections.
+
+        @return:
+            NoneType
+        """
+        self._pool_lock.acquire()
+        try:
+            idle_connections, self._idle_connections = self._idle_connections, []
+        finally:
+            self._pool_lock.release()
+        for connection in idle_connections:
+            connection.close()
+
+
+class WorkerPool(object):
+    """Fixed-size pool of daemon threads that execute submitted jobs in the order of
+    their submission."""
+
+    def __init__(self, workers):
+        assert workers > 0
+        self._jobs = Queue.Queue()
+        self._logger = logging.getLogger("Tracker.SupporterMonitor.WorkerPool")
+        self._workers = []
+        for i in xrange(workers):
+            worker = threading.Thread(target=self._work, name="SupporterDispatchWorker-%i" % i)
+            worker.setDaemon(True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, function, *args):
+        """Schedules the execution of function(*args) on one of the worker threads.
+
+        @return:
+            NoneType
+        """
+        self._jobs.put((function, args))
+
+    def shutdown(self, timeout=None):
+        """Stops all worker threads once they have executed the jobs that were submitted up to
+        now. Jobs must not be submitted afterwards.
+
+        @param timeout:
+            Time in seconds to wait for the worker threads to terminate. Waits until they have
+            terminated if set to NoneType.
+
+        @return:
+            NoneType
+        """
+        workers, self._workers = self._workers, []
+        # every worker terminates upon taking one of the sentinels
+        for _ in workers:
+            self._jobs.put(None)
+        deadline = None if timeout is None else monotonic() + timeout
+        for worker in workers:
+            if worker is threading.currentThread():
+                continue
+            if deadline is None:
+                worker.join()
+            else:
+                worker.join(max(0, deadline - monotonic()))
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            function, args = job
+            try:
+                function(*args)
             except:
-                self._logger.info("Supporter at %s:%s is not responding. Marking it for unregistering.")
-                self._monitor._dead_supporters.append(supporter)
+                self._logger.exception("Job %s failed." % function)
+
+
+class ConcurrentSupporteeListDispatcher(SupporteeListDispatcher):
+    """This dispatcher contacts all supporters of a DispatchPlan concurrently using a bounded
+    pool of worker threads. Every supporter is handled by a single job, which either sends the
+    supporter its supportee list update or probes it. Calls are subject to connect and
+    read timeouts. The I/O phase ends when all jobs completed or when the dispatch deadline
+    expired. Supporters that failed or did not answer before the deadline are reported as dead.
+    """
+
+    def __init__(self, monitor, workers=None, connect_timeout=None, read_timeout=None, deadline=None):
+        SupporteeListDispatcher.__init__(self, monitor)
+        self._connect_timeout = connect_timeout or SUPPORTER_CONNECT_TIMEOUT
+        self._read_timeout = read_timeout or SUPPORTER_READ_TIMEOUT
+        self._deadline = deadline or SUPPORTER_DISPATCH_DEADLINE
+        self._pool = WorkerPool(workers or SUPPORTER_DISPATCH_WORKERS)
+        # supporters for which a job is still being executed (possibly from an earlier cycle
+        # whose deadline expired). a proxy must not be used by two jobs at the same time.
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+
+    def _create_transport(self):
+        return PersistentTransport(self._connect_timeout, self._read_timeout)
 
-    def dispatch_peer_lists(self):
-        """Collects supportee data for every monitored supporter and dispatches the resulting
-        supportee lists via the XML-RPC proxy interface to the resp. supporter.
+    def close(self, timeout=None):
+        """Stops the worker threads and closes the connections to all registered supporters.
+        Jobs that are still in progress are completed first (unless the given timeout expires).
+
+        @param timeout:
+            Time in seconds to wait for the worker threads to terminate. Waits until they have
+            terminated if set to NoneType.
 
         @return:
             NoneType
         """
-        for supporter in self._monitor.get_monitored_supporters():
-            if not supporter.reset_update_counter():
-                continue  # NO CHANGES!
-            # gather peers
-            peers_to_be_unchoked = []
-            for peer in supporter.get_supported_peers():
-                peers_to_be_unchoked.append((peer.get_id(), peer.get_ip(), peer.get_port()))
-
-            if supporter in self._proxies.keys():
-                proxy = self._proxies[supporter]
-                # send peer list to resp. supporter
-                try:
-                    proxy.receive_peer_list(peers_to_be_unchoked)
-                    sys.stderr.write(
-                        "Let supporter %s support peers %s\n" % (supporter.get_addr(), peers_to_be_unchoked))
-                except:
-                    sys.stderr.write(
-                        "Failed to connect to supporter %s:%i\n" % (supporter.get_addr()[0], supporter.get_addr()[1]))
\ No newline at end of file
+        self._pool.shutdown(timeout)
+        SupporteeListDispatcher.close(self, timeout)
+
+    def execute_dispatch_plan(self, plan):
+        """Executes the given plan concurrently. See SupporteeListDispatcher.execute_dispatch_plan
+        for further documentation.
+
+        @param plan:
+            DispatchPlan instance as returned by SupporteeListDispatcher.create_dispatch_plan
+
+        @return:
+            DispatchResult instance
+        """
+        deadline = monotonic() + self._deadline
+        requests = self._count_requests()
+        jobs = [(supporter, proxy, update) for supporter, proxy, update in plan.updates] + \
+               [(supporter, proxy, None) for supporter, proxy in plan.probes]
+        results = Queue.Queue()
+        outstanding = {}
+        failed_dispatches = []
+
+        for supporter, proxy, update in jobs:
+            self._in_flight_lock.acquire()
+            try:
+                if supporter in self._in_flight:
+                    # the job of an earlier cycle is still waiting for this supporter
+                    if update is not None:
+                        failed_dispatches.append(supporter)
+                    continue
+                self._in_flight.add(supporter)
+            finally:
+                self._in_flight_lock.release()
+            outstanding[supporter] = update
+            self._pool.submit(self._contact_supporter, supporter, proxy, update, results)
+
+        dead_supporters = []
+        contacted_supporters = []
+        while len(outstanding) > 0:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                supporter, alive, delivered = results.get(timeout=remaining)
+            except Queue.Empty:
+                break
+            del outstanding[supporter]
+            if alive:
+                contacted_supporters.append(supporter)
+            else:
+                dead_supporters.append(supporter)
+            if not delivered:
+                failed_dispatches.append(supporter)
+
+        for supporter, update in outstanding.items():
+            self._logger.info("Supporter at %s:%i did not respond before the dispatch deadline. "
+                              "Marking it for unregistering." % supporter.get_addr())
+            dead_supporters.append(supporter)
+            if update is not None:
+                failed_dispatches.append(supporter)
+
+        return DispatchResult(tuple(dead_supporters), tuple(failed_dispatches), tuple(contacted_supporters),
+                              self._count_requests() - requests)
+
+    def _contact_supporter(self, supporter, proxy, update, results):
+        """Sends the given supportee list update to the given supporter or probes the supporter
+        if there is no update (NoneType). Runs on a worker thread and reports the 3-tuple
+        (supporter, alive, delivered) to the given result queue.
+
+        @return:
+            NoneType
+        """
+        alive, delivered = True, True
+        try:
+            try:
+                if update is None:
+                    proxy.is_alive()
+                else:
+                    delivered = self._send_update(supporter, proxy, update)
+            except:
+                self._logger.info("Supporter at %s:%i is not responding. Marking it for unregistering." %
+                                  supporter.get_addr())
+                alive, delivered = False, update is None
+        finally:
+            self._in_flight_lock.acquire()
+            try:
+                self._in_flight.discard(supporter)
+            finally:
+                self._in_flight_lock.release()
+            results.put((supporter, alive, delivered))
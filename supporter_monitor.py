@@ -15,72 +15,235 @@ client-side perspective, it is the entry-point to the supporter strategy as a co
 with a central system component, like a torrent tracker.
 """
 
+import heapq
+import json
 import logging
 import threading
 import time
 
+from collections import OrderedDict
+from itertools import count, islice, izip
+
+from supporter.activation import BranchAndBoundActivationStrategy
+from supporter.clock import Clock
 from supporter.monitored_subjects import MonitoredPeer, MonitoredSupporter
+from supporter.monitor_snapshot import MonitorSnapshot, PeerRecord, PeerRecords, StateCounts, SupporterRecord
+from supporter.monitor_snapshot import empty_snapshot
+from supporter.peer_table import ColumnarMonitoredPeer
+from supporter.priority_queue import IndexedMaxHeap
+from supporter.scheduler import FixedRateScheduler
+from supporter.statistics_log import StatisticsLogWriter
 from supporter.supporter_adapter import SupporteeListDispatcher
-from supporter.state_machine import DefaultState, StarvingState, SupportedState, WatchedState
+from supporter.state_machine import DefaultState, StarvingState, SupportedState, WatchedState, DEFAULT_STATE
 from supporter.shared import *
 
+# message types that do not change the state of a monitored peer if they are received twice in a
+# row at the same time (cf. SupporterMonitor.received_peer_messages)
+COALESCED_MESSAGES = frozenset([MSG_SUPPORT_NOT_NEEDED, MSG_PEER_REGISTERED])
+
 
 class SupporterMonitor(object):
     """This class keeps track of all registered peers and supporters and handles incoming messages.
     State transitions for peers are triggered synchronously in the resp. MonitoredPeer instances
     upon the receipt of a peer message. SupporterMonitor also triggers state changes for peers
     as well as supporters asynchronously by calling its update method in regular intervals of
-    1 second.
+    UPDATE_INTERVAL seconds once start() has been called.
     """
 
-    def __init__(self, is_alive_timeout=None, peer_timeout=None):
+    def __init__(self, is_alive_timeout=None, peer_timeout=None, dispatcher_factory=None,
+                 update_interval=None, transition_engine=None, peer_table=None, required_msgs=None,
+                 clock=None, activation_strategy=None, migration_budget=None, statistics_log=None):
         self._logger = logging.getLogger("Tracker.SupporterMonitor")
-        self._dispatcher = SupporteeListDispatcher(self)
-        self._monitored_peers = []
-        self._monitored_supporters = []
-        self._active_supporters = []
+        # provides the timestamps of the monitor and all of its peers (cf. clock.Clock). it is
+        # read once per update cycle and pinned to that timestamp for the rest of the cycle.
+        self._clock = clock or Clock()
+        # number of support requests a peer has to send within the approval time in order to
+        # transition to the STARVING state (defaults to PEER_REQUIRED_MSGS)
+        self._required_msgs = required_msgs
+        # optional peer_table.PeerTable that stores the attributes of all monitored peers in
+        # columns and evaluates their asynchronous state transitions at once (requires NumPy).
+        # peers are regular MonitoredPeer objects that are checked upon their deadlines otherwise.
+        self._peer_table = peer_table
+        # the transition engine performs state transitions of all monitored peers. peers delegate
+        # transitions to their current state by default (cf. state_machine.TableTransitionEngine
+        # for an alternative)
+        self._transition_engine = transition_engine
+        # decides which inactive supporters are activated for peers that remain starving after the
+        # assignment to active supporters (cf. activation.ActivationStrategy)
+        self._activation_strategy = activation_strategy or BranchAndBoundActivationStrategy()
+        # max. number of supported peers that may be migrated to other active supporters per update
+        # cycle in order to inactivate underused supporters (defaults to SUPPORTER_MIGRATION_BUDGET)
+        self._migration_budget = SUPPORTER_MIGRATION_BUDGET if migration_budget is None else migration_budget
+        # the dispatcher factory is a callable that takes the monitor and returns the dispatcher
+        # that shall be used (e.g. ConcurrentSupporteeListDispatcher). SupporteeListDispatcher
+        # is used by default, which contacts supporters sequentially.
+        self._dispatcher = (dispatcher_factory or SupporteeListDispatcher)(self)
+        # mapping: peer ID => MonitoredPeer in the order of registration (serves as lookup index
+        # for incoming messages)
+        self._monitored_peers = OrderedDict()
+        # mapping: state class => MonitoredPeer instances that currently reside in that state (keys
+        # of the OrderedDict) in the order in which they entered the state. the order is preserved,
+        # since starving peers with the same number of assignments are served in this order.
+        self._peers_by_state = {DefaultState: OrderedDict(), WatchedState: OrderedDict(),
+                                StarvingState: OrderedDict(), SupportedState: OrderedDict()}
+        # min-heap of (deadline, peer ID) tuples. a heap entry is only valid if it matches the
+        # deadline that is currently scheduled for the peer, all other entries are skipped.
+        self._peer_deadlines = []
+        # mapping: peer ID => currently scheduled deadline
+        self._scheduled_deadlines = {}
+        # registered MonitoredSupporter instances in the order of their registration (keys of the dict)
+        self._monitored_supporters = OrderedDict()
+        # active MonitoredSupporter instances keyed by their available slots, so that the
+        # supporter with the most available slots is always on top
+        self._active_supporters = IndexedMaxHeap()
         self._lock = threading.RLock()
-        self.schedule_next_asynchronous_update()
+        # periodically triggers update_states on a single long-lived thread (see start/stop)
+        self._scheduler = FixedRateScheduler(self.update_states, update_interval or UPDATE_INTERVAL,
+                                             "SupporterMonitor.update")
         self.number_of_assignments = {}
-        self.statistics = MonitorState()
+        # latest monitor_snapshot.MonitorSnapshot that was published (cf. get_snapshot). it is
+        # replaced as a whole, so readers do not need to hold the lock.
+        self._snapshot = empty_snapshot(time.time())
+        # mapping: peer ID => slot of the record of the peer in the chunks of the snapshots (cf.
+        # monitor_snapshot.PeerRecords), in the order of the registration of the peers
+        self._peer_slots = OrderedDict()
+        # chunks of the records of the last published snapshot. only chunks with records of peers
+        # that changed since then (cf. peer_state_changed, peer_deadline_changed) are copied when
+        # the next snapshot is published, all others are shared.
+        self._record_chunks = []
+        self._next_slot = 0
+        # slots of unregistered peers that are cleared when the next snapshot is published, and
+        # number of unused slots in the chunks
+        self._cleared_slots = []
+        self._unused_slots = 0
+        # MonitoredPeer instances whose record is outdated
+        self._stale_records = set()
+        # mapping: MonitoredPeer => MonitoredSupporter the peer is assigned to
+        self._peer_supporters = {}
+        # the figures of every update cycle are written to the statistics log by a background
+        # thread (cf. statistics_log.StatisticsLogWriter), so disk I/O never happens under the lock
+        self.statistics = MonitorState(statistics_log)
         self._is_alive_timeout = is_alive_timeout or IS_ALIVE_TIMEOUT_BOUND
         self._peer_timeout = peer_timeout or PEER_TIMEOUT_BOUND
         # contains supporter servers that were marked as dead (last communication was not
         # successful) and should be removed in the next update cycle (we cant do this
         # directly because of concurrency issues)
         self._dead_supporters = []
+        # contains DispatchResult instances of I/O phases that have not been merged back yet
+        self._dispatch_results = []
+        # number of XML-RPC requests issued during the I/O phase of the last update cycle
+        self._rpcs_per_cycle = 0
+        # number of supporters that were inactivated and number of peers that were migrated by the
+        # consolidation of the last update cycle
+        self._freed_supporters_per_cycle = 0
+        self._migrated_peers_per_cycle = 0
+
+    def start(self):
+        """Starts the asynchronous state updates for peers and supporters. update_states is
+        called at a fixed rate of one call per update interval.
+
+        @return:
+            NoneType
+        """
+        self._scheduler.start()
+
+    def stop(self, timeout=None):
+        """Stops the asynchronous state updates. An update that is currently in progress is
+        completed before this method returns (unless the given timeout expires).
 
-    def schedule_next_asynchronous_update(self):
-        """Schedules the next asynchronous state update for peers and supporters.
+        @param timeout:
+            Time in seconds to wait for a running update to complete. Waits until it has
+            completed if set to NoneType.
 
         @return:
             NoneType
         """
-        for th in threading.enumerate():
-            if th.getName() == "MainThread" and not th.isAlive():
-                return
+        self._scheduler.stop(timeout)
+
+    def close(self, timeout=None):
+        """Stops the asynchronous state updates (cf. stop), closes the dispatcher (which stops
+        its worker threads and closes the connections to the supporters) and closes the
+        statistics log once its queued records have been written. The monitor must not be used
+        afterwards.
+
+        @param timeout:
+            Time in seconds to wait for a running update, for running dispatches and for the
+            statistics log to complete. Waits until all have completed if set to NoneType.
+
+        @return:
+            NoneType
+        """
+        self.stop(timeout)
+        self._dispatcher.close(timeout)
+        self.statistics.statistics_log.close(timeout)
 
-        t = threading.Timer(1.0, self.update_states)
-        t.start()
+    def is_running(self):
+        """@return:
+            True, if asynchronous state updates are performed. False otherwise.
+        """
+        return self._scheduler.is_running()
+
+    def get_update_interval(self):
+        """@return:
+            Time between two asynchronous state updates in seconds
+        """
+        return self._scheduler.get_period()
+
+    def get_skipped_updates(self):
+        """@return:
+            Number of asynchronous state updates that were skipped because an update took
+            longer than the update interval
+        """
+        return self._scheduler.get_overruns()
+
+    def call_synchronized(self, function, *args):
+        """Calls function(*args) while no other thread modifies the state of the monitor, i.e.
+        while holding the lock of the monitor.
+
+        @return:
+            The return value of the function
+        """
+        self._lock.acquire()
+        try:
+            return function(*args)
+        finally:
+            self._lock.release()
+
+    def get_clock(self):
+        """@return:
+            The clock.Clock instance that provides the timestamps of the monitor and its peers
+        """
+        return self._clock
 
     def get_monitored_peers(self):
         """@return:
-            List containing MonitoredPeer instances
+            List containing MonitoredPeer instances in the order of their registration
         """
-        return self._monitored_peers
+        return self._monitored_peers.values()
+
+    def get_monitored_peer(self, peer_id):
+        """@param peer_id:
+            The ID of the peer to look up
+
+        @return:
+            The MonitoredPeer instance registered under the given ID. NoneType if no
+            such peer is registered.
+        """
+        return self._monitored_peers.get(peer_id)
 
     def get_monitored_supporters(self):
         """@return:
             List containing all MonitoredSupporter instances, independent of their state
-            (active, not active)
+            (active, not active) in the order of their registration
         """
-        return self._monitored_supporters
+        return self._monitored_supporters.keys()
 
     def get_active_supporters(self):
         """@return:
-            List containing all MonitoredSupporter instances that reside in the ACTIVE state
+            List containing all MonitoredSupporter instances that reside in the ACTIVE state,
+            ordered by decreasing value of their available slots
         """
-        return self._active_supporters
+        return self._active_supporters.items()
 
     def register_monitored_peer(self, id, ip, port, peer_type):
         """Registers a peer at the monitor.
@@ -96,19 +259,59 @@ class SupporterMonitor(object):
 
         @return:
             The newly created MonitoredPeer instance. NoneType, if a MonitoredPeer instance
-            with the given attributes already exists.
+            with the given ID already exists.
         """
         self._lock.acquire()
-        mp = None
         try:
-            mp = MonitoredPeer(id, ip, port, peer_type, self._is_alive_timeout, self._peer_timeout)
-            if mp not in self._monitored_peers:
-                self._monitored_peers.append(mp)
-            else:
-                mp = None
-            self.received_peer_message(MSG_PEER_REGISTERED, id)
+            self._clock.begin_tick()
+            try:
+                return self._register_monitored_peer(id, ip, port, peer_type)
+            finally:
+                self._clock.end_tick()
+        finally:
+            self._lock.release()
+
+    def register_monitored_peers(self, peers):
+        """Registers several peers at the monitor at once (e.g. upon the startup of the tracker).
+        The lock is acquired only once and all peers share the registration timestamp.
+
+        @param peers:
+            Iterable of 4-tuples (ID, IP address, port, peer type) (cf. register_monitored_peer)
+
+        @return:
+            List of the newly created MonitoredPeer instances in the order of the given peers.
+            The list contains NoneType for every ID that already was registered.
+        """
+        self._lock.acquire()
+        try:
+            self._clock.begin_tick()
+            try:
+                return [self._register_monitored_peer(id, ip, port, peer_type) for id, ip, port, peer_type in peers]
+            finally:
+                self._clock.end_tick()
         finally:
             self._lock.release()
+
+    def _register_monitored_peer(self, id, ip, port, peer_type):
+        """Registers a peer at the monitor. This method has to be called while holding the lock.
+        See register_monitored_peer for further documentation.
+        """
+        mp = None
+        if id not in self._monitored_peers:
+            if self._peer_table is not None:
+                mp = ColumnarMonitoredPeer(self._peer_table, id, ip, port, peer_type, self._is_alive_timeout,
+                                           self._peer_timeout, self._transition_engine, self._required_msgs,
+                                           self._clock)
+            else:
+                mp = MonitoredPeer(id, ip, port, peer_type, self._is_alive_timeout, self._peer_timeout,
+                                   self._transition_engine, self._required_msgs, self._clock)
+            self._monitored_peers[id] = mp
+            self._peers_by_state[mp.get_state().__class__][mp] = None
+            self._peer_slots[id] = self._next_slot
+            self._next_slot += 1
+            self._stale_records.add(mp)
+            mp.set_state_listener(self)
+        self._monitored_peers[id].receive_msg(MSG_PEER_REGISTERED)
         return mp
 
     def unregister_monitored_peer(self, monitored_peer):
@@ -123,8 +326,66 @@ class SupporterMonitor(object):
         assert monitored_peer is not None
         assert isinstance(monitored_peer, MonitoredPeer)
 
-        if monitored_peer in self._monitored_peers:
-            self._monitored_peers.remove(monitored_peer)
+        if self._monitored_peers.get(monitored_peer.get_id()) == monitored_peer:
+            monitored_peer = self._monitored_peers.pop(monitored_peer.get_id())
+            monitored_peer.set_state_listener(None)
+            self._peers_by_state[monitored_peer.get_state().__class__].pop(monitored_peer, None)
+            self._cleared_slots.append(self._peer_slots.pop(monitored_peer.get_id()))
+            self._unused_slots += 1
+            self._stale_records.discard(monitored_peer)
+            self._peer_supporters.pop(monitored_peer, None)
+            # invalidates the heap entry of the peer
+            self._scheduled_deadlines.pop(monitored_peer.get_id(), None)
+            if self._peer_table is not None:
+                self._peer_table.remove_peer(monitored_peer)
+
+    def peer_state_changed(self, monitored_peer, previous_state, new_state):
+        """Listener method which gets called by a registered MonitoredPeer whenever it
+        transitions into another state. Moves the peer into the bucket of its new state.
+
+        @param monitored_peer:
+            Instance of MonitoredPeer that changed its state
+        @param previous_state:
+            The state the peer resided in before the transition
+        @param new_state:
+            The state the peer resides in after the transition
+
+        @return:
+            NoneType
+        """
+        self._peers_by_state[previous_state.__class__].pop(monitored_peer, None)
+        self._peers_by_state[new_state.__class__][monitored_peer] = None
+        self._stale_records.add(monitored_peer)
+
+    def peer_deadline_changed(self, monitored_peer, deadline):
+        """Listener method which gets called by a registered MonitoredPeer whenever its next
+        deadline changes. The peer is scheduled for the asynchronous state update that follows
+        the given deadline. If an earlier deadline is already scheduled, the peer is checked
+        at that time and rescheduled afterwards. Since the listener is notified upon every
+        message, the record of the peer is marked as outdated for the next snapshot as well.
+
+        @param monitored_peer:
+            Instance of MonitoredPeer whose deadline changed
+        @param deadline:
+            Timestamp of the next deadline of the peer
+
+        @return:
+            NoneType
+        """
+        self._stale_records.add(monitored_peer)
+        if self._peer_table is not None:
+            # the peer table evaluates all peers in every update
+            return
+        peer_id = monitored_peer.get_id()
+        scheduled = self._scheduled_deadlines.get(peer_id)
+        if scheduled is not None and scheduled <= deadline:
+            return
+        self._scheduled_deadlines[peer_id] = deadline
+        heapq.heappush(self._peer_deadlines, (deadline, peer_id))
+        if len(self._peer_deadlines) > 2 * len(self._scheduled_deadlines) + 64:
+            # too many invalid entries, rebuild the heap from the scheduled deadlines
+            self._peer_deadlines = [(d, p) for p, d in self._scheduled_deadlines.iteritems()]
+            heapq.heapify(self._peer_deadlines)
 
     def register_monitored_supporter(self, id, addr, min_peer, max_peer):
         """Registers a supporter server at the monitor.
@@ -148,7 +409,7 @@ class SupporterMonitor(object):
         try:
             ms = MonitoredSupporter(id, addr, min_peer, max_peer)
             if ms not in self._monitored_supporters:
-                self._monitored_supporters.append(ms)
+                self._monitored_supporters[ms] = None
                 self._dispatcher.register_proxy(ms)
             else:
                 ms = None
@@ -169,19 +430,24 @@ class SupporterMonitor(object):
         assert isinstance(monitored_supporter, MonitoredSupporter)
 
         if monitored_supporter in self._monitored_supporters:
+            for peer in monitored_supporter.get_supported_peers():
+                self._peer_supporters.pop(peer, None)
             monitored_supporter.cancel_support_for_all_peers()
-            self._monitored_supporters.remove(monitored_supporter)
+            if monitored_supporter in self._active_supporters:
+                self._active_supporters.remove(monitored_supporter)
+            del self._monitored_supporters[monitored_supporter]
             self._dispatcher.unregister_proxy(monitored_supporter)
 
     def order_active_supporters(self):
-        """Orders all active supporters by decreasing value of their available slots.
+        """Re-keys all active supporters by their available slots. The order of active supporters
+        is maintained upon every assignment by the monitor, so this is only required if supportee
+        lists were changed directly on MonitoredSupporter instances.
 
         @return:
             NoneType
         """
-        tmp = [(s, s.available_slots()) for s in self._active_supporters]
-        tmp.sort(lambda x, y: cmp(y[1], x[1]))
-        self._active_supporters = [s[0] for s in tmp]
+        for supporter in self._active_supporters:
+            self._active_supporters.update(supporter, supporter.available_slots())
 
     def filter_peers_by_state(self, state_class):
         """Extracts peers with the given state from the list of all registered peers.
@@ -191,72 +457,256 @@ class SupporterMonitor(object):
             for which we want to filter.
 
         @return:
-            List of registered monitored peers that currently reside in the given state
+            List of registered monitored peers that currently reside in the given state in the
+            order in which they entered it
+        """
+        if state_class in self._peers_by_state:
+            return self._peers_by_state[state_class].keys()
+        return [mp for mp in self.get_monitored_peers() if isinstance(mp.get_state(), state_class)]
+
+    def count_peers_by_state(self, state_class):
+        """@param state_class:
+            One of the state classes DefaultState, WatchedState, StarvingState or SupportedState
+
+        @return:
+            The number of registered monitored peers that currently reside in the given state
         """
-        return [mp for mp in self._monitored_peers if isinstance(mp.get_state(), state_class)]
+        return len(self._peers_by_state[state_class])
 
     def remaining_active_supporters_with_capacity(self):
         """@return:
             Boolean value, indicating whether we have at least one active supporter that still
             has available slots
         """
-        return len(self._active_supporters) != 0 and self._active_supporters[0].available_slots() > 0
+        return len(self._active_supporters) != 0 and self._active_supporters.peek().available_slots() > 0
 
     def update_states(self):
         """Performs an asynchronous state update of all registered monitored peers and supporters.
         The method looks for starving peers and tries to assign them to active supporters. If
         starving peers remain afterwards, it tries to activate new supporters in order to support
-        those starving peers. Dispatches supportee lists to all active supporters at the end
-        of the state update.
+        those starving peers. Underused supporters are inactivated afterwards if their peers can
+        be migrated to other active supporters. Dispatches supportee lists to all active supporters
+        at the end of the state update.
+
+        The update is split into two phases. The compute phase runs while holding the lock and
+        results in an immutable DispatchPlan. The I/O phase executes this plan (liveness probes,
+        supportee list dispatch) without holding the lock, so that slow or unreachable supporters
+        do not block incoming peer messages. Its results are merged back in the next cycle.
+
+        The clock is read once at the beginning of the compute phase. All peers and supporters
+        are evaluated against that timestamp.
 
         @return:
             NoneType
         """
+        plan = self._run_compute_phase()
+        # send peer lists to supporters without blocking incoming messages
+        self._run_io_phase(plan)
+
+    def _run_compute_phase(self):
+        """Runs the compute phase of an update cycle (cf. update_states) while holding the lock.
+
+        @return:
+            DispatchPlan instance that has to be executed by the I/O phase
+        """
         self._lock.acquire()
         try:
-            self._remove_timedout_peers()
-            self._mark_dead_supporters()
+            ts = self._clock.begin_tick()
+            self._merge_dispatch_results(ts)
             self._remove_dead_supporters()
 
-            self._enforce_update_of_monitored_peers()
+            if self._peer_table is not None:
+                self._update_peer_table(ts)
+            else:
+                self._update_expired_peers(ts)
             self._enforce_update_of_monitored_supporters()
 
-            self.statistics.snapshot(self)
-
             self._assign_starving_peers_to_active_supporters()
             # at this point, we still might have some starving peers left, but no active
             # servers with free capacities. but we can see if we are able to activate more
             # supporters.
             self._check_for_activation_of_new_supporters()
-            # now send new peer_lists to supporters
-            self._dispatcher.dispatch_peer_lists()
+            # empty out underused supporters if other active supporters can take over their peers
+            self._consolidate_active_supporters()
+            self.statistics.snapshot(self._publish_snapshot())
+            # now collect new peer_lists for supporters
+            return self._dispatcher.create_dispatch_plan()
         finally:
+            self._clock.end_tick()
             self._lock.release()
-        self.schedule_next_asynchronous_update()
 
-    def _remove_timedout_peers(self):
-        """Removes peers for which the last activity was reported more than PEER_REMOVAL_TIME
-        seconds ago.
+    def _run_io_phase(self, plan):
+        """Runs the I/O phase of an update cycle (cf. update_states) without holding the lock.
+        Its result is merged during the compute phase of the next update cycle.
+
+        @param plan:
+            DispatchPlan instance as returned by _run_compute_phase
 
         @return:
             NoneType
         """
-        peers_to_be_removed = []
-        ts = time.time()
-        for mp in self.get_monitored_peers():
-            if (ts - mp.get_ts_last_message()) >= PEER_REMOVAL_TIME:
-                peers_to_be_removed.append(mp)
-        for mp in peers_to_be_removed:
-            self.unregister_monitored_peer(mp)
+        self._dispatch_results.append(self._dispatcher.execute_dispatch_plan(plan))
+
+    def _merge_dispatch_results(self, ts):
+        """Merges the results of previous I/O phases. Supporters that did not respond are marked
+        as being dead, supporters that did not receive their supportee list will get it
+        dispatched again.
 
-    def _mark_dead_supporters(self):
-        """Tries to contact every registered supporters and marks those that do not respond
-        as being dead.
+        @param ts:
+            Timestamp of the current update cycle
 
         @return:
             NoneType
         """
-        self._dispatcher.query_all_supporters()
+        while len(self._dispatch_results) > 0:
+            result = self._dispatch_results.pop(0)
+            if result is None:
+                continue
+            for supporter in result.dead_supporters:
+                if supporter not in self._dead_supporters:
+                    self._dead_supporters.append(supporter)
+            for supporter in result.contacted_supporters:
+                supporter.contact_succeeded(ts)
+            for supporter in result.failed_dispatches:
+                supporter.request_update()
+                supporter.reset_probe_interval()
+            self._rpcs_per_cycle = result.rpc_count
+
+    def get_rpcs_per_cycle(self):
+        """@return:
+            The number of XML-RPC requests that were issued to supporters during the I/O phase
+            of the last update cycle
+        """
+        return self._rpcs_per_cycle
+
+    def get_freed_supporters_per_cycle(self):
+        """@return:
+            The number of supporters that were inactivated by the consolidation of the last
+            update cycle
+        """
+        return self._freed_supporters_per_cycle
+
+    def get_migrated_peers_per_cycle(self):
+        """@return:
+            The number of supported peers that were migrated to another supporter by the
+            consolidation of the last update cycle
+        """
+        return self._migrated_peers_per_cycle
+
+    def get_snapshot(self):
+        """Returns the snapshot of the monitor state that was published at the end of the last
+        update cycle. The snapshot is immutable, so this method does not acquire the lock and
+        may be called by any thread at any time.
+
+        @return:
+            monitor_snapshot.MonitorSnapshot instance (version 0 before the first update cycle)
+        """
+        return self._snapshot
+
+    def publish_snapshot(self):
+        """Publishes a snapshot of the current monitor state without waiting for the next
+        update cycle (cf. get_snapshot).
+
+        @return:
+            The published monitor_snapshot.MonitorSnapshot instance
+        """
+        self._lock.acquire()
+        try:
+            return self._publish_snapshot()
+        finally:
+            self._lock.release()
+
+    def _publish_snapshot(self):
+        """Publishes a snapshot of the current monitor state with the next version. Only the
+        records of peers that changed since the last snapshot are rebuilt, and only the chunks
+        that hold these records are copied. Must be called while holding the lock.
+
+        @return:
+            The published monitor_snapshot.MonitorSnapshot instance
+        """
+        if self._unused_slots > max(len(self._peer_slots), SNAPSHOT_CHUNK_SIZE):
+            self._compact_record_chunks()
+        chunks = self._record_chunks
+        # chunks that are modified by this snapshot, keyed by their index
+        changed = {}
+        for slot in self._cleared_slots:
+            index, offset = divmod(slot, SNAPSHOT_CHUNK_SIZE)
+            chunk = changed.get(index) or self._copy_record_chunk(changed, index)
+            chunk[offset] = None
+        del self._cleared_slots[:]
+        monitored_peers = self._monitored_peers
+        peer_slots = self._peer_slots
+        peer_supporters = self._peer_supporters
+        for peer in self._stale_records:
+            peer_id = peer.get_id()
+            if monitored_peers.get(peer_id) is not peer:
+                continue
+            index, offset = divmod(peer_slots[peer_id], SNAPSHOT_CHUNK_SIZE)
+            chunk = changed.get(index) or self._copy_record_chunk(changed, index)
+            supporter = peer_supporters.get(peer)
+            chunk[offset] = PeerRecord(peer_id, peer.get_ip(), peer.get_port(), str(peer.get_state()),
+                                       peer.get_last_received_msg(), peer.get_number_of_support_requests(),
+                                       supporter.get_id() if supporter is not None else None)
+        self._stale_records.clear()
+        for index, chunk in changed.iteritems():
+            while len(chunks) <= index:
+                chunks.append((None,) * SNAPSHOT_CHUNK_SIZE)
+            chunks[index] = tuple(chunk)
+
+        active_supporters = self._active_supporters
+        supporters = tuple([SupporterRecord(supporter.get_id(), supporter.get_addr(), supporter.get_min_peer(),
+                                            supporter.get_max_peer(), supporter.assigned_slots(),
+                                            supporter.available_slots(), supporter in active_supporters)
+                            for supporter in self._monitored_supporters])
+        peers_by_state = self._peers_by_state
+        state_counts = StateCounts(len(peers_by_state[DefaultState]), len(peers_by_state[WatchedState]),
+                                   len(peers_by_state[StarvingState]), len(peers_by_state[SupportedState]))
+        self._snapshot = MonitorSnapshot(self._snapshot.version + 1, time.time(),
+                                         PeerRecords(tuple(chunks), len(peer_slots)), supporters, state_counts,
+                                         self._rpcs_per_cycle, self._freed_supporters_per_cycle,
+                                         self._migrated_peers_per_cycle)
+        return self._snapshot
+
+    def _copy_record_chunk(self, changed, index):
+        """Creates a modifiable copy of the chunk with the given index for the next snapshot.
+
+        @param changed:
+            Dictionary that maps the indices of chunks to their modifiable copies
+        @param index:
+            Index of the chunk (chunks beyond the last chunk are created empty)
+
+        @return:
+            The modifiable copy of the chunk, which was added to changed
+        """
+        if index < len(self._record_chunks):
+            chunk = list(self._record_chunks[index])
+        else:
+            chunk = [None] * SNAPSHOT_CHUNK_SIZE
+        changed[index] = chunk
+        return chunk
+
+    def _compact_record_chunks(self):
+        """Moves the records of all registered peers to consecutive slots in the order of their
+        registration, which drops the unused slots of unregistered peers. This copies all chunks,
+        but only happens once more slots are unused than in use. Must be called while holding
+        the lock.
+
+        @return:
+            NoneType
+        """
+        chunks = self._record_chunks
+        records = []
+        for slot in self._peer_slots.itervalues():
+            index, offset = divmod(slot, SNAPSHOT_CHUNK_SIZE)
+            # peers that were registered after the last snapshot do not have a record yet
+            records.append(chunks[index][offset] if index < len(chunks) else None)
+        records.extend([None] * (-len(records) % SNAPSHOT_CHUNK_SIZE))
+        self._record_chunks = [tuple(records[i:i + SNAPSHOT_CHUNK_SIZE])
+                               for i in xrange(0, len(records), SNAPSHOT_CHUNK_SIZE)]
+        self._peer_slots = OrderedDict(izip(self._peer_slots, count()))
+        self._next_slot = len(self._peer_slots)
+        del self._cleared_slots[:]
+        self._unused_slots = 0
 
     def _remove_dead_supporters(self):
         """Removes supporters that were marked as being dead.
@@ -266,19 +716,53 @@ class SupporterMonitor(object):
         """
         for supporter in self._dead_supporters:
             self.unregister_monitored_supporter(supporter)
+        self._dead_supporters = []
+
+    def _update_peer_table(self, ts):
+        """Triggers an update on all monitored peers of the peer table (vectorized) and removes
+        peers for which the last activity was reported more than PEER_REMOVAL_TIME seconds ago.
 
-    def _enforce_update_of_monitored_peers(self):
-        """Triggers an update on all registered monitored peers. This has to be done since
-        peer status transitions might happen asynchronously (after a timer runs out).
+        @param ts:
+            Timestamp of the current update cycle
 
         @return:
             NoneType
         """
-        for mp in self.get_monitored_peers():
-            if mp.get_ts_last_request() and (time.time() - mp.get_ts_last_request() > 10):
-                mp.set_state(DefaultState(mp))
+        for mp in self._peer_table.update_states(ts):
+            self.unregister_monitored_peer(mp)
+
+    def _update_expired_peers(self, ts):
+        """Triggers an update on all monitored peers whose deadline has passed. This has to be
+        done since peer status transitions might happen asynchronously (after a timer runs out).
+        Removes peers for which the last activity was reported more than PEER_REMOVAL_TIME
+        seconds ago. Peers whose deadline has not passed yet are not touched, so the cost of
+        this method depends on the number of expired peers and not on the number of all peers.
+
+        @param ts:
+            Timestamp of the current update cycle
+
+        @return:
+            The number of expired peers that were updated or removed
+        """
+        expired_peers = []
+        while len(self._peer_deadlines) > 0 and self._peer_deadlines[0][0] <= ts:
+            deadline, peer_id = heapq.heappop(self._peer_deadlines)
+            if self._scheduled_deadlines.get(peer_id) != deadline:
+                # the peer was unregistered or rescheduled in the meantime
+                continue
+            del self._scheduled_deadlines[peer_id]
+            expired_peers.append(self._monitored_peers[peer_id])
+
+        for mp in expired_peers:
+            if (ts - mp.get_ts_last_message()) >= PEER_REMOVAL_TIME:
+                self.unregister_monitored_peer(mp)
+                continue
+            if mp.get_ts_last_request() and (ts - mp.get_ts_last_request() > PEER_RESET_TIME):
+                mp.set_state(DEFAULT_STATE)
             else:
-                mp.get_state().transition()
+                mp.trigger_transition()
+            self.peer_deadline_changed(mp, mp.get_next_deadline())
+        return len(expired_peers)
 
     def _enforce_update_of_monitored_supporters(self):
         """Triggers an update on all registered supporters. This includes the potential transition
@@ -289,12 +773,14 @@ class SupporterMonitor(object):
         """
         # check for all supporters if they have peers in their supported list
         # that no longer need support (state == DEFAULT)
-        supporters_to_be_inactivated = []
         for supporter in self._active_supporters:
-            supporter.update_supported_peer_list()
+            for peer in supporter.update_supported_peer_list():
+                self._peer_supporters.pop(peer, None)
+                self._stale_records.add(peer)
             if supporter.assigned_slots() == 0:
-                supporters_to_be_inactivated.append(supporter)
-        self._active_supporters = [s for s in self._active_supporters if s not in supporters_to_be_inactivated]
+                self._active_supporters.remove(supporter)
+            else:
+                self._active_supporters.update(supporter, supporter.available_slots())
 
     def sort_starving_peers(self, starving_peers):
         nl = []
@@ -317,84 +803,122 @@ class SupporterMonitor(object):
         starving_peers = self.filter_peers_by_state(StarvingState)
         starving_peers = self.sort_starving_peers(starving_peers)
 
-        while len(starving_peers) > 0:
-            peer = starving_peers[0]  # always take out the peer from the front, otherwise this loop wont work
-            # 2. do we have active servers with free slots? it suffices to look
-            # at the first supporter of the active list, since we keep this list
-            # ordered
-            active_supporters = self.get_active_supporters()
-
-            if self.remaining_active_supporters_with_capacity():
-                # assign peer to supporter and re-order the active list 
-                self.assign_peer_to_supporter(peer, active_supporters[0])
-                starving_peers.remove(peer)
-                self.order_active_supporters()
-            else:
-
+        for peer in starving_peers:
+            # do we have active servers with free slots? it suffices to look at the
+            # supporter on top of the active heap, since it has the most available slots
+            if not self.remaining_active_supporters_with_capacity():
                 # this is the case if we have no longer any active supporters that
                 # can provide slots to suffering peers. we break in this case and
                 # handle the set of remaining peers (starving_peers) next
                 break
+            # assign peer to supporter (which re-keys it in the active heap)
+            self.assign_peer_to_supporter(peer, self._active_supporters.peek())
 
     def _check_for_activation_of_new_supporters(self):
         """Checks if we can activate new supporters in order to support remaining starving peers
-        (that could not be assigned to a supporter during the current update phase).
+        (that could not be assigned to a supporter during the current update phase). The supporters
+        that are activated are selected by the activation strategy of the monitor.
 
         @return:
             NoneType
         """
 
-        def sorted_list_of_inactive_supporters():
-            # create a list with supporters that are inactive and sort this list
-            # in ascending order of min_peers, since we want to help suffering
-            # peers as fast as possible (but please consider the fact this will
-            # not result in an optimal distribution of starving peers in combination
-            # with the used assignment algorithm underneath
-            inactive_supporters = [(s, s.get_min_peer()) for s in self._monitored_supporters if
-                                   s not in self._active_supporters]
-            if len(inactive_supporters) == 0:
-                return []
-            inactive_supporters.sort(lambda x, y: cmp(x[1], y[1]))
-            return inactive_supporters
-
-        def retrieve_activation_index(starving_peers, inactive_supporters):
-            # checks how many supporters (up to some index i) should be activated in order
-            # to supply data to starving peers. this algorithm is quite simple. actually, we have a 
-            # bin packing problem here at hand which we dont solve optimally using this algorithm.
-            # the method used here is a very simple greedy approach, which might not assign peers 
-            # optimally, meaning that some peers might remain in the STARVING state, although we 
-            # could obtain a better result if our algorithm was better.
-            starving_number = len(starving_peers)
-            activate_up_to_index = -1
-            for i in xrange(len(inactive_supporters)):
-                if starving_number >= inactive_supporters[i][1]:
-                    starving_number -= inactive_supporters[i][0].available_slots()
-                    activate_up_to_index = i
-                else:
-                    break
-            return activate_up_to_index
-
-        def activate_supporters_and_assign_peers(index, starving_peers):
-            # activates new supporters from the sorted inactivate supporters list starting from
-            # index 0 up to the given max. index. the method assigns starving peers on-the-fly
-            # to freshly activated supporters.
-            if activate_up_to_index >= 0:
-                for i in xrange(0, activate_up_to_index + 1):  # bound for xrange has to be +1
-                    self.activate_supporter(inactive_supporters[i][0])
-                    assigned_peers = []
-                    for peer in starving_peers:
-                        self.assign_peer_to_supporter(peer, inactive_supporters[0][0])
-                        assigned_peers.append(peer)
-                        if inactive_supporters[0][0].available_slots() == 0:
-                            break
-                    starving_peers = [p for p in starving_peers if p not in assigned_peers]
-                # we activated some new supporters and have to maintain their sorting order now
-                self.order_active_supporters()
+        starving_peers = self.sort_starving_peers(self.filter_peers_by_state(StarvingState))
+        if len(starving_peers) == 0:
+            return
+        inactive_supporters = [s for s in self._monitored_supporters if s not in self._active_supporters]
+        selected_supporters = self._activation_strategy.select_supporters(len(starving_peers),
+                                                                          inactive_supporters)
+        if len(selected_supporters) == 0:
+            return
+        assert sum([s.get_min_peer() for s in selected_supporters]) <= len(starving_peers)
+
+        # every selected supporter gets its min. number of peers first, the remaining starving
+        # peers fill up the available slots of the selected supporters in the order of selection
+        quotas = [s.get_min_peer() for s in selected_supporters]
+        remaining = len(starving_peers) - sum(quotas)
+        for i, supporter in enumerate(selected_supporters):
+            additional = min(remaining, supporter.available_slots() - quotas[i])
+            quotas[i] += additional
+            remaining -= additional
+
+        peers = iter(starving_peers)
+        for supporter, quota in zip(selected_supporters, quotas):
+            self.activate_supporter(supporter)
+            for _ in xrange(quota):
+                self.assign_peer_to_supporter(next(peers), supporter)
+
+    def _consolidate_active_supporters(self):
+        """Inactivates underused supporters. Supporters stay active until their last supported
+        peer returns to DEFAULT state, so churn leaves many active supporters that serve only a
+        few peers each. Starting with the least loaded supporter, this method migrates all peers
+        of a supporter to other active supporters if their available slots suffice, and
+        inactivates the supporter afterwards. Supporters are never emptied partially, so no
+        supporter that remains active drops below its min_peer value, and the max_peer values
+        are respected by filling only available slots. Peers are migrated to the most loaded
+        supporters first. At most migration_budget peers are migrated per update cycle.
 
-        starving_peers = self.filter_peers_by_state(StarvingState)
-        inactive_supporters = sorted_list_of_inactive_supporters()
-        activate_up_to_index = retrieve_activation_index(starving_peers, inactive_supporters)
-        activate_supporters_and_assign_peers(activate_up_to_index, starving_peers)
+        @return:
+            NoneType
+        """
+        self._freed_supporters_per_cycle = 0
+        self._migrated_peers_per_cycle = 0
+        budget = self._migration_budget
+        if budget <= 0 or len(self._active_supporters) < 2:
+            return
+
+        donors = sorted(self._active_supporters, key=lambda s: (s.assigned_slots(), -s.available_slots()))
+        receivers = sorted(donors, key=lambda s: -s.assigned_slots())
+        free_slots = sum([s.available_slots() for s in donors])
+        freed = set()
+        received = set()
+        for donor in donors:
+            peers = donor.get_supported_peers()
+            if len(peers) > budget:
+                # donors are sorted by their load, so no further donor fits into the budget
+                break
+            if donor in received or free_slots - donor.available_slots() < len(peers):
+                continue
+            targets = [s for s in receivers if s is not donor and s not in freed and s.available_slots() > 0]
+            for peer in peers:
+                while targets[0].available_slots() == 0:
+                    targets.pop(0)
+                self._migrate_peer(peer, donor, targets[0])
+                received.add(targets[0])
+            # the slots of the donor are no longer available
+            free_slots -= donor.get_max_peer()
+            budget -= len(peers)
+            self.inactivate_supporter(donor)
+            freed.add(donor)
+            self._migrated_peers_per_cycle += len(peers)
+
+        self._freed_supporters_per_cycle = len(freed)
+        if len(freed) > 0:
+            self._logger.debug("Consolidation inactivated %i supporters and migrated %i peers" %
+                               (self._freed_supporters_per_cycle, self._migrated_peers_per_cycle))
+
+    def _migrate_peer(self, monitored_peer, source, target):
+        """Moves a supported peer from one active supporter to another one. The peer stays in
+        SUPPORTED state.
+
+        @param monitored_peer:
+            Instance of MonitoredPeer that is currently supported by source
+        @param source:
+            Instance of MonitoredSupporter that currently supports the peer
+        @param target:
+            Instance of MonitoredSupporter with at least one available slot that shall support
+            the peer from now on
+
+        @return:
+            NoneType
+        """
+        assert target.available_slots() > 0
+        source.remove_supported_peer(monitored_peer)
+        target.add_supported_peer(monitored_peer)
+        self._peer_supporters[monitored_peer] = target
+        self._stale_records.add(monitored_peer)
+        self._active_supporters.update(source, source.available_slots())
+        self._active_supporters.update(target, target.available_slots())
 
     def activate_supporter(self, monitored_supporter):
         """Activates the given MonitoredSupporter.
@@ -409,11 +933,11 @@ class SupporterMonitor(object):
         assert monitored_supporter is not None
         assert isinstance(monitored_supporter, MonitoredSupporter)
 
-        if monitored_supporter.assigned_slots() != 0:
+        if monitored_supporter.assigned_slots() != 0 or monitored_supporter in self._active_supporters:
             # already activated
             return
 
-        self._active_supporters.append(monitored_supporter)
+        self._active_supporters.push(monitored_supporter, monitored_supporter.available_slots())
 
     def inactivate_supporter(self, monitored_supporter):
         """Inactivates the given MonitoredSupporter if no peer is currently assigned to it.
@@ -451,7 +975,8 @@ class SupporterMonitor(object):
             return
 
         monitored_supporter.add_supported_peer(monitored_peer)
-        self.order_active_supporters()
+        self._peer_supporters[monitored_peer] = monitored_supporter
+        self._active_supporters.update(monitored_supporter, monitored_supporter.available_slots())
         monitored_peer.receive_msg(MSG_PEER_SUPPORTED)
 
         # update the number of assignments
@@ -471,151 +996,337 @@ class SupporterMonitor(object):
             NoneType
         """
         self._lock.acquire()
-        found = False
         try:
-            for peer in self.get_monitored_peers():
-                if peer_id == peer.get_id():
-                    self._logger.debug("Dispatching %s message to %s" % (msg_type, peer_id))
+            peer = self._monitored_peers.get(peer_id)
+            if peer is not None:
+                self._logger.debug("Dispatching %s message to %s" % (msg_type, peer_id))
+                # the message and the synchronous transition it triggers share a single timestamp
+                self._clock.begin_tick()
+                try:
                     peer.receive_msg(msg_type)
-                    found = True
-                    break
-            if not found:
+                finally:
+                    self._clock.end_tick()
+            else:
                 self._logger.warning("Got an unregistered peer ID: %s" % peer_id)
         finally:
             self._lock.release()
 
+    def received_peer_messages(self, messages):
+        """Handler method for a batch of incoming peer messages. Dispatches the messages to the
+        resp. monitored peers in the given order while holding the lock only once. All messages
+        of the batch share a single timestamp.
+
+        Since the timestamp does not change within a batch, a MSG_SUPPORT_NOT_NEEDED or
+        MSG_PEER_REGISTERED message has no effect if the previous message of the same peer in
+        the batch was of the same type. Such messages are coalesced, i.e. skipped. Support
+        requests are never coalesced, since every request counts towards the sliding window.
+
+        @param messages:
+            Iterable of 2-tuples (message type, peer ID) (cf. received_peer_message)
+
+        @return:
+            The number of messages that were dispatched to a monitored peer
+        """
+        dispatched = 0
+        unregistered = 0
+        self._lock.acquire()
+        try:
+            self._clock.begin_tick()
+            try:
+                monitored_peers = self._monitored_peers
+                last_msg_types = {}
+                for msg_type, peer_id in messages:
+                    if msg_type in COALESCED_MESSAGES and last_msg_types.get(peer_id) == msg_type:
+                        continue
+                    last_msg_types[peer_id] = msg_type
+                    peer = monitored_peers.get(peer_id)
+                    if peer is not None:
+                        peer.receive_msg(msg_type)
+                        dispatched += 1
+                    else:
+                        unregistered += 1
+            finally:
+                self._clock.end_tick()
+        finally:
+            self._lock.release()
+        if unregistered > 0:
+            self._logger.warning("Got %i messages of unregistered peer IDs" % unregistered)
+        return dispatched
+
 
 class MonitorState(object):
     """The MonitorState class provides static methods for summarizing the current state of
-    a SupporterMonitor object. The generated output follows the HTML format and gives information
-    on monitored peers (current state, address, ...) as well as monitored supporters (assigned
-    supportees, ...).
+    a SupporterMonitor object. The generated output follows the HTML or JSON format and gives
+    information on monitored peers (current state, address, ...) as well as monitored supporters
+    (assigned supportees, ...). All output is rendered from the snapshot that the monitor
+    published at the end of its last update cycle (cf. SupporterMonitor.get_snapshot), so it
+    does not synchronize against the monitor. Status pages can be streamed in chunks (cf.
+    iter_monitor_state_as_html) and restricted to a page of the peers.
     """
 
-    def __init__(self):
-        self.statistics = open('supporter_statistics.log', 'w')
+    def __init__(self, statistics_log=None):
+        """@param statistics_log:
+            statistics_log.StatisticsLogWriter instance that writes the statistics log (defaults
+            to a writer with the default settings, which writes to STATISTICS_LOG_PATH)
+        """
+        self.statistics_log = statistics_log or StatisticsLogWriter()
 
-    def __del__(self):
-        if self.statistics is not None:
-            self.statistics.close()
+    def snapshot(self, monitor_snapshot):
+        """Hands the figures of the given monitor snapshot to the statistics log writer, which
+        appends them to the statistics log in the background.
 
-    def snapshot(self, monitor):
-        monitored_peers = monitor.get_monitored_peers()
+        @param monitor_snapshot:
+            monitor_snapshot.MonitorSnapshot instance
 
-        nr_default, nr_watched, nr_starving, nr_supported = 0, 0, 0, 0
+        @return:
+            NoneType
+        """
+        self.statistics_log.submit(monitor_snapshot)
+
+    def _select_peers(monitor_snapshot, offset, limit, state, supporter_id):
+        """Static method which selects a page of the peers of the given snapshot. Peers are
+        selected in the order of their registration, so peers that register between the reads
+        of two pages do not shift the peers of later pages.
+
+        @param monitor_snapshot:
+            monitor_snapshot.MonitorSnapshot instance
+        @param offset:
+            Number of matching peers that are skipped
+        @param limit:
+            Max. number of peers on the page. NoneType selects all remaining peers.
+        @param state:
+            Name of a state (e.g. 'Starving'). Only peers in this state are selected. NoneType
+            selects peers in all states.
+        @param supporter_id:
+            Only peers that are assigned to the supporter with this ID are selected. NoneType
+            selects peers independent of their supporter.
 
-        for mp in monitored_peers:
-            state = mp.get_state()
-            if isinstance(state, DefaultState):
-                nr_default += 1
-            elif isinstance(state, WatchedState):
-                nr_watched += 1
-            elif isinstance(state, StarvingState):
-                nr_starving += 1
-            elif isinstance(state, SupportedState):
-                nr_supported += 1
+        @return:
+            2-tuple of an iterator over the selected PeerRecord instances and a callable that
+            returns the offset of the next page once the iterator is exhausted (NoneType if
+            there are no further matching peers)
+        """
+        peers = iter(monitor_snapshot.peers)
+        if state is not None:
+            peers = (peer for peer in peers if peer.state == state)
+        if supporter_id is not None:
+            peers = (peer for peer in peers if peer.supporter_id == supporter_id)
+        peers = islice(peers, offset, None)
+        if limit is None:
+            return peers, lambda: None
+        remaining = [True]
+
+        def page():
+            for peer in islice(peers, limit):
+                yield peer
+            for _ in peers:
+                return
+            remaining[0] = False
 
-        dispatch = "%1.2f\t%i\t%i\t%i\t%i" % (time.time(), nr_default, nr_watched, nr_starving, nr_supported)
-        dispatch = dispatch.encode("utf-8")
+        return page(), lambda: offset + limit if remaining[0] else None
 
-        self.statistics.write(dispatch)
-        self.statistics.write('\n')
-        self.statistics.flush()
+    _select_peers = staticmethod(_select_peers)
 
-    def _monitored_peers_to_html(monitor):
-        """Static method which generates HTML-formatted information on the state of all
-        peers a SupporterMonitor currently watches.
+    def _batches(records):
+        """Static method which groups the given records into lists of STATUS_PAGE_CHUNK_ROWS
+        records, each of which gets rendered into a single chunk.
 
-        @param monitor:
-            Represents the instance of SupporterMonitor for which the state summary shall be
-            generated
+        @return:
+            Iterator over lists of records
+        """
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) == STATUS_PAGE_CHUNK_ROWS:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    _batches = staticmethod(_batches)
+
+    def _monitored_peers_to_html(peers, next_offset):
+        """Static method which generates HTML-formatted information on the state of the given
+        peers of a snapshot.
+
+        @param peers:
+            Iterator over the PeerRecord instances that shall be rendered (cf. _select_peers)
+        @param next_offset:
+            Callable that returns the offset of the next page once the peers were rendered
 
         @return:
-            HTML representation containing state information on all peers that are currently
-            watched by the given SupporterMonitor instance
+            Iterator over chunks of the HTML representation of the given peers
         """
-        monitored_peers = monitor.get_monitored_peers()
+        yield '<h3>Monitored Peers</h3>\n'
+        header = '<table border=1 cellspacing=1>\n' \
+                 '<tr><th>ID</th><th>Address</th><th>Current State</th><th>Last received message</th>' \
+                 '<th># Support Requests</th></tr>\n'
+        empty = True
+        for batch in MonitorState._batches(peers):
+            if empty:
+                yield header
+                empty = False
+            yield ''.join(['<tr>\n<td>%s</td><td>%s:%i</td><td>%s</td><td>%s</td><td>%i</td></tr>\n' %
+                           (peer.id, peer.ip, peer.port, peer.state, peer.last_received_msg, peer.support_requests)
+                           for peer in batch])
+        if empty:
+            yield 'Nothing to report yet.\n'
+        else:
+            yield '</table>\n'
+        offset = next_offset()
+        if offset is not None:
+            yield '<p>More peers are available from offset %i.</p>\n' % offset
+
+    _monitored_peers_to_html = staticmethod(_monitored_peers_to_html)
+
+    def _monitored_supporters_to_html(supporters):
+        """Static method which generates HTML-formatted output on the state of the given
+        supporter servers of a snapshot.
 
-        html_string = '<h3>Monitored Peers</h3>\n'
+        @param supporters:
+            Sequence of the SupporterRecord instances that shall be rendered
 
-        if len(monitored_peers) == 0:
-            html_string += 'Nothing to report yet.\n'
+        @return:
+            Iterator over chunks of the HTML representation of the given supporters
+        """
+        yield '<h3>Monitored Supporters</h3>\n'
+
+        if len(supporters) == 0:
+            yield 'Nothing to report yet.\n'
         else:
+            yield '<table border=1 cellspacing=1>\n' \
+                  '<tr><th>ID</th><th>Address</th><th># Supportees</th><th># Slots Available</th></tr>\n'
+            for batch in MonitorState._batches(supporters):
+                yield ''.join(['<tr>\n<td>%s</td><td>%s</td><td>%i</td><td>%i</td></tr>\n' %
+                               (str(supporter.id), str(supporter.addr), supporter.assigned_slots,
+                                supporter.available_slots) for supporter in batch])
+            yield '</table>\n'
 
-            html_string += '<table border=1 cellspacing=1>\n'
-            html_string += '<tr><th>ID</th><th>Address</th><th>Current State</th><th>Last received message</th><th># Support Requests</th></tr>\n'
-            for peer in monitor.get_monitored_peers():
-                html_string += '<tr>\n'
-                html_string += '<td>%s</td>' % peer.get_id()
-                html_string += '<td>%s:%i</td>' % (peer.get_ip(), peer.get_port())
-                html_string += '<td>%s</td>' % str(peer.get_state())
-                html_string += '<td>%s</td>' % peer.get_last_received_msg()
-                html_string += '<td>%i</td>' % peer.get_number_of_support_requests()
-                html_string += '</tr>\n'
-            html_string += '<table>\n'
+    _monitored_supporters_to_html = staticmethod(_monitored_supporters_to_html)
 
-        return html_string
+    def _select_supporters(monitor_snapshot, supporter_id):
+        """Static method which selects the supporters of the given snapshot that are rendered
+        (all supporters, or only the one with the given ID if supporter_id is not NoneType).
 
-    _monitored_peers_to_html = staticmethod(_monitored_peers_to_html)
+        @return:
+            Sequence of SupporterRecord instances
+        """
+        if supporter_id is None:
+            return monitor_snapshot.supporters
+        return [supporter for supporter in monitor_snapshot.supporters if supporter.id == supporter_id]
+
+    _select_supporters = staticmethod(_select_supporters)
 
-    def _monitored_supporters_to_html(monitor):
-        """Static method which generates HTML-formatted output on the state of all supporter
-        servers a SupporterMonitor currently watches.
+    def iter_monitor_state_as_html(monitor, offset=0, limit=None, state=None, supporter_id=None):
+        """Static method which generates HTML-formatted output on the state of the watched peers
+        and supporters of the given SupporterMonitor instance at the end of its last update cycle.
+        The output is generated lazily in chunks of STATUS_PAGE_CHUNK_ROWS table rows, so that it
+        can be streamed to the client without building the whole page in memory. This method
+        renders the published snapshot of the monitor and can thus be called by client code in a
+        thread-safe manner without blocking the monitor.
 
         @param monitor:
-            Represents the instance of SupporterMonitor for which the state summary shall be
-            generated
+            Represents the instance of SupporterMonitor for which the
+            state summary shall be generated
+        @param offset:
+            Number of matching peers that are skipped
+        @param limit:
+            Max. number of peers that are rendered. NoneType renders all matching peers. If there
+            are further matching peers, the page ends with the offset of the next page.
+        @param state:
+            Name of a state (e.g. 'Starving'). Only peers in this state are rendered.
+        @param supporter_id:
+            Only peers that are assigned to the supporter with this ID (and only this supporter)
+            are rendered.
 
         @return:
-            HTML representation containing state information on all supporter servers that the
-            given SupporterMonitor instance currently watches
+            Iterator over chunks (strings) of the HTML representation of the above mentioned
+            state information
         """
-        monitored_supporters = monitor.get_monitored_supporters()
+        assert isinstance(monitor, SupporterMonitor)
 
-        html_string = '<h3>Monitored Supporters</h3>\n'
+        monitor_snapshot = monitor.get_snapshot()
+        peers, next_offset = MonitorState._select_peers(monitor_snapshot, offset, limit, state, supporter_id)
+        yield '<h2>Supporter Monitor State</h2>\n'
+        for chunk in MonitorState._monitored_peers_to_html(peers, next_offset):
+            yield chunk
+        for chunk in MonitorState._monitored_supporters_to_html(
+                MonitorState._select_supporters(monitor_snapshot, supporter_id)):
+            yield chunk
 
-        if len(monitored_supporters) == 0:
-            html_string += 'Nothing to report yet.\n'
-        else:
+    iter_monitor_state_as_html = staticmethod(iter_monitor_state_as_html)
 
-            html_string += '<table border=1 cellspacing=1>\n'
-            html_string += '<tr><th>ID</th><th>Address</th><th># Supportees</th><th># Slots Available</th></tr>\n'
-            for supporter in monitor.get_monitored_supporters():
-                html_string += '<tr>\n'
-                html_string += '<td>%s</td>' % str(supporter.get_id())
-                html_string += '<td>%s</td>' % str(supporter.get_addr())
-                html_string += '<td>%i</td>' % supporter.assigned_slots()
-                html_string += '<td>%i</td>' % supporter.available_slots()
-                html_string += '</tr>\n'
-            html_string += '</table>\n'
+    def retrieve_monitor_state_as_html(monitor, offset=0, limit=None, state=None, supporter_id=None):
+        """Static method which generates HTML-formatted output on the state of the watched peers
+        and supporters of the given SupporterMonitor instance at the end of its last update cycle
+        as a single string (cf. iter_monitor_state_as_html).
 
-        return html_string
+        @param monitor:
+            Represents the instance of SupporterMonitor for which the
+            state summary shall be generated
 
-    _monitored_supporters_to_html = staticmethod(_monitored_supporters_to_html)
+        @return:
+            HTML representation of the above mentioned state information
+        """
+        return ''.join(MonitorState.iter_monitor_state_as_html(monitor, offset, limit, state, supporter_id))
 
-    def retrieve_monitor_state_as_html(monitor):
-        """Static method which generates HTML-formatted output on the current state of all
-        watched peers and supporters of the given SupporterMonitor instance. This method
-        synchronizes against the SupporterMonitor instance and can thus be called by
-        client code in a thread-safe manner.
+    retrieve_monitor_state_as_html = staticmethod(retrieve_monitor_state_as_html)
+
+    def iter_monitor_state_as_json(monitor, offset=0, limit=None, state=None, supporter_id=None):
+        """Static method which generates a JSON document on the state of the watched peers and
+        supporters of the given SupporterMonitor instance at the end of its last update cycle.
+        Peers are selected and the output is generated in chunks as described for
+        iter_monitor_state_as_html.
+
+        The document is an object with the fields of monitor_snapshot.MonitorSnapshot, where
+        peers and supporters are represented as objects with the fields of PeerRecord and
+        SupporterRecord. The field next_offset holds the offset of the next page (null if there
+        are no further matching peers).
 
         @param monitor:
             Represents the instance of SupporterMonitor for which the
             state summary shall be generated
 
         @return:
-            HTML representation of the above mentioned state information
+            Iterator over chunks (strings) of the JSON representation of the above mentioned
+            state information
         """
         assert isinstance(monitor, SupporterMonitor)
 
-        monitor._lock.acquire()
-        html_string = ''
-        try:
-            html_string += '<h2>Supporter Monitor State</h2>\n'
-            html_string += MonitorState._monitored_peers_to_html(monitor)
-            html_string += MonitorState._monitored_supporters_to_html(monitor)
-        finally:
-            monitor._lock.release()
-        return html_string
+        monitor_snapshot = monitor.get_snapshot()
+        peers, next_offset = MonitorState._select_peers(monitor_snapshot, offset, limit, state, supporter_id)
+        yield '{"version": %s, "created": %s, "state_counts": %s, "rpcs_per_cycle": %s, ' \
+              '"freed_supporters_per_cycle": %s, "migrated_peers_per_cycle": %s, "peers": [' % \
+              tuple([json.dumps(value) for value in (monitor_snapshot.version, monitor_snapshot.created,
+                                                     monitor_snapshot.state_counts._asdict(),
+                                                     monitor_snapshot.rpcs_per_cycle,
+                                                     monitor_snapshot.freed_supporters_per_cycle,
+                                                     monitor_snapshot.migrated_peers_per_cycle)])
+        # a whole batch is encoded at once, which is considerably faster than encoding every
+        # record on its own. the brackets of the encoded list are stripped.
+        separator = ''
+        for batch in MonitorState._batches(peers):
+            yield separator + json.dumps([dict(zip(PeerRecord._fields, peer)) for peer in batch])[1:-1]
+            separator = ', '
+        yield '], "supporters": ['
+        yield json.dumps([dict(zip(SupporterRecord._fields, supporter))
+                          for supporter in MonitorState._select_supporters(monitor_snapshot, supporter_id)])[1:-1]
+        yield '], "next_offset": %s}' % json.dumps(next_offset())
+
+    iter_monitor_state_as_json = staticmethod(iter_monitor_state_as_json)
+
+    def retrieve_monitor_state_as_json(monitor, offset=0, limit=None, state=None, supporter_id=None):
+        """Static method which generates a JSON document on the state of the watched peers and
+        supporters of the given SupporterMonitor instance at the end of its last update cycle as
+        a single string (cf. iter_monitor_state_as_json).
+
+        @param monitor:
+            Represents the instance of SupporterMonitor for which the
+            state summary shall be generated
+
+        @return:
+            JSON representation of the above mentioned state information
+        """
+        return ''.join(MonitorState.iter_monitor_state_as_json(monitor, offset, limit, state, supporter_id))
 
-    retrieve_monitor_state_as_html = staticmethod(retrieve_monitor_state_as_html)
\ No newline at end of file
+    retrieve_monitor_state_as_json = staticmethod(retrieve_monitor_state_as_json)
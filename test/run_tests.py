@@ -6,11 +6,33 @@ import unittest
 
 from test_monitored_subjects import TestMonitoredPeer, TestMonitoredSupporter
 from test_supporter_monitor import TestSupporterMonitor
+from test_supporter_adapter import TestSupporteeListDispatcher
+from test_scheduler import TestFixedRateScheduler
+from test_state_machine import TestTableTransitionEngine
+from test_peer_table import TestPeerTable
+from test_clock import TestClock
+from test_priority_queue import TestIndexedMaxHeap
+from test_activation import TestActivationStrategies
+from test_actor_monitor import TestActorSupporterMonitor
+from test_async_monitor import TestEventLoop, TestAsyncSupporteeListDispatcher, TestAsyncSupporterMonitor
+from test_statistics_log import TestStatisticsLogWriter
 
 def collect_testsuites():
     suites = [unittest.TestLoader().loadTestsFromTestCase(TestMonitoredPeer),
               unittest.TestLoader().loadTestsFromTestCase(TestMonitoredSupporter),
-              unittest.TestLoader().loadTestsFromTestCase(TestSupporterMonitor)]
+              unittest.TestLoader().loadTestsFromTestCase(TestSupporterMonitor),
+              unittest.TestLoader().loadTestsFromTestCase(TestSupporteeListDispatcher),
+              unittest.TestLoader().loadTestsFromTestCase(TestFixedRateScheduler),
+              unittest.TestLoader().loadTestsFromTestCase(TestTableTransitionEngine),
+              unittest.TestLoader().loadTestsFromTestCase(TestPeerTable),
+              unittest.TestLoader().loadTestsFromTestCase(TestClock),
+              unittest.TestLoader().loadTestsFromTestCase(TestIndexedMaxHeap),
+              unittest.TestLoader().loadTestsFromTestCase(TestActivationStrategies),
+              unittest.TestLoader().loadTestsFromTestCase(TestActorSupporterMonitor),
+              unittest.TestLoader().loadTestsFromTestCase(TestEventLoop),
+              unittest.TestLoader().loadTestsFromTestCase(TestAsyncSupporteeListDispatcher),
+              unittest.TestLoader().loadTestsFromTestCase(TestAsyncSupporterMonitor),
+              unittest.TestLoader().loadTestsFromTestCase(TestStatisticsLogWriter)]
     return suites
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+"""This module provides local stand-in XML-RPC servers that mimic the interface of supporter
+servers. They are used to test the supporter adapters against healthy, slow and dead supporters."""
+
+import socket
+import SocketServer
+import threading
+import time
+
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+from supporter.clock import DEFAULT_CLOCK
+from supporter.monitored_subjects import MonitoredSupporter
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    """Request handler that keeps HTTP/1.1 connections open and keeps track of them, so that
+    tests are able to drop all open connections."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        SimpleXMLRPCRequestHandler.setup(self)
+        self.server.open_connections.add(self.connection)
+
+    def finish(self):
+        self.server.open_connections.discard(self.connection)
+        SimpleXMLRPCRequestHandler.finish(self)
+
+
+class ThreadingXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self, addr, keep_alive):
+        SimpleXMLRPCServer.__init__(self, addr, logRequests=False,
+                                    requestHandler=keep_alive and KeepAliveRequestHandler or SimpleXMLRPCRequestHandler)
+        self.open_connections = set()
+
+    def handle_error(self, request, client_address):
+        # clients close connections to slow supporters on timeouts, which is expected
+        pass
+
+
+class StandInSupporter(object):
+    """XML-RPC server on the loopback interface that answers is_alive, receive_peer_list and
+    receive_peer_delta calls after a configurable delay. It records all received supportee lists
+    and deltas and maintains the resulting supportee list. Legacy supporters (deltas=False) only
+    understand receive_peer_list(peer_list)."""
+
+    def __init__(self, supporter_id, delay=0, min_peer=1, max_peer=5, keep_alive=True, deltas=True):
+        self.delay = delay
+        self.received_peer_lists = []
+        self.received_deltas = []
+        self.peers = set()
+        self.version = None
+        self._server = ThreadingXMLRPCServer(('127.0.0.1', 0), keep_alive)
+        self._server.register_function(self.is_alive, 'is_alive')
+        if deltas:
+            self._server.register_function(self.receive_peer_list, 'receive_peer_list')
+            self._server.register_function(self.receive_peer_delta, 'receive_peer_delta')
+        else:
+            self._server.register_function(self.receive_legacy_peer_list, 'receive_peer_list')
+        port = self._server.socket.getsockname()[1]
+        # supporter adapters contact the XML-RPC interface at the supporter's port + 1
+        self.supporter = MonitoredSupporter(supporter_id, ('127.0.0.1', port - 1), min_peer, max_peer)
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def is_alive(self):
+        time.sleep(self.delay)
+        return True
+
+    def receive_peer_list(self, peer_list, version):
+        time.sleep(self.delay)
+        self.received_peer_lists.append(peer_list)
+        self.peers = set([tuple(peer) for peer in peer_list])
+        self.version = version
+        return True
+
+    def receive_legacy_peer_list(self, peer_list):
+        time.sleep(self.delay)
+        self.received_peer_lists.append(peer_list)
+        self.peers = set([tuple(peer) for peer in peer_list])
+        return True
+
+    def receive_peer_delta(self, version, added, removed):
+        time.sleep(self.delay)
+        if self.version is None or version != self.version + 1:
+            return False
+        self.received_deltas.append((version, added, removed))
+        self.peers.update([tuple(peer) for peer in added])
+        self.peers.difference_update([tuple(peer) for peer in removed])
+        self.version = version
+        return True
+
+    def drop_connections(self):
+        """Closes all connections that clients keep open to this supporter."""
+        for connection in list(self._server.open_connections):
+            connection.shutdown(socket.SHUT_RDWR)
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.drop_connections()
+
+
+class DeadSupporter(object):
+    """Represents a supporter whose XML-RPC port refuses all connections."""
+
+    def __init__(self, supporter_id, min_peer=1, max_peer=5):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.supporter = MonitoredSupporter(supporter_id, ('127.0.0.1', port - 1), min_peer, max_peer)
+
+    def shutdown(self):
+        pass
+
+
+class BlackHoleSupporter(object):
+    """Represents a supporter that accepts connections on its XML-RPC port, but never answers."""
+
+    def __init__(self, supporter_id, min_peer=1, max_peer=5):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        port = self._sock.getsockname()[1]
+        self.supporter = MonitoredSupporter(supporter_id, ('127.0.0.1', port - 1), min_peer, max_peer)
+
+    def shutdown(self):
+        self._sock.close()
+
+
+class StubMonitor(object):
+    """Provides the part of the SupporterMonitor interface the supporter adapters rely on."""
+
+    def __init__(self, supporters):
+        self._supporters = supporters
+
+    def get_monitored_supporters(self):
+        return self._supporters
+
+    def get_clock(self):
+        return DEFAULT_CLOCK
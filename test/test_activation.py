@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import itertools
+import random
+import time
+import unittest
+
+from supporter.activation import BranchAndBoundActivationStrategy, GreedyActivationStrategy, \
+    LargestFirstActivationStrategy
+from supporter.monitored_subjects import MonitoredSupporter
+
+
+def create_supporters(limits):
+    """@return:
+        List of MonitoredSupporter instances with the given (min_peer, max_peer) tuples
+    """
+    return [MonitoredSupporter(i, ('10.1.%i.%i' % (i / 256, i % 256), 1024), min_peer, max_peer)
+            for i, (min_peer, max_peer) in enumerate(limits)]
+
+
+def evaluate(starving_peers, selection):
+    """@return:
+        2-tuple of the number of covered peers and the number of selected supporters
+    """
+    return min(starving_peers, sum([s.available_slots() for s in selection])), len(selection)
+
+
+def brute_force(starving_peers, supporters):
+    """@return:
+        2-tuple of the max. number of covered peers and the min. number of supporters required for it
+    """
+    best = (0, 0)
+    for count in xrange(1, len(supporters) + 1):
+        for selection in itertools.combinations(supporters, count):
+            if sum([s.get_min_peer() for s in selection]) <= starving_peers:
+                coverage, count = evaluate(starving_peers, selection)
+                if coverage > best[0] or (coverage == best[0] and count < best[1]):
+                    best = (coverage, count)
+    return best
+
+
+class TestActivationStrategies(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(4711)
+
+    def tearDown(self):
+        pass
+
+    def assertFeasible(self, starving_peers, supporters, selection):
+        self.assertEquals(len(selection), len(set(selection)))
+        self.assertTrue(set(selection) <= set(supporters))
+        self.assertTrue(sum([s.get_min_peer() for s in selection]) <= starving_peers)
+
+    def random_limits(self, count):
+        limits = []
+        for _ in xrange(count):
+            min_peer = self.rnd.randint(1, 6)
+            limits.append((min_peer, self.rnd.randint(min_peer, 12)))
+        return limits
+
+    def testBranchAndBoundFindsOptimum(self):
+        """Compares the branch and bound strategy against an exhaustive search on small instances."""
+        strategy = BranchAndBoundActivationStrategy(time_budget=10)
+        for _ in xrange(200):
+            supporters = create_supporters(self.random_limits(self.rnd.randint(0, 8)))
+            starving_peers = self.rnd.randint(1, 40)
+            selection = strategy.select_supporters(starving_peers, supporters)
+            self.assertFeasible(starving_peers, supporters, selection)
+            self.assertEquals(brute_force(starving_peers, supporters), evaluate(starving_peers, selection))
+        self.assertEquals(0, strategy.get_exhausted_budgets())
+
+    def testHeuristicsAreFeasible(self):
+        """Checks if the greedy and the largest first strategy only select supporters that can be activated."""
+        for strategy in [GreedyActivationStrategy(), LargestFirstActivationStrategy()]:
+            for _ in xrange(200):
+                supporters = create_supporters(self.random_limits(self.rnd.randint(0, 20)))
+                starving_peers = self.rnd.randint(1, 40)
+                self.assertFeasible(starving_peers, supporters,
+                                    strategy.select_supporters(starving_peers, supporters))
+
+    def testGreedyActivationIsNotOptimal(self):
+        """Checks an instance on which the greedy strategy leaves peers starving."""
+        supporters = create_supporters([(1, 1), (1, 1), (5, 5)])
+        self.assertEquals((2, 2), evaluate(5, GreedyActivationStrategy().select_supporters(5, supporters)))
+        self.assertEquals([supporters[2]], BranchAndBoundActivationStrategy().select_supporters(5, supporters))
+
+    def testLargestFirstIsNotOptimal(self):
+        """Checks an instance on which branch and bound improves the solution of the largest first strategy."""
+        supporters = create_supporters([(4, 10), (3, 3), (3, 3)])
+        self.assertEquals((6, 1), evaluate(6, LargestFirstActivationStrategy().select_supporters(6, supporters)))
+        self.assertEquals((6, 1), evaluate(6, BranchAndBoundActivationStrategy().select_supporters(6, supporters)))
+        supporters = create_supporters([(4, 5), (3, 3), (3, 3)])
+        self.assertEquals((5, 1), evaluate(6, LargestFirstActivationStrategy().select_supporters(6, supporters)))
+        self.assertEquals((6, 2), evaluate(6, BranchAndBoundActivationStrategy().select_supporters(6, supporters)))
+
+    def testTimeBudgetIsRespected(self):
+        """Checks if the branch and bound strategy returns a feasible selection within its time budget."""
+        strategy = BranchAndBoundActivationStrategy(time_budget=0.01)
+        # supporters only supply an even number of peers, so the search cannot prove that it
+        # found the best coverage of an odd number of peers early and has to give up
+        limits = []
+        for _ in xrange(300):
+            slots = 2 * self.rnd.randint(5, 20)
+            limits.append((slots, slots))
+        supporters = create_supporters(limits)
+        ts = time.time()
+        selection = strategy.select_supporters(997, supporters)
+        self.assertTrue(time.time() - ts < 0.5)
+        self.assertFeasible(997, supporters, selection)
+        heuristic = LargestFirstActivationStrategy().select_supporters(997, supporters)
+        self.assertTrue(evaluate(997, selection) >= (evaluate(997, heuristic)[0], 0))
+        self.assertEquals(1, strategy.get_exhausted_budgets())
+
+    def testNoCandidates(self):
+        """Checks if no supporter is selected if none of them can be activated."""
+        supporters = create_supporters([(5, 10), (6, 6)])
+        for strategy in [GreedyActivationStrategy(), LargestFirstActivationStrategy(),
+                         BranchAndBoundActivationStrategy()]:
+            self.assertEquals([], strategy.select_supporters(4, supporters))
+            self.assertEquals([], strategy.select_supporters(4, []))
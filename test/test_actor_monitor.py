@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import threading
+import time
+import unittest
+
+import supporter.shared as shared
+
+from supporter.actor_monitor import ActorSupporterMonitor
+from supporter.clock import ManualClock
+from supporter.supporter_monitor import MonitorState
+from supporter.state_machine import DefaultState, StarvingState, SupportedState
+from test_supporter_monitor import MockSupporteeListDispatcher
+
+TEST_IS_ALIVE_TIMEOUT_BOUND = 2
+TEST_PEER_TIMEOUT_BOUND = 1
+
+
+class TestActorSupporterMonitor(unittest.TestCase):
+    def setUp(self):
+        self.monitor = None
+
+    def tearDown(self):
+        if self.monitor is not None:
+            self.monitor.close()
+
+    def create_monitor(self, **kwargs):
+        self.monitor = ActorSupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                                             dispatcher_factory=MockSupporteeListDispatcher, **kwargs)
+        return self.monitor
+
+    def waitFor(self, condition, timeout=5.0):
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertTrue(time.time() < deadline)
+            time.sleep(0.01)
+
+    def testMessagesAreQueuedUntilProcessed(self):
+        """Checks if messages only change the state of a peer once they have been processed."""
+        monitor = self.create_monitor()
+        monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        for _ in xrange(shared.PEER_REQUIRED_MSGS):
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'UNKNOWN')
+        self.assertEquals(shared.PEER_REQUIRED_MSGS + 1, monitor.get_queue_depth())
+        self.assertEquals(1, monitor.count_peers_by_state(DefaultState))
+
+        self.assertEquals(2, monitor.process_queued_messages(2))
+        self.assertEquals(shared.PEER_REQUIRED_MSGS - 1, monitor.process_queued_messages())
+        self.assertEquals(0, monitor.get_queue_depth())
+        self.assertEquals(shared.PEER_REQUIRED_MSGS + 1, monitor.get_processed_messages())
+        self.assertEquals(shared.PEER_REQUIRED_MSGS + 1, monitor.get_max_queue_depth())
+        self.assertEquals(1, monitor.count_peers_by_state(StarvingState))
+
+    def testMessagesKeepTheirArrivalTimestamps(self):
+        """Checks if queued messages are evaluated against the time of their arrival."""
+        clock = ManualClock()
+        monitor = self.create_monitor(clock=clock)
+        monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        monitor.register_monitored_peer('XXX---34920G', '192.168.2.51', 10001, shared.PEER_TYPE_LEECHER)
+        for _ in xrange(shared.PEER_REQUIRED_MSGS):
+            # the requests of F are too far apart, those of G arrive at the same time
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+            clock.advance(shared.PEER_STATUS_APPROVAL_TIME)
+        monitor.received_peer_messages([(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920G')] * shared.PEER_REQUIRED_MSGS)
+        monitor.process_queued_messages()
+        self.assertFalse(isinstance(monitor.get_monitored_peer('XXX---34920F').get_state(), StarvingState))
+        self.assertTrue(isinstance(monitor.get_monitored_peer('XXX---34920G').get_state(), StarvingState))
+
+    def testFullQueueDropsMessages(self):
+        """Checks if messages are dropped once the queue is full while the owner thread is not running."""
+        monitor = self.create_monitor(queue_capacity=5)
+        for _ in xrange(3):
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertEquals(2, monitor.received_peer_messages([(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')] * 3))
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertEquals(5, monitor.get_queue_depth())
+        self.assertEquals(2, monitor.get_dropped_messages())
+
+    def testFullQueueBlocksStateChangingMessages(self):
+        """Checks if producers of state-changing messages wait for space in the full queue instead
+        of dropping their messages."""
+        monitor = self.create_monitor(queue_capacity=2)
+        peers = [('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER) for i in xrange(20)]
+        monitor.register_monitored_peers(peers)
+        monitor.start()
+        for id, _, _, _ in peers:
+            for _ in xrange(shared.PEER_REQUIRED_MSGS):
+                monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, id)
+        self.assertEquals(10, monitor.received_peer_messages([(shared.MSG_SUPPORT_NOT_NEEDED, id)
+                                                              for id, _, _, _ in peers[:10]]))
+        self.waitFor(lambda: monitor.get_queue_depth() == 0)
+        self.assertEquals(0, monitor.get_dropped_messages())
+        self.assertEquals(20 * shared.PEER_REQUIRED_MSGS + 10, monitor.get_processed_messages())
+        self.assertEquals(10, monitor.call_synchronized(monitor.count_peers_by_state, StarvingState))
+
+    def testFullQueueDropsMessagesAfterTimeout(self):
+        """Checks if state-changing messages are dropped if the queue stays full for the enqueue
+        timeout and if other messages are dropped right away."""
+        monitor = self.create_monitor(queue_capacity=1, enqueue_timeout=0.1)
+        monitor.start()
+        entered = threading.Event()
+        released = threading.Event()
+
+        def stall():
+            entered.set()
+            released.wait()
+
+        # keeps the owner thread busy, so that it does not make space in the queue
+        stalled = threading.Thread(target=monitor.call_synchronized, args=(stall,))
+        stalled.start()
+        entered.wait()
+        try:
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+            ts = time.time()
+            monitor.received_peer_message(shared.MSG_PEER_SUPPORTED, 'XXX---34920F')
+            self.assertEquals(1, monitor.get_dropped_messages())
+            monitor.received_peer_message(shared.MSG_SUPPORT_NOT_NEEDED, 'XXX---34920F')
+            self.assertTrue(time.time() - ts >= 0.1)
+            self.assertEquals(2, monitor.get_dropped_messages())
+            self.assertEquals(1, monitor.get_queue_depth())
+        finally:
+            released.set()
+            stalled.join()
+
+    def testOwnerThreadProcessesMessagesAndUpdates(self):
+        """Checks if the owner thread processes messages of concurrent producers and assigns
+        starving peers to supporters."""
+        monitor = self.create_monitor(update_interval=0.05)
+        monitor.register_monitored_supporter(1, ('192.168.2.10', 5000), 1, 100)
+        monitor.start()
+        self.assertTrue(monitor.is_running())
+        peers = [('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER) for i in xrange(80)]
+        self.assertEquals(80, len([mp for mp in monitor.register_monitored_peers(peers) if mp is not None]))
+
+        def produce(offset):
+            for i in xrange(offset, len(peers), 8):
+                for _ in xrange(shared.PEER_REQUIRED_MSGS):
+                    monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, peers[i][0])
+
+        producers = [threading.Thread(target=produce, args=(i,)) for i in xrange(8)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+
+        self.waitFor(lambda: monitor.call_synchronized(monitor.count_peers_by_state, SupportedState) == 80)
+        self.assertEquals(80 * shared.PEER_REQUIRED_MSGS, monitor.get_processed_messages())
+        self.assertEquals(0, monitor.get_dropped_messages())
+        self.assertEquals(1, len(monitor.call_synchronized(monitor.get_active_supporters)))
+        self.assertTrue('XXX---79' in MonitorState.retrieve_monitor_state_as_html(monitor))
+        monitor.stop()
+        self.assertFalse(monitor.is_running())
+
+    def testCallSynchronizedRaisesExceptions(self):
+        """Checks if exceptions of functions that are called on the owner thread are re-raised."""
+        monitor = self.create_monitor()
+        monitor.start()
+        owner = monitor.call_synchronized(threading.currentThread)
+        self.assertFalse(owner is threading.currentThread())
+        self.assertRaises(ZeroDivisionError, monitor.call_synchronized, lambda: 1 / 0)
+        monitor.stop()
+        self.assertTrue(monitor.call_synchronized(threading.currentThread) is threading.currentThread())
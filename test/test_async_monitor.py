@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import threading
+import time
+import unittest
+
+from supporter.async_monitor import AsyncSupporteeListDispatcher, AsyncSupporterMonitor, AsyncXmlRpcProxy, \
+    EventLoop
+from supporter.monitored_subjects import MonitoredPeer
+from supporter.state_machine import SupportedState
+
+import supporter.shared as shared
+
+from stand_in_supporters import StandInSupporter, DeadSupporter, BlackHoleSupporter, StubMonitor
+
+TEST_TIMEOUT = 0.3
+TEST_DEADLINE = 0.8
+TEST_IS_ALIVE_TIMEOUT_BOUND = 2
+TEST_PEER_TIMEOUT_BOUND = 1
+
+
+class TestEventLoop(unittest.TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def testTimers(self):
+        """Tests if timers fire in the order of their deadlines and if cancelled timers do not fire."""
+        fired = []
+        self.loop.call_later(0.02, fired.append, 2)
+        self.loop.call_later(0.01, fired.append, 1)
+        timer = self.loop.call_later(0.015, fired.append, 3)
+        self.loop.cancel(timer)
+        self.loop.run(until=lambda: len(fired) == 2, timeout=1)
+        self.assertEquals([1, 2], fired)
+        self.assertFalse(self.loop.is_running())
+
+    def testCallsFromOtherThreads(self):
+        """Tests if other threads can schedule calls on the loop thread and stop the loop."""
+        threads = []
+
+        def submit():
+            time.sleep(0.05)
+            self.loop.call_soon_threadsafe(lambda: threads.append(threading.currentThread()))
+            time.sleep(0.05)
+            self.loop.stop()
+
+        thread = threading.Thread(target=submit)
+        thread.start()
+        ts = time.time()
+        self.loop.run(timeout=5)
+        thread.join()
+        # the loop must not wait for its poll timeout
+        self.assertTrue(time.time() - ts < 0.5)
+        self.assertEquals([threading.currentThread()], threads)
+
+        # a stop request that precedes run is not lost
+        ts = time.time()
+        self.loop.stop()
+        self.loop.run(timeout=5)
+        self.assertTrue(time.time() - ts < 0.5)
+
+
+class TestAsyncSupporteeListDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.stand_ins = []
+        self.loop = EventLoop()
+
+    def tearDown(self):
+        self.loop.close()
+        for stand_in in self.stand_ins:
+            stand_in.shutdown()
+
+    def create_dispatcher(self, stand_ins, **kwargs):
+        self.stand_ins.extend(stand_ins)
+        monitor = StubMonitor([s.supporter for s in stand_ins])
+        dispatcher = AsyncSupporteeListDispatcher(monitor, self.loop, **kwargs)
+        for stand_in in stand_ins:
+            dispatcher.register_proxy(stand_in.supporter)
+        return dispatcher
+
+    def assign_peer(self, stand_in, peer_id='XXX---34920F'):
+        peer = MonitoredPeer(peer_id, '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        stand_in.supporter.add_supported_peer(peer)
+        return peer
+
+    def testDispatchWithSlowAndDeadSupporters(self):
+        """Tests if slow, black-holed and dead supporters are reported as dead within the deadline."""
+        healthy = StandInSupporter(1)
+        slow = StandInSupporter(2, delay=TEST_TIMEOUT * 2)
+        black_hole = BlackHoleSupporter(3)
+        dead = DeadSupporter(4)
+        dispatcher = self.create_dispatcher([healthy, slow, black_hole, dead], timeout=TEST_TIMEOUT,
+                                            deadline=TEST_DEADLINE)
+        self.assign_peer(healthy)
+        self.assign_peer(slow)
+
+        ts = time.time()
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertTrue(time.time() - ts < TEST_DEADLINE + 0.1)
+
+        self.assertEquals([[['XXX---34920F', '192.168.2.50', 10000]]], healthy.received_peer_lists)
+        self.assertEquals((healthy.supporter,), result.contacted_supporters)
+        self.assertEquals(set([slow.supporter, black_hole.supporter, dead.supporter]), set(result.dead_supporters))
+        self.assertEquals(set([slow.supporter, black_hole.supporter, dead.supporter]),
+                          set(result.failed_dispatches))
+
+    def testDispatchContactsSupportersConcurrently(self):
+        """Tests if the cycle time does not grow with the number of supporters."""
+        stand_ins = [StandInSupporter(i, delay=0.1) for i in xrange(20)]
+        dispatcher = self.create_dispatcher(stand_ins, timeout=1, deadline=2)
+        for stand_in in stand_ins:
+            self.assign_peer(stand_in)
+
+        ts = time.time()
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        # sequentially, this would take 2 seconds
+        self.assertTrue(time.time() - ts < 0.8)
+        self.assertEquals((), result.dead_supporters)
+        self.assertEquals(20, len(result.contacted_supporters))
+        for stand_in in stand_ins:
+            self.assertEquals(1, len(stand_in.received_peer_lists))
+
+    def testDeadlineExpires(self):
+        """Tests if supporters that do not answer before the deadline are reported as dead."""
+        slow = StandInSupporter(1, delay=0.5)
+        dispatcher = self.create_dispatcher([slow], timeout=2, deadline=0.2)
+        self.assign_peer(slow)
+
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((slow.supporter,), result.dead_supporters)
+        self.assertEquals((slow.supporter,), result.failed_dispatches)
+        # the call is still in progress, so the supporter is skipped by the next cycle
+        slow.supporter.request_update()
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((slow.supporter,), result.failed_dispatches)
+        self.assertEquals((), result.dead_supporters)
+
+    def testDeltasAndConnectionReuse(self):
+        """Tests if deltas are sent over the connection that was kept open."""
+        stand_in = StandInSupporter(1)
+        dispatcher = self.create_dispatcher([stand_in])
+        p1 = self.assign_peer(stand_in, 'XXX---34920F')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        stand_in.supporter.remove_supported_peer(p1)
+        self.assign_peer(stand_in, 'XXX---34920G')
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+
+        self.assertEquals((), result.failed_dispatches)
+        self.assertEquals(1, len(stand_in.received_peer_lists))
+        self.assertEquals([(2, [['XXX---34920G', '192.168.2.50', 10000]], [['XXX---34920F', '192.168.2.50', 10000]])],
+                          stand_in.received_deltas)
+        self.assertEquals({'connections_created': 1, 'connections_reused': 1, 'reconnects': 0, 'requests': 2},
+                          dispatcher.get_connection_statistics())
+
+    def testCompleteListIsSentAfterReconnect(self):
+        """Tests if the complete list is sent if the connection to the supporter had to be re-established."""
+        stand_in = StandInSupporter(1)
+        dispatcher = self.create_dispatcher([stand_in])
+        self.assign_peer(stand_in, 'XXX---34920F')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+
+        stand_in.drop_connections()
+        time.sleep(0.1)
+        # the probe of the next cycle re-establishes the connection
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((stand_in.supporter,), result.contacted_supporters)
+        self.assign_peer(stand_in, 'XXX---34920G')
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((), result.failed_dispatches)
+        self.assertEquals(2, len(stand_in.received_peer_lists))
+        self.assertEquals([], stand_in.received_deltas)
+        self.assertEquals(2, dispatcher.get_connection_statistics()['connections_created'])
+
+    def testLegacySupporterReceivesCompleteLists(self):
+        """Tests if supporters that do not understand deltas always get the complete list."""
+        stand_in = StandInSupporter(1, deltas=False)
+        dispatcher = self.create_dispatcher([stand_in])
+        self.assign_peer(stand_in, 'XXX---34920F')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assign_peer(stand_in, 'XXX---34920G')
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+
+        self.assertEquals((), result.failed_dispatches)
+        self.assertEquals(2, len(stand_in.received_peer_lists))
+        self.assertEquals(2, len(stand_in.peers))
+
+    def testProxySerializesCalls(self):
+        """Tests if calls of a proxy are answered in the order they were made."""
+        stand_in = StandInSupporter(1)
+        self.stand_ins.append(stand_in)
+        proxy = AsyncXmlRpcProxy(self.loop, (stand_in.supporter.get_addr()[0], stand_in.supporter.get_addr()[1] + 1))
+        results = []
+        proxy.call('is_alive', (), lambda result, error: results.append((result, error)))
+        proxy.call('receive_peer_list', ([], 1), lambda result, error: results.append((result, error)))
+        proxy.call('unknown', (), lambda result, error: results.append((result, error.__class__.__name__)))
+        self.loop.run(until=lambda: len(results) == 3, timeout=5)
+        self.assertEquals([(True, None), (True, None), (None, 'Fault')], results)
+        self.assertFalse(proxy.is_busy())
+
+
+class TestAsyncSupporterMonitor(unittest.TestCase):
+    def setUp(self):
+        self.loop = EventLoop()
+        self.stand_in = StandInSupporter(1, max_peer=10)
+        self.monitor = None
+
+    def tearDown(self):
+        if self.monitor is not None:
+            self.monitor.close()
+        self.loop.close()
+        self.stand_in.shutdown()
+
+    def testUpdateCyclesRunOnTheLoop(self):
+        """Tests if starving peers get assigned to a supporter whose list is dispatched by the loop."""
+        monitor = self.monitor = AsyncSupporterMonitor(self.loop, TEST_IS_ALIVE_TIMEOUT_BOUND,
+                                                       TEST_PEER_TIMEOUT_BOUND, update_interval=0.05)
+        addr = self.stand_in.supporter.get_addr()
+        monitor.register_monitored_supporter(1, addr, 1, 10)
+        monitor.start()
+        self.assertTrue(monitor.is_running())
+
+        def announce():
+            for i in xrange(3):
+                monitor.register_monitored_peer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+                for _ in xrange(shared.PEER_REQUIRED_MSGS):
+                    monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % i)
+
+        self.loop.call_later(0, announce)
+        self.loop.run(until=lambda: len(self.stand_in.peers) == 3, timeout=5)
+        self.assertEquals(3, len(self.stand_in.peers))
+        self.assertEquals(3, monitor.count_peers_by_state(SupportedState))
+        self.loop.run(until=lambda: monitor.get_last_cycle_latency() is not None, timeout=5)
+        self.assertTrue(monitor.get_last_cycle_latency() < 0.5)
+
+        # other threads have to use call_synchronized while the loop is running
+        thread = threading.Thread(target=self.loop.run)
+        started = threading.Event()
+        self.loop.call_soon_threadsafe(started.set)
+        thread.start()
+        started.wait()
+        try:
+            self.assertEquals(3, len(monitor.call_synchronized(monitor.get_monitored_peers)))
+            monitor.stop()
+            self.assertFalse(monitor.is_running())
+        finally:
+            self.loop.stop()
+            thread.join()
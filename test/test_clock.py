@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import unittest
+
+from supporter.clock import monotonic, Clock, ManualClock
+
+
+class TestClock(unittest.TestCase):
+    def setUp(self):
+        self.reads = 0
+
+    def tearDown(self):
+        pass
+
+    def counting_time_source(self):
+        self.reads += 1
+        return float(self.reads)
+
+    def testMonotonicClockDoesNotGoBackwards(self):
+        """Tests if consecutive reads of the monotonic clock never decrease."""
+        previous = monotonic()
+        for _ in xrange(1000):
+            ts = monotonic()
+            self.assertTrue(ts >= previous)
+            previous = ts
+
+    def testTickPinsTimestamp(self):
+        """Tests if the time source is read only once during a tick."""
+        clock = Clock(self.counting_time_source)
+        self.assertEquals(1.0, clock.now())
+        self.assertEquals(2.0, clock.begin_tick())
+        for _ in xrange(10):
+            self.assertEquals(2.0, clock.now())
+        clock.end_tick()
+        self.assertEquals(2, self.reads)
+        self.assertEquals(3.0, clock.now())
+
+    def testNestedTicksKeepOutermostTimestamp(self):
+        """Tests if a nested tick neither reads the time source nor releases the outer tick."""
+        clock = Clock(self.counting_time_source)
+        self.assertEquals(1.0, clock.begin_tick())
+        self.assertEquals(1.0, clock.begin_tick())
+        clock.end_tick()
+        self.assertEquals(1.0, clock.now())
+        clock.end_tick()
+        self.assertEquals(2.0, clock.now())
+        self.assertRaises(AssertionError, clock.end_tick)
+
+    def testTickAtGivenTimestamp(self):
+        """Tests if a tick can be pinned to a given timestamp and if read ignores pinned timestamps."""
+        clock = Clock(self.counting_time_source)
+        self.assertEquals(0.5, clock.begin_tick(0.5))
+        self.assertEquals(0.5, clock.now())
+        self.assertEquals(1.0, clock.read())
+        clock.end_tick()
+        self.assertEquals(2.0, clock.now())
+
+    def testManualClock(self):
+        """Tests if a ManualClock only advances when told to."""
+        clock = ManualClock(100)
+        self.assertEquals(100.0, clock.now())
+        clock.advance(2.5)
+        self.assertEquals(102.5, clock.now())
+        self.assertRaises(AssertionError, clock.advance, -1)
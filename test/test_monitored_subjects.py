@@ -2,13 +2,14 @@
 
 __author__ = 'Markus Guenther (markus.guenther@gmail.com)'
 
-import time
 import unittest
 
 import supporter.shared as shared
 
+from supporter.clock import ManualClock
 from supporter.monitored_subjects import MonitoredPeer, MonitoredSupporter
 from supporter.state_machine import DefaultState, WatchedState, StarvingState, SupportedState
+from supporter.state_machine import DEFAULT_STATE, WATCHED_STATE
 
 TEST_IS_ALIVE_TIMEOUT_BOUND = 2
 TEST_PEER_TIMEOUT_BOUND = 1
@@ -16,7 +17,8 @@ TEST_PEER_TIMEOUT_BOUND = 1
 
 class TestMonitoredPeer(unittest.TestCase):
     def setUp(self):
-        pass
+        # time only advances when the tests tell the clock to do so
+        self.clock = ManualClock()
 
     def tearDown(self):
         pass
@@ -57,7 +59,8 @@ class TestMonitoredPeer(unittest.TestCase):
         The test also ensures that the internal attributes are set to the correct values
         after each state transition.
         """
-        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                             clock=self.clock)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
 
         peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
@@ -85,10 +88,10 @@ class TestMonitoredPeer(unittest.TestCase):
         peer.receive_msg(shared.MSG_PEER_SUPPORTED)
         self.assertTrue(isinstance(peer.get_state(), SupportedState))
         peer.receive_msg(shared.MSG_SUPPORT_NOT_NEEDED)
-        time.sleep(1)
+        self.clock.advance(1)
         # this transition call would normally have to happen asynchronously through the
         # SupporterMonitor's cyclic transition check
-        peer.get_state().transition()
+        peer.get_state().transition(peer)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
 
     def testMonitoredPeerStateTransitionsEarlyCancel(self):
@@ -103,7 +106,8 @@ class TestMonitoredPeer(unittest.TestCase):
         The test also ensures that the internal attributes are set to the correct values
         after each state transition.
         """
-        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                             clock=self.clock)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
         peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         self.assertTrue(isinstance(peer.get_state(), WatchedState))
@@ -130,7 +134,8 @@ class TestMonitoredPeer(unittest.TestCase):
         The test also ensures that the internal attributes are set to the correct values
         after each state transition.
         """
-        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                             clock=self.clock)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
         peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         self.assertEquals(shared.MSG_SUPPORT_REQUIRED, peer.get_last_received_msg())
@@ -149,8 +154,8 @@ class TestMonitoredPeer(unittest.TestCase):
         # TODO: also check with server side message (timeout)
         peer.receive_msg(shared.MSG_SUPPORT_NOT_NEEDED)
         self.assertEquals(shared.MSG_SUPPORT_NOT_NEEDED, peer.get_last_received_msg())
-        time.sleep(1)
-        peer.get_state().transition()
+        self.clock.advance(1)
+        peer.get_state().transition(peer)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
 
     def testMonitoredPeerStateRequiredMsgsInIntervalNotMet(self):
@@ -161,12 +166,13 @@ class TestMonitoredPeer(unittest.TestCase):
         WATCHED to STARVING can be carried out. To pass this test, the peer should remain in
         the WATCHED state after the last message was received.
         """
-        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                             clock=self.clock)
 
         for _ in xrange(shared.PEER_REQUIRED_MSGS-1):
             peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         self.assertTrue(isinstance(peer.get_state(), WatchedState))
-        time.sleep(shared.PEER_STATUS_APPROVAL_TIME+1)
+        self.clock.advance(shared.PEER_STATUS_APPROVAL_TIME+1)
         peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         # although we have now received PEER_REQUIRED_MSGS support messages, the peer has not
         # transitioned to the starving state, since those messages arrived over a time which
@@ -175,16 +181,38 @@ class TestMonitoredPeer(unittest.TestCase):
 
     def testSlidingWindowOnRequestTime(self):
         """Checks if the sliding window for arrived support requests works correctly."""
-        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                             clock=self.clock)
 
         for _ in xrange(shared.PEER_REQUIRED_MSGS-1):
             peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         self.assertTrue(isinstance(peer.get_state(), WatchedState))
-        time.sleep(shared.PEER_STATUS_APPROVAL_TIME+1)
+        self.clock.advance(shared.PEER_STATUS_APPROVAL_TIME+1)
         for _ in xrange(shared.PEER_REQUIRED_MSGS):
             peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         self.assertTrue(isinstance(peer.get_state(), StarvingState))
 
+    def testSlidingWindowHasConfigurableSize(self):
+        """Checks if the sliding window keeps only the timestamps of the last required_msgs requests."""
+        required_msgs = shared.PEER_REQUIRED_MSGS * 2
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND,
+                             TEST_PEER_TIMEOUT_BOUND, required_msgs=required_msgs, clock=self.clock)
+        self.assertEquals(required_msgs, peer.get_required_msgs())
+        self.assertEquals(required_msgs * shared.PEER_REQUEST_TIME, peer.get_status_approval_time())
+
+        for _ in xrange(required_msgs - 1):
+            peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
+        self.assertTrue(isinstance(peer.get_state(), WatchedState))
+        peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
+        self.assertTrue(isinstance(peer.get_state(), StarvingState))
+
+        peer.reset_support_cycle()
+        for i in xrange(required_msgs + 3):
+            peer._ts_list.append(float(i))
+        self.assertEquals(required_msgs, len(peer._ts_list))
+        self.assertEquals(3.0, peer.get_ts_first_request())
+        self.assertEquals(float(required_msgs + 2), peer.get_ts_last_request())
+
     def testPeerTimesOut(self):
         """Test transitions from {WATCHED,STARVING,SUPPORTED} to DEFAULT.
 
@@ -193,7 +221,8 @@ class TestMonitoredPeer(unittest.TestCase):
         should happen instantaneously if the peer informs the SupporterMonitor that
         his buffer is full.
         """
-        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                             clock=self.clock)
 
         # test the transition on buffer full + timeout from WATCHED -> DEFAULT
         peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
@@ -215,8 +244,8 @@ class TestMonitoredPeer(unittest.TestCase):
         peer.receive_msg(shared.MSG_PEER_SUPPORTED)
         self.assertTrue(isinstance(peer.get_state(), SupportedState))
         peer.receive_msg(shared.MSG_SUPPORT_NOT_NEEDED)
-        time.sleep(shared.PEER_TIMEOUT_BOUND)
-        peer.get_state().transition()
+        self.clock.advance(shared.PEER_TIMEOUT_BOUND)
+        peer.get_state().transition(peer)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
 
     def testEqualityTest(self):
@@ -225,26 +254,61 @@ class TestMonitoredPeer(unittest.TestCase):
         p2 = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
         self.assertEquals(p1, p2)
 
+    def testIdentityKey(self):
+        """Tests if peers are hashed and compared by their identity key (ID, IP, Port)."""
+        p1 = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER)
+        p2 = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_SEEDER)
+        p3 = MonitoredPeer('XXX---34920F', '192.168.2.1', 10001, shared.PEER_TYPE_LEECHER)
+        self.assertEquals(('XXX---34920F', '192.168.2.1', 10000), p1.get_address_tuple())
+        self.assertEquals(hash(p1.get_address_tuple()), hash(p1))
+        self.assertEquals(hash(p1), hash(p2))
+        self.assertTrue(p1 == p2)
+        self.assertFalse(p1 != p2)
+        self.assertTrue(p1 != p3)
+        self.assertEquals(1, len(set([p1, p2])))
+
+    def testCompactRepresentation(self):
+        """Tests if MonitoredPeer instances do not carry an instance dictionary and share the
+        message dispatch table."""
+        peer1 = MonitoredPeer('XXX---34920F', '192.168.2.1', 10333, shared.PEER_TYPE_LEECHER)
+        peer2 = MonitoredPeer('XXX---34920G', '192.168.2.2', 10333, shared.PEER_TYPE_LEECHER)
+        self.assertFalse(hasattr(peer1, '__dict__'))
+        self.assertFalse(hasattr(peer1.get_state(), '__dict__'))
+        self.assertTrue(peer1.msg_handler is peer2.msg_handler)
+        self.assertRaises(AttributeError, setattr, peer1, 'unknown_attribute', None)
+
+    def testStatesAreShared(self):
+        """Tests if all peers that reside in the same state share the same state instance."""
+        peer1 = MonitoredPeer('XXX---34920F', '192.168.2.1', 10333, shared.PEER_TYPE_LEECHER)
+        peer2 = MonitoredPeer('XXX---34920G', '192.168.2.2', 10333, shared.PEER_TYPE_LEECHER)
+        self.assertTrue(peer1.get_state() is DEFAULT_STATE)
+        self.assertTrue(peer2.get_state() is DEFAULT_STATE)
+        peer1.receive_msg(shared.MSG_SUPPORT_REQUIRED)
+        peer2.receive_msg(shared.MSG_SUPPORT_REQUIRED)
+        self.assertTrue(peer1.get_state() is WATCHED_STATE)
+        self.assertTrue(peer2.get_state() is WATCHED_STATE)
+
     def testPeerIsAliveTriggersStateTransitionsCorrectly(self):
         """Tests if peer states transition back to DEFAULT state if peer is considered as not being alive."""
-        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        peer = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                             clock=self.clock)
         peer.receive_msg(shared.MSG_PEER_REGISTERED)
 
         # transition from WATCHED -> DEFAULT on is-alive timeout
         peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         self.assertTrue(isinstance(peer.get_state(), WatchedState))
-        time.sleep(shared.IS_ALIVE_TIMEOUT_BOUND)
+        self.clock.advance(shared.IS_ALIVE_TIMEOUT_BOUND)
         self.assertFalse(peer.peer_is_alive())
-        peer.get_state().transition()
+        peer.get_state().transition(peer)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
 
         # transition from STARVING -> DEFAULT on is-alive timeout
         for _ in xrange(shared.PEER_REQUIRED_MSGS):
             peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         self.assertTrue(isinstance(peer.get_state(), StarvingState))
-        time.sleep(shared.IS_ALIVE_TIMEOUT_BOUND)
+        self.clock.advance(shared.IS_ALIVE_TIMEOUT_BOUND)
         self.assertFalse(peer.peer_is_alive())
-        peer.get_state().transition()
+        peer.get_state().transition(peer)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
 
         # transition from SUPPORTED -> DEFAULT on is-alive timeout
@@ -252,8 +316,8 @@ class TestMonitoredPeer(unittest.TestCase):
             peer.receive_msg(shared.MSG_SUPPORT_REQUIRED)
         peer.receive_msg(shared.MSG_PEER_SUPPORTED)
         self.assertTrue(isinstance(peer.get_state(), SupportedState))
-        time.sleep(shared.IS_ALIVE_TIMEOUT_BOUND)
-        peer.get_state().transition()
+        self.clock.advance(shared.IS_ALIVE_TIMEOUT_BOUND)
+        peer.get_state().transition(peer)
         self.assertTrue(isinstance(peer.get_state(), DefaultState))
 
 class TestMonitoredSupporter(unittest.TestCase):
@@ -321,4 +385,62 @@ class TestMonitoredSupporter(unittest.TestCase):
         """Tests if two monitored supporters with same static attributes are considered equal."""
         s1 = MonitoredSupporter(1, ('192.168.2.1', 1024), 2, 5)
         s2 = MonitoredSupporter(1, ('192.168.2.1', 1024), 2, 5)
-        self.assertEquals(s1, s2)
\ No newline at end of file
+        self.assertEquals(s1, s2)
+        self.assertEquals(hash(s1), hash(s2))
+        self.assertTrue(s1 != MonitoredSupporter(1, ('192.168.2.1', 1024), 2, 6))
+
+    def testSupporteeListKeepsAssignmentOrder(self):
+        """Tests if the supportee list is returned in the order in which peers were assigned."""
+        supporter = MonitoredSupporter(1, ('192.168.2.1', 1024), 2, 100)
+        peers = [MonitoredPeer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+                 for i in xrange(50)]
+        for peer in reversed(peers):
+            supporter.add_supported_peer(peer)
+        supporter.add_supported_peer(peers[0])
+        for peer in peers[::3]:
+            supporter.remove_supported_peer(peer)
+        expected = [peer for peer in reversed(peers) if peer not in peers[::3]]
+        self.assertEquals(expected, supporter.get_supported_peers())
+        self.assertEquals(len(expected), supporter.assigned_slots())
+
+    def testCollectSupporteeListUpdates(self):
+        """Tests if the supporter tracks the changes of its supportee list between two updates."""
+        supporter = MonitoredSupporter(1, ('192.168.2.1', 1024), 2, 5)
+        p1 = MonitoredPeer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        p2 = MonitoredPeer('XXX---34920G', '192.168.2.51', 10001, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        p3 = MonitoredPeer('XXX---34920H', '192.168.2.52', 10002, shared.PEER_TYPE_LEECHER, TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        supporter.add_supported_peer(p1)
+        update = supporter.collect_update()
+        self.assertEquals(1, update.version)
+        self.assertTrue(update.full)
+        self.assertEquals(None, supporter.collect_update())
+
+        supporter.add_supported_peer(p2)
+        supporter.add_supported_peer(p3)
+        supporter.remove_supported_peer(p1)
+        supporter.remove_supported_peer(p3)
+        update = supporter.collect_update()
+        self.assertEquals(2, update.version)
+        self.assertFalse(update.full)
+        self.assertEquals((p2.get_address_tuple(),), update.peers)
+        self.assertEquals((p2.get_address_tuple(),), update.added)
+        self.assertEquals((p1.get_address_tuple(),), update.removed)
+
+        supporter.request_update()
+        update = supporter.collect_update()
+        self.assertEquals(3, update.version)
+        self.assertTrue(update.full)
+
+    def testAdaptiveProbeInterval(self):
+        """Tests if the probe interval of a supporter grows with every successful contact."""
+        supporter = MonitoredSupporter(1, ('192.168.2.1', 1024), 2, 5)
+        self.assertTrue(supporter.probe_due(0))
+        supporter.contact_succeeded(100)
+        self.assertFalse(supporter.probe_due(100))
+        self.assertTrue(supporter.probe_due(100 + shared.SUPPORTER_PROBE_INTERVAL_MIN))
+        for _ in xrange(10):
+            supporter.contact_succeeded(100)
+        self.assertFalse(supporter.probe_due(100 + shared.SUPPORTER_PROBE_INTERVAL_MAX - 1))
+        self.assertTrue(supporter.probe_due(100 + shared.SUPPORTER_PROBE_INTERVAL_MAX))
+        supporter.reset_probe_interval()
+        self.assertTrue(supporter.probe_due(100))
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import random
+import unittest
+
+import supporter.shared as shared
+
+from supporter.clock import ManualClock
+from supporter.monitored_subjects import MonitoredPeer
+from supporter.peer_table import numpy, PeerTable, ColumnarMonitoredPeer
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.state_machine import StarvingState, DEFAULT_STATE
+
+MESSAGES = [shared.MSG_PEER_SUPPORTED, shared.MSG_SUPPORT_NOT_NEEDED, shared.MSG_SUPPORT_REQUIRED,
+            shared.MSG_SUPPORT_REQUIRED, shared.MSG_PEER_REGISTERED]
+SHORT_TIMEOUT = 0.1
+LONG_TIMEOUT = 60
+
+
+def assert_peers_equal(test, expected, actual):
+    test.assertTrue(expected.get_state() is actual.get_state())
+    test.assertEquals(expected.get_last_received_msg(), actual.get_last_received_msg())
+    test.assertEquals(expected.get_number_of_support_requests(), actual.get_number_of_support_requests())
+    test.assertEquals(expected.get_ts_first_request() is None, actual.get_ts_first_request() is None)
+    test.assertEquals(expected.timeout_timer_stopped(), actual.timeout_timer_stopped())
+
+
+def legacy_update(mp, ts):
+    """Replicates the asynchronous state update of SupporterMonitor for a single peer."""
+    if mp.get_ts_last_request() and (ts - mp.get_ts_last_request() > shared.PEER_RESET_TIME):
+        mp.set_state(DEFAULT_STATE)
+    else:
+        mp.trigger_transition()
+
+
+@unittest.skipIf(numpy is None, "NumPy is not available")
+class TestPeerTable(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(4711)
+        self.monitor = None
+
+    def tearDown(self):
+        if self.monitor is not None:
+            self.monitor.close()
+
+    def testColumnarPeerBehavesLikeMonitoredPeer(self):
+        """Tests if a ColumnarMonitoredPeer handles messages exactly like a MonitoredPeer."""
+        table = PeerTable(4)
+        for i in xrange(10):
+            expected = MonitoredPeer('XXX---%i' % i, '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER)
+            actual = ColumnarMonitoredPeer(table, 'XXX---%i' % i, '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER)
+            assert_peers_equal(self, expected, actual)
+            for _ in xrange(50):
+                msg_type = self.rnd.choice(MESSAGES)
+                expected.receive_msg(msg_type)
+                actual.receive_msg(msg_type)
+                assert_peers_equal(self, expected, actual)
+        self.assertEquals(10, len(table))
+
+    def testColumnarPeerWithCustomWindowSize(self):
+        """Tests if the ring buffers of a PeerTable follow the configured window size."""
+        table = PeerTable(4, required_msgs=7)
+        for i in xrange(10):
+            expected = MonitoredPeer('XXX---%i' % i, '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER, required_msgs=7)
+            actual = ColumnarMonitoredPeer(table, 'XXX---%i' % i, '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER)
+            self.assertEquals(7, actual.get_required_msgs())
+            for _ in xrange(50):
+                msg_type = self.rnd.choice(MESSAGES)
+                expected.receive_msg(msg_type)
+                actual.receive_msg(msg_type)
+                assert_peers_equal(self, expected, actual)
+
+    def testVectorizedUpdateMatchesObjectUpdate(self):
+        """Tests if the vectorized state update yields the same states as updating peers one by one."""
+        table = PeerTable()
+        clock = ManualClock(1000)
+        pairs = []
+        for i in xrange(500):
+            is_alive_timeout = self.rnd.choice([SHORT_TIMEOUT, LONG_TIMEOUT])
+            peer_timeout = self.rnd.choice([SHORT_TIMEOUT, LONG_TIMEOUT])
+            expected = MonitoredPeer('XXX---%i' % i, '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER,
+                                     is_alive_timeout, peer_timeout, clock=clock)
+            actual = ColumnarMonitoredPeer(table, 'XXX---%i' % i, '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER,
+                                           is_alive_timeout, peer_timeout, clock=clock)
+            for _ in xrange(self.rnd.randint(1, 10)):
+                msg_type = self.rnd.choice(MESSAGES)
+                expected.receive_msg(msg_type)
+                actual.receive_msg(msg_type)
+            pairs.append((expected, actual))
+        clock.advance(2 * SHORT_TIMEOUT)
+
+        for expected, _ in pairs:
+            legacy_update(expected, clock.now())
+        self.assertEquals([], table.update_states(clock.now()))
+        for expected, actual in pairs:
+            assert_peers_equal(self, expected, actual)
+
+    def testRemovedRowsAreReused(self):
+        """Tests if the table grows on demand and reuses rows of removed peers."""
+        table = PeerTable(2)
+        peers = [ColumnarMonitoredPeer(table, 'XXX---%i' % i, '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER)
+                 for i in xrange(5)]
+        self.assertEquals(5, len(table))
+        self.assertEquals(5, len(set([p.get_row() for p in peers])))
+        peers[1].receive_msg(shared.MSG_SUPPORT_REQUIRED)
+        row = peers[1].get_row()
+        table.remove_peer(peers[1])
+        self.assertEquals(4, len(table))
+        peer = ColumnarMonitoredPeer(table, 'XXX---5', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER)
+        self.assertEquals(row, peer.get_row())
+        self.assertTrue(peer.get_state() is DEFAULT_STATE)
+        self.assertEquals(None, peer.get_ts_first_request())
+        self.assertEquals(0, peer.get_number_of_support_requests())
+
+    def testMonitorWithPeerTable(self):
+        """Tests if a SupporterMonitor manages its peers in the given peer table."""
+        table = PeerTable()
+        monitor = SupporterMonitor(peer_table=table)
+        self.monitor = monitor
+        mp = monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        self.assertTrue(isinstance(mp, ColumnarMonitoredPeer))
+        for _ in xrange(shared.PEER_REQUIRED_MSGS):
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        monitor._update_peer_table(monitor.get_clock().now())
+        self.assertEquals(1, monitor.count_peers_by_state(StarvingState))
+        self.assertEquals(1, len(table))
+        monitor.unregister_monitored_peer(mp)
+        self.assertEquals(0, len(table))
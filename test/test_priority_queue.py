@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import random
+import unittest
+
+from supporter.priority_queue import IndexedMaxHeap
+
+
+class TestIndexedMaxHeap(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(4711)
+
+    def tearDown(self):
+        pass
+
+    def assertHeapMatches(self, heap, priorities):
+        """Compares the heap against a dict of item => priority. Ties are broken by insertion
+        order, which equals the order of the item numbers in these tests."""
+        expected = sorted(priorities, key=lambda item: (-priorities[item], item))
+        self.assertEquals(expected, heap.items())
+        self.assertEquals(len(priorities), len(heap))
+        if len(priorities) > 0:
+            self.assertEquals(expected[0], heap.peek())
+        for item, priority in priorities.iteritems():
+            self.assertTrue(item in heap)
+            self.assertEquals(priority, heap.get_priority(item))
+
+    def testPushUpdateRemove(self):
+        """Tests if the heap keeps its order under random insertions, updates and removals."""
+        heap = IndexedMaxHeap()
+        priorities = {}
+        for item in xrange(200):
+            priorities[item] = self.rnd.randint(0, 20)
+            heap.push(item, priorities[item])
+        self.assertHeapMatches(heap, priorities)
+        for _ in xrange(500):
+            item = self.rnd.choice(priorities.keys())
+            if self.rnd.random() < 0.2:
+                heap.remove(item)
+                del priorities[item]
+            else:
+                priorities[item] = self.rnd.randint(0, 20)
+                heap.update(item, priorities[item])
+            self.assertHeapMatches(heap, priorities)
+
+    def testEmptyHeap(self):
+        """Tests the behaviour of an empty heap."""
+        heap = IndexedMaxHeap()
+        self.assertEquals(None, heap.peek())
+        self.assertEquals([], heap.items())
+        self.assertFalse('x' in heap)
+        self.assertRaises(KeyError, heap.remove, 'x')
+        heap.push('x', 1)
+        heap.remove('x')
+        self.assertEquals(0, len(heap))
+
+    def testIterationAllowsRemoval(self):
+        """Tests if items can be removed while iterating over the heap."""
+        heap = IndexedMaxHeap()
+        for item in xrange(10):
+            heap.push(item, item % 3)
+        for item in heap:
+            if item % 2 == 0:
+                heap.remove(item)
+        self.assertEquals([5, 1, 7, 3, 9], heap.items())
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import threading
+import time
+import unittest
+
+from supporter.scheduler import FixedRateScheduler
+
+TEST_PERIOD = 0.1
+
+
+class TestFixedRateScheduler(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def tearDown(self):
+        pass
+
+    def create_task(self, duration):
+        def task():
+            self.calls.append(time.time())
+            time.sleep(duration)
+        return task
+
+    def testTicksDoNotDrift(self):
+        """Tests if ticks happen at a fixed rate, independent of the execution time of the task."""
+        scheduler = FixedRateScheduler(self.create_task(TEST_PERIOD / 2), TEST_PERIOD)
+        ts = time.time()
+        scheduler.start()
+        time.sleep(10.5 * TEST_PERIOD)
+        scheduler.stop()
+        self.assertEquals(10, scheduler.get_ticks())
+        self.assertEquals(0, scheduler.get_overruns())
+        # the n-th tick is scheduled n periods after the start of the scheduler
+        for n, call in enumerate(self.calls):
+            self.assertTrue(abs(call - (ts + (n + 1) * TEST_PERIOD)) < TEST_PERIOD / 2)
+
+    def testOverrunsAreSkippedAndCounted(self):
+        """Tests if ticks that are missed while the task exceeds its period are skipped."""
+        scheduler = FixedRateScheduler(self.create_task(2.5 * TEST_PERIOD), TEST_PERIOD)
+        scheduler.start()
+        time.sleep(8.5 * TEST_PERIOD)
+        # waits until the tick at 7 periods has completed
+        scheduler.stop()
+        # ticks at 1, 4 and 7 periods, each one skipping two ticks
+        self.assertEquals(3, scheduler.get_ticks())
+        self.assertEquals(6, scheduler.get_overruns())
+
+    def testStartAndStop(self):
+        """Tests if the scheduler uses a single thread that terminates when it is stopped."""
+        scheduler = FixedRateScheduler(self.create_task(0), TEST_PERIOD, "TestScheduler")
+        self.assertFalse(scheduler.is_running())
+        scheduler.start()
+        scheduler.start()
+        self.assertTrue(scheduler.is_running())
+        self.assertEquals(1, len([t for t in threading.enumerate() if t.getName() == "TestScheduler"]))
+        scheduler.stop()
+        self.assertFalse(scheduler.is_running())
+        self.assertEquals(0, len([t for t in threading.enumerate() if t.getName() == "TestScheduler"]))
+        ticks = scheduler.get_ticks()
+        time.sleep(2 * TEST_PERIOD)
+        self.assertEquals(ticks, scheduler.get_ticks())
+
+    def testFailingTaskDoesNotStopScheduler(self):
+        """Tests if the scheduler keeps running if the task raises an exception."""
+        def task():
+            self.calls.append(time.time())
+            raise ValueError()
+        scheduler = FixedRateScheduler(task, TEST_PERIOD)
+        scheduler.start()
+        time.sleep(3.5 * TEST_PERIOD)
+        scheduler.stop()
+        self.assertEquals(3, len(self.calls))
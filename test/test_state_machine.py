@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import random
+import unittest
+
+import supporter.shared as shared
+
+from supporter.monitored_subjects import MonitoredPeer
+from supporter.supporter_monitor import SupporterMonitor
+from supporter.state_machine import StateTransitionEngine, TableTransitionEngine, StarvingState
+from supporter.state_machine import DEFAULT_STATE, WATCHED_STATE, STARVING_STATE, SUPPORTED_STATE
+
+STATES = [DEFAULT_STATE, WATCHED_STATE, STARVING_STATE, SUPPORTED_STATE]
+MESSAGES = [None, shared.MSG_PEER_SUPPORTED, shared.MSG_SUPPORT_NOT_NEEDED, shared.MSG_SUPPORT_REQUIRED,
+            shared.MSG_PEER_REGISTERED]
+
+
+class RecordingPeer(object):
+    """Provides the conditions that state transitions depend on and records the transitions."""
+
+    def __init__(self, state, ts_first_request, ts_last_request, support_requests, last_received_msg,
+                 alive, timed_out):
+        self.state = state
+        self.states = []
+        self.resets = 0
+        self.ts_first_request = ts_first_request
+        self.ts_last_request = ts_last_request
+        self.support_requests = support_requests
+        self.last_received_msg = last_received_msg
+        self.alive = alive
+        self.timed_out = timed_out
+
+    def get_state(self):
+        return self.state
+
+    def set_state(self, state):
+        self.state = state
+        self.states.append(state)
+
+    def reset_support_cycle(self):
+        self.resets += 1
+
+    def get_ts_first_request(self):
+        return self.ts_first_request
+
+    def get_ts_last_request(self):
+        return self.ts_last_request
+
+    def get_number_of_support_requests(self):
+        return self.support_requests
+
+    def get_required_msgs(self):
+        return shared.PEER_REQUIRED_MSGS
+
+    def get_status_approval_time(self):
+        return shared.PEER_STATUS_APPROVAL_TIME
+
+    def get_last_received_msg(self):
+        return self.last_received_msg
+
+    def peer_is_alive(self):
+        return self.alive
+
+    def peer_timed_out(self):
+        return self.timed_out
+
+
+def random_peer_conditions(rnd):
+    msg_type = rnd.choice(MESSAGES)
+    # a support request always opens the request window
+    support_requests = rnd.randint(msg_type == shared.MSG_SUPPORT_REQUIRED and 1 or 0, 2 * shared.PEER_REQUIRED_MSGS)
+    ts_first_request = ts_last_request = None
+    if support_requests > 0:
+        ts_first_request = rnd.uniform(0, 1000)
+        ts_last_request = ts_first_request + rnd.uniform(0, 2 * shared.PEER_STATUS_APPROVAL_TIME)
+    return (rnd.choice(STATES), ts_first_request, ts_last_request, support_requests, msg_type,
+            rnd.random() < 0.5, rnd.random() < 0.5)
+
+
+class TestTableTransitionEngine(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(4711)
+        self.monitor = None
+
+    def tearDown(self):
+        if self.monitor is not None:
+            self.monitor.close()
+
+    def testTableIsEquivalentToStatesOnRandomConditions(self):
+        """Tests if the table-driven engine and the states agree on randomly drawn peer conditions."""
+        table_engine = TableTransitionEngine()
+        state_engine = StateTransitionEngine()
+        for _ in xrange(5000):
+            conditions = random_peer_conditions(self.rnd)
+            expected = RecordingPeer(*conditions)
+            actual = RecordingPeer(*conditions)
+            state_engine.transition(expected)
+            table_engine.transition(actual)
+            self.assertTrue(expected.state is actual.state, conditions)
+            self.assertEquals(expected.resets, actual.resets, conditions)
+
+    def testTableIsEquivalentToStatesOnRandomMessageSequences(self):
+        """Tests if monitored peers using either engine pass through the same states."""
+        table_engine = TableTransitionEngine()
+        for _ in xrange(20):
+            expected = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER)
+            actual = MonitoredPeer('XXX---34920F', '192.168.2.1', 10000, shared.PEER_TYPE_LEECHER,
+                                   transition_engine=table_engine)
+            for _ in xrange(100):
+                msg_type = self.rnd.choice(MESSAGES[1:])
+                expected.receive_msg(msg_type)
+                actual.receive_msg(msg_type)
+                self.assertTrue(expected.get_state() is actual.get_state())
+                self.assertEquals(expected.get_number_of_support_requests(),
+                                  actual.get_number_of_support_requests())
+
+    def testIrrelevantConditionsAreDropped(self):
+        """Tests if the table of a state only depends on the conditions that state checks."""
+        table_engine = TableTransitionEngine()
+        self.assertEquals(('request_window_opened',), table_engine.get_conditions(DEFAULT_STATE))
+        self.assertEquals(('last_received_msg', 'alive'), table_engine.get_conditions(STARVING_STATE))
+
+    def testRequestWindowIsOnlyCheckedForSupportRequests(self):
+        """Tests if the request window of a watched peer is only evaluated after a support request."""
+        table_engine = TableTransitionEngine()
+        for msg_type, expected_state in [(shared.MSG_SUPPORT_NOT_NEEDED, DEFAULT_STATE),
+                                         (shared.MSG_PEER_SUPPORTED, WATCHED_STATE),
+                                         (shared.MSG_SUPPORT_REQUIRED, STARVING_STATE)]:
+            peer = RecordingPeer(WATCHED_STATE, 0.0, 0.0, shared.PEER_REQUIRED_MSGS, msg_type, True, False)
+            window_checks = []
+            peer.get_ts_first_request = lambda: window_checks.append(msg_type) or peer.ts_first_request
+            table_engine.transition(peer)
+            self.assertTrue(peer.state is expected_state)
+            self.assertEquals(msg_type == shared.MSG_SUPPORT_REQUIRED, len(window_checks) > 0)
+
+    def testMonitorUsesTableEngine(self):
+        """Tests if peers registered at a monitor use the configured transition engine."""
+        self.monitor = SupporterMonitor(transition_engine=TableTransitionEngine())
+        mp = self.monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        for _ in xrange(shared.PEER_REQUIRED_MSGS):
+            self.monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertTrue(mp.get_state() is STARVING_STATE)
+        self.assertEquals(1, self.monitor.count_peers_by_state(StarvingState))
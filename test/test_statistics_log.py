@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import supporter.shared as shared
+
+from supporter.clock import ManualClock
+from supporter.monitor_snapshot import MonitorSnapshot, StateCounts
+from supporter.statistics_log import BINARY_RECORD, StatisticsLogWriter, read_binary_records
+from supporter.supporter_monitor import SupporterMonitor
+
+
+def create_snapshot(version, starving=0):
+    return MonitorSnapshot(version, 1000.0 + version, (), (), StateCounts(3, 2, starving, 1), 4, 5, 6)
+
+
+class BlockingStatisticsLogWriter(StatisticsLogWriter):
+    """Simulates a disk that stalls until the test releases it."""
+
+    def __init__(self, *args, **kwargs):
+        StatisticsLogWriter.__init__(self, *args, **kwargs)
+        self.writing = threading.Event()
+        self.released = threading.Event()
+
+    def _write_records(self, records):
+        self.writing.set()
+        self.released.wait(5)
+        StatisticsLogWriter._write_records(self, records)
+
+
+class TestStatisticsLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'statistics.log')
+        self.monitor = None
+
+    def tearDown(self):
+        if self.monitor is not None:
+            self.monitor.close()
+        shutil.rmtree(self.directory)
+
+    def testTextRecords(self):
+        """Checks if records are written as tab-separated lines in the order of their submission."""
+        writer = StatisticsLogWriter(self.path)
+        for version in xrange(3):
+            self.assertTrue(writer.submit(create_snapshot(version, starving=version)))
+        self.assertTrue(writer.flush(5))
+        self.assertEquals(["%1.2f\t3\t2\t%i\t1\t4\t5\t6" % (1000.0 + i, i) for i in xrange(3)],
+                          open(self.path).read().splitlines())
+        self.assertEquals(3, writer.get_written_records())
+        writer.close()
+        self.assertFalse(writer.submit(create_snapshot(3)))
+        self.assertEquals(1, writer.get_dropped_records())
+
+    def testBinaryRecords(self):
+        """Checks if records are written as fixed-width structs that can be read back."""
+        writer = StatisticsLogWriter(self.path, binary=True)
+        for version in xrange(3):
+            writer.submit(create_snapshot(version, starving=version))
+        writer.close()
+        self.assertEquals(3 * BINARY_RECORD.size, os.path.getsize(self.path))
+        self.assertEquals([(1000.0 + i, 3, 2, i, 1, 4, 5, 6) for i in xrange(3)],
+                          list(read_binary_records(self.path)))
+
+    def testRotationBySize(self):
+        """Checks if the log is rotated once it exceeds its max. size and if only the newest backups are kept."""
+        writer = StatisticsLogWriter(self.path, max_bytes=2 * BINARY_RECORD.size, backup_count=2, binary=True)
+        for version in xrange(7):
+            writer.submit(create_snapshot(version))
+            writer.flush(5)
+        writer.close()
+        self.assertEquals(3, writer.get_rotations())
+        self.assertEquals(['statistics.log', 'statistics.log.1', 'statistics.log.2'], sorted(os.listdir(self.directory)))
+        self.assertEquals([1006.0], [record[0] for record in read_binary_records(self.path)])
+        self.assertEquals([1004.0, 1005.0], [record[0] for record in read_binary_records(self.path + '.1')])
+        self.assertEquals([1002.0, 1003.0], [record[0] for record in read_binary_records(self.path + '.2')])
+
+    def testRotationByAge(self):
+        """Checks if the log is rotated once it exceeds its max. age."""
+        clock = ManualClock()
+        writer = StatisticsLogWriter(self.path, max_bytes=0, max_age=60, backup_count=0, clock=clock)
+        writer.submit(create_snapshot(0))
+        writer.flush(5)
+        clock.advance(59)
+        writer.submit(create_snapshot(1))
+        writer.flush(5)
+        self.assertEquals(0, writer.get_rotations())
+        clock.advance(1)
+        writer.submit(create_snapshot(2))
+        writer.close()
+        self.assertEquals(1, writer.get_rotations())
+        # without backups, the log is truncated
+        self.assertEquals(['statistics.log'], os.listdir(self.directory))
+        self.assertEquals(1, len(open(self.path).read().splitlines()))
+
+    def testStalledDiskDropsRecords(self):
+        """Checks if records are dropped instead of blocking the submitter while the disk stalls."""
+        writer = BlockingStatisticsLogWriter(self.path, capacity=4)
+        writer.submit(create_snapshot(0))
+        self.assertTrue(writer.writing.wait(5))
+        ts = time.time()
+        accepted = [writer.submit(create_snapshot(version)) for version in xrange(1, 7)]
+        self.assertTrue(time.time() - ts < 0.1)
+        self.assertEquals([True] * 4 + [False] * 2, accepted)
+        self.assertEquals(2, writer.get_dropped_records())
+        self.assertFalse(writer.flush(0.05))
+        writer.released.set()
+        writer.close()
+        self.assertEquals(5, writer.get_written_records())
+        self.assertEquals(5, len(open(self.path).read().splitlines()))
+
+    def testMonitorUpdatesDoNotWaitForTheDisk(self):
+        """Checks if the statistics of every update cycle are written without blocking the update."""
+        writer = BlockingStatisticsLogWriter(self.path)
+        monitor = self.monitor = SupporterMonitor(statistics_log=writer)
+        monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        monitor.update_states()
+        self.assertTrue(writer.writing.wait(5))
+        ts = time.time()
+        monitor.update_states()
+        self.assertTrue(time.time() - ts < 1)
+        writer.released.set()
+        writer.close()
+        lines = open(self.path).read().splitlines()
+        self.assertEquals(2, len(lines))
+        self.assertEquals(['1', '0', '0', '0'], lines[1].split('\t')[1:5])
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Markus Guenther (markus.guenther@gmail.com)'
+
+import time
+import unittest
+import xmlrpclib
+
+from supporter.clock import DEFAULT_CLOCK
+from supporter.monitored_subjects import MonitoredPeer
+from supporter.supporter_adapter import SupporteeListDispatcher, ConcurrentSupporteeListDispatcher, \
+    PersistentTransport
+
+import supporter.shared as shared
+
+from stand_in_supporters import StandInSupporter, DeadSupporter, BlackHoleSupporter, StubMonitor
+
+TEST_CONNECT_TIMEOUT = 0.2
+TEST_READ_TIMEOUT = 0.3
+TEST_DEADLINE = 0.8
+
+
+class TestSupporteeListDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.stand_ins = []
+        self.dispatchers = []
+
+    def tearDown(self):
+        for stand_in in self.stand_ins:
+            stand_in.shutdown()
+        for dispatcher in self.dispatchers:
+            dispatcher.close(5)
+
+    def create_dispatcher(self, dispatcher_class, stand_ins, **kwargs):
+        self.stand_ins.extend(stand_ins)
+        monitor = StubMonitor([s.supporter for s in stand_ins])
+        dispatcher = dispatcher_class(monitor, **kwargs)
+        self.dispatchers.append(dispatcher)
+        for stand_in in stand_ins:
+            dispatcher.register_proxy(stand_in.supporter)
+        return dispatcher
+
+    def assign_peer(self, stand_in, peer_id='XXX---34920F'):
+        peer = MonitoredPeer(peer_id, '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        stand_in.supporter.add_supported_peer(peer)
+        return peer
+
+    def testSequentialDispatch(self):
+        """Tests if the sequential dispatcher probes supporters and delivers changed supportee lists."""
+        healthy = StandInSupporter(1)
+        dead = DeadSupporter(2)
+        dispatcher = self.create_dispatcher(SupporteeListDispatcher, [healthy, dead])
+        self.assign_peer(healthy)
+
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+
+        self.assertEquals([[['XXX---34920F', '192.168.2.50', 10000]]], healthy.received_peer_lists)
+        self.assertEquals((dead.supporter,), result.dead_supporters)
+        # the list of a supporter is only dispatched again if it changed
+        plan = dispatcher.create_dispatch_plan()
+        self.assertEquals((), plan.updates)
+        self.assertEquals(2, len(plan.probes))
+
+    def testConcurrentDispatchWithSlowAndDeadSupporters(self):
+        """Tests if slow, black-holed and dead supporters are reported as dead within the deadline."""
+        healthy = StandInSupporter(1)
+        slow = StandInSupporter(2, delay=TEST_READ_TIMEOUT * 2)
+        black_hole = BlackHoleSupporter(3)
+        dead = DeadSupporter(4)
+        dispatcher = self.create_dispatcher(ConcurrentSupporteeListDispatcher, [healthy, slow, black_hole, dead],
+                                            connect_timeout=TEST_CONNECT_TIMEOUT, read_timeout=TEST_READ_TIMEOUT,
+                                            deadline=TEST_DEADLINE)
+        self.assign_peer(healthy)
+        self.assign_peer(slow)
+
+        ts = time.time()
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertTrue(time.time() - ts < TEST_DEADLINE + 0.1)
+
+        self.assertEquals(1, len(healthy.received_peer_lists))
+        self.assertEquals(set([slow.supporter, black_hole.supporter, dead.supporter]),
+                          set(result.dead_supporters))
+        # newly registered supporters always get their (possibly empty) list dispatched
+        self.assertEquals(set([slow.supporter, black_hole.supporter, dead.supporter]),
+                          set(result.failed_dispatches))
+
+    def testConcurrentDispatchContactsSupportersInParallel(self):
+        """Tests if the cycle time does not grow with the number of supporters."""
+        stand_ins = [StandInSupporter(i, delay=0.1) for i in xrange(8)]
+        dispatcher = self.create_dispatcher(ConcurrentSupporteeListDispatcher, stand_ins, workers=8,
+                                            read_timeout=1, deadline=2)
+        for stand_in in stand_ins:
+            self.assign_peer(stand_in)
+
+        ts = time.time()
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        # every supporter needs 0.2 seconds (probe + dispatch), sequentially 1.6 seconds
+        self.assertTrue(time.time() - ts < 0.8)
+        self.assertEquals((), result.dead_supporters)
+        self.assertEquals((), result.failed_dispatches)
+        for stand_in in stand_ins:
+            self.assertEquals(1, len(stand_in.received_peer_lists))
+
+    def testDeadlineExpires(self):
+        """Tests if supporters that do not answer before the deadline are reported as dead."""
+        slow = StandInSupporter(1, delay=0.5)
+        dispatcher = self.create_dispatcher(ConcurrentSupporteeListDispatcher, [slow],
+                                            read_timeout=2, deadline=0.2)
+        self.assign_peer(slow)
+
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((slow.supporter,), result.dead_supporters)
+        self.assertEquals((slow.supporter,), result.failed_dispatches)
+
+    def testCloseStopsWorkerThreads(self):
+        """Tests if closing the concurrent dispatcher stops its workers and closes its connections."""
+        stand_in = StandInSupporter(1)
+        dispatcher = self.create_dispatcher(ConcurrentSupporteeListDispatcher, [stand_in], workers=4)
+        workers = list(dispatcher._pool._workers)
+        self.assertEquals(4, len([worker for worker in workers if worker.isAlive()]))
+        self.assign_peer(stand_in)
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        transport = dispatcher._transports[stand_in.supporter]
+        self.assertEquals(1, len(transport._idle_connections))
+
+        dispatcher.close()
+        self.assertEquals([], [worker for worker in workers if worker.isAlive()])
+        self.assertEquals([], transport._idle_connections)
+
+    def testConnectionsAreReusedAcrossCycles(self):
+        """Tests if the dispatcher keeps one connection per supporter open across update cycles."""
+        stand_ins = [StandInSupporter(i) for i in xrange(3)]
+        dispatcher = self.create_dispatcher(ConcurrentSupporteeListDispatcher, stand_ins)
+
+        for _ in xrange(4):
+            result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+            self.assertEquals((), result.dead_supporters)
+
+        statistics = dispatcher.get_connection_statistics()
+        # 4 cycles with one call per supporter (list dispatch in the first cycle, probes afterwards)
+        self.assertEquals(3, statistics['connections_created'])
+        self.assertEquals(3 * 4 - 3, statistics['connections_reused'])
+        self.assertEquals(0, statistics['reconnects'])
+        self.assertEquals(3 * 4, statistics['requests'])
+
+    def testTransportReconnectsTransparently(self):
+        """Tests if a call succeeds after the supporter closed the connection kept by the transport."""
+        stand_in = StandInSupporter(1)
+        self.stand_ins.append(stand_in)
+        transport = PersistentTransport(TEST_CONNECT_TIMEOUT, TEST_READ_TIMEOUT)
+        proxy = xmlrpclib.ServerProxy("http://%s:%i" % (stand_in.supporter.get_addr()[0],
+                                                        stand_in.supporter.get_addr()[1] + 1), transport=transport)
+        self.assertTrue(proxy.is_alive())
+        stand_in.drop_connections()
+        time.sleep(0.1)
+        self.assertTrue(proxy.is_alive())
+
+        self.assertEquals({'connections_created': 2, 'connections_reused': 1, 'reconnects': 1, 'requests': 2},
+                          transport.get_statistics())
+
+    def testDeltasAreSentInSteadyState(self):
+        """Tests if only the changes of a supportee list are sent once the supporter got the complete list."""
+        stand_in = StandInSupporter(1)
+        dispatcher = self.create_dispatcher(SupporteeListDispatcher, [stand_in])
+        p1 = self.assign_peer(stand_in, 'XXX---34920F')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals(1, len(stand_in.received_peer_lists))
+
+        stand_in.supporter.remove_supported_peer(p1)
+        self.assign_peer(stand_in, 'XXX---34920G')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals(1, len(stand_in.received_peer_lists))
+        self.assertEquals([(2, [['XXX---34920G', '192.168.2.50', 10000]], [['XXX---34920F', '192.168.2.50', 10000]])],
+                          stand_in.received_deltas)
+        self.assertEquals(set([('XXX---34920G', '192.168.2.50', 10000)]), stand_in.peers)
+
+    def testCompleteListIsSentAfterSequenceGap(self):
+        """Tests if a rejected delta results in the dispatch of the complete list in the next cycle."""
+        stand_in = StandInSupporter(1)
+        dispatcher = self.create_dispatcher(SupporteeListDispatcher, [stand_in])
+        self.assign_peer(stand_in, 'XXX---34920F')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+
+        stand_in.version = None  # e.g. the supporter lost its state
+        self.assign_peer(stand_in, 'XXX---34920G')
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((stand_in.supporter,), result.failed_dispatches)
+
+        stand_in.supporter.request_update()
+        update = stand_in.supporter.collect_update()
+        self.assertTrue(update.full)
+        dispatcher._send_update(stand_in.supporter, dispatcher._proxies[stand_in.supporter], update)
+        self.assertEquals(2, len(stand_in.received_peer_lists))
+        self.assertEquals(2, len(stand_in.peers))
+
+    def testCompleteListIsSentAfterReconnect(self):
+        """Tests if the complete list is sent if the connection to the supporter had to be re-established."""
+        stand_in = StandInSupporter(1)
+        dispatcher = self.create_dispatcher(SupporteeListDispatcher, [stand_in])
+        self.assign_peer(stand_in, 'XXX---34920F')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+
+        stand_in.drop_connections()
+        time.sleep(0.1)
+        # the probe of the next cycle re-establishes the connection
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((stand_in.supporter,), result.contacted_supporters)
+        self.assign_peer(stand_in, 'XXX---34920G')
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((), result.failed_dispatches)
+        self.assertEquals(2, len(stand_in.received_peer_lists))
+        self.assertEquals([], stand_in.received_deltas)
+
+    def testLegacySupporterReceivesCompleteLists(self):
+        """Tests if supporters that do not understand deltas always get the complete list."""
+        stand_in = StandInSupporter(1, deltas=False)
+        dispatcher = self.create_dispatcher(SupporteeListDispatcher, [stand_in])
+        self.assign_peer(stand_in, 'XXX---34920F')
+        dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assign_peer(stand_in, 'XXX---34920G')
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+
+        self.assertEquals((), result.failed_dispatches)
+        self.assertEquals(2, len(stand_in.received_peer_lists))
+        self.assertEquals(2, len(stand_in.peers))
+
+    def testUpdatesReplaceLivenessProbes(self):
+        """Tests if supporters are contacted at most once per cycle and healthy ones less frequently."""
+        stand_ins = [StandInSupporter(i) for i in xrange(3)]
+        dispatcher = self.create_dispatcher(SupporteeListDispatcher, stand_ins)
+
+        plan = dispatcher.create_dispatch_plan()
+        self.assertEquals(3, len(plan.updates))
+        self.assertEquals(0, len(plan.probes))
+        result = dispatcher.execute_dispatch_plan(plan)
+        self.assertEquals(3, result.rpc_count)
+        self.assertEquals(3, len(result.contacted_supporters))
+
+        ts = DEFAULT_CLOCK.now()
+        for supporter in result.contacted_supporters:
+            supporter.contact_succeeded(ts)
+        self.assign_peer(stand_ins[0])
+        plan = dispatcher.create_dispatch_plan()
+        self.assertEquals(1, len(plan.updates))
+        self.assertEquals(0, len(plan.probes))
+        self.assertEquals(1, dispatcher.execute_dispatch_plan(plan).rpc_count)
+
+    def testFailedUpdateMarksSupporterAsDead(self):
+        """Tests if a supporter that does not respond to an update is reported as dead."""
+        dead = DeadSupporter(1)
+        dispatcher = self.create_dispatcher(SupporteeListDispatcher, [dead])
+        result = dispatcher.execute_dispatch_plan(dispatcher.create_dispatch_plan())
+        self.assertEquals((dead.supporter,), result.dead_supporters)
+        self.assertEquals((dead.supporter,), result.failed_dispatches)
@@ -2,14 +2,20 @@
 
 __author__ = "Markus Guenther (markus.guenther@gmail.com)"
 
+import json
+import random
+import threading
 import unittest
 import time
 
 import supporter.shared as shared
 
-from supporter.supporter_monitor import SupporterMonitor
+from supporter.activation import GreedyActivationStrategy, LargestFirstActivationStrategy
+from supporter.clock import Clock, ManualClock
+from supporter.supporter_monitor import MonitorState, SupporterMonitor
 from supporter.monitored_subjects import MonitoredSupporter
-from supporter.state_machine import DefaultState, SupportedState, StarvingState
+from supporter.supporter_adapter import DispatchPlan, DispatchResult
+from supporter.state_machine import DefaultState, SupportedState, StarvingState, WatchedState
 
 TEST_IS_ALIVE_TIMEOUT_BOUND = 2
 TEST_PEER_TIMEOUT_BOUND = 1
@@ -17,14 +23,20 @@ TEST_PEER_TIMEOUT_BOUND = 1
         
 class TestSupporterMonitor(unittest.TestCase):
     def setUp(self):
-        pass
+        self.monitors = []
     
     def tearDown(self):
-        pass
+        for monitor in self.monitors:
+            monitor.close()
+
+    def create_monitor(self, *args, **kwargs):
+        monitor = SupporterMonitor(*args, **kwargs)
+        self.monitors.append(monitor)
+        return monitor
     
     def testUnregisterMonitoredPeers(self):
         """Tests if peers can be properly unregistered from a SupporterMonitor instance."""
-        monitor = SupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
         monitor._dispatcher = MockSupporteeListDispatcher(monitor)
         mp1 = monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
         mp2 = monitor.register_monitored_peer('XXX---34920G', '192.168.2.51', 10001, shared.PEER_TYPE_LEECHER)
@@ -33,10 +45,70 @@ class TestSupporterMonitor(unittest.TestCase):
         self.assertTrue(len(monitor.get_monitored_peers()) == 1)
         monitor.unregister_monitored_peer(mp2)
         self.assertTrue(len(monitor.get_monitored_peers()) == 0)
-    
+
+    def testRegisterMonitoredPeerTwice(self):
+        """Tests if a peer ID can only be registered once and is found by the peer index."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        mp = monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        self.assertEquals(None, monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000,
+                                                                shared.PEER_TYPE_LEECHER))
+        self.assertTrue(len(monitor.get_monitored_peers()) == 1)
+        self.assertTrue(monitor.get_monitored_peer('XXX---34920F') is mp)
+        monitor.unregister_monitored_peer(mp)
+        self.assertEquals(None, monitor.get_monitored_peer('XXX---34920F'))
+
+    def testPeersByStateFollowStateTransitions(self):
+        """Tests if the per-state peer buckets are kept in sync with the peers' state transitions."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        mp1 = monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        mp2 = monitor.register_monitored_peer('XXX---34920G', '192.168.2.51', 10001, shared.PEER_TYPE_LEECHER)
+        self.assertEquals(2, monitor.count_peers_by_state(DefaultState))
+
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertEquals(1, monitor.count_peers_by_state(DefaultState))
+        self.assertEquals([mp1], monitor.filter_peers_by_state(WatchedState))
+
+        for _ in xrange(shared.PEER_REQUIRED_MSGS):
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertEquals(0, monitor.count_peers_by_state(WatchedState))
+        self.assertEquals([mp1], monitor.filter_peers_by_state(StarvingState))
+
+        monitor.unregister_monitored_peer(mp1)
+        self.assertEquals(0, monitor.count_peers_by_state(StarvingState))
+        self.assertEquals([mp2], monitor.filter_peers_by_state(DefaultState))
+
+    def testPeersByStateKeepRegistrationOrder(self):
+        """Tests if peers are returned in the order of their registration if they enter a state in that order."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        peers = monitor.register_monitored_peers([('XXX---%i' % i, '192.168.2.50', 10000 + i,
+                                                   shared.PEER_TYPE_LEECHER) for i in xrange(50)])
+        self.assertEquals(peers, monitor.get_monitored_peers())
+        self.assertEquals(peers, monitor.filter_peers_by_state(DefaultState))
+
+        monitor.received_peer_messages([(shared.MSG_SUPPORT_REQUIRED, mp.get_id())
+                                        for _ in xrange(shared.PEER_REQUIRED_MSGS + 1) for mp in peers])
+        self.assertEquals(peers, monitor.filter_peers_by_state(StarvingState))
+        # ties of the stable sort are resolved in the order of the bucket
+        self.assertEquals(peers, monitor.sort_starving_peers(monitor.filter_peers_by_state(StarvingState)))
+
+    def testRequiredMsgsPerMonitor(self):
+        """Tests if the number of required support requests can be configured per monitor."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, required_msgs=2)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        mp = monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        self.assertEquals(2, mp.get_required_msgs())
+
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertEquals([mp], monitor.filter_peers_by_state(WatchedState))
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertEquals([mp], monitor.filter_peers_by_state(StarvingState))
+
     def testPeersRemainInStarvingState(self):
         """Peers remain in STARVING state if no supporter can be activated."""
-        monitor = SupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
         monitor._dispatcher = MockSupporteeListDispatcher(monitor)
         monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
         monitor.register_monitored_peer('XXX---34920G', '192.168.2.51', 10001, shared.PEER_TYPE_LEECHER)
@@ -59,7 +131,8 @@ class TestSupporterMonitor(unittest.TestCase):
     
     def testSimpleProtocol(self):
         """Simple test for correct supporter assignments, state transitions and supporter activations."""
-        monitor = SupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        clock = ManualClock()
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=clock)
         monitor._dispatcher = MockSupporteeListDispatcher(monitor)
         monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
         monitor.register_monitored_supporter(1, ('192.168.2.1', 1024), 2, 5)
@@ -93,7 +166,7 @@ class TestSupporterMonitor(unittest.TestCase):
         
         monitor.received_peer_message(shared.MSG_SUPPORT_NOT_NEEDED, 'XXX---34920F')
         monitor.received_peer_message(shared.MSG_SUPPORT_NOT_NEEDED, 'XXX---34920G')
-        time.sleep(shared.PEER_TIMEOUT_BOUND)
+        clock.advance(shared.PEER_TIMEOUT_BOUND)
         
         monitor.update_states()
         
@@ -103,7 +176,7 @@ class TestSupporterMonitor(unittest.TestCase):
         
     def testActivatingMoreThanOneSupporterAtOnce(self):
         """Checks if we can activate more than one supporter during one monitor state update."""
-        monitor = SupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
         monitor._dispatcher = MockSupporteeListDispatcher(monitor)
         monitor.register_monitored_supporter(1, ('192.168.2.10', 5000), 2, 2)
         monitor.register_monitored_supporter(2, ('192.168.2.11', 5001), 1, 1)
@@ -132,7 +205,7 @@ class TestSupporterMonitor(unittest.TestCase):
         The outcome of the test should be, that only one of the two available supporters
         is activated. If the activation algorithm just focuses on min_peers, it will
         activate both supporters, which should not happen."""
-        monitor = SupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
         monitor._dispatcher = MockSupporteeListDispatcher(monitor)
         monitor.register_monitored_supporter(1, ('192.168.2.10', 5000), 2, 3)
         monitor.register_monitored_supporter(2, ('192.168.2.11', 5001), 1, 3)
@@ -154,10 +227,381 @@ class TestSupporterMonitor(unittest.TestCase):
         self.assertTrue(len(monitor.get_active_supporters()) == 1)
         self.assertTrue(len(monitor.filter_peers_by_state(SupportedState)) == 3)
         self.assertTrue(len(monitor.filter_peers_by_state(StarvingState)) == 0)
-    
+
+    def testActivationCoversStarvingPeersOptimally(self):
+        """Checks if the default activation strategy finds a supporter for all starving peers in a
+        case in which the greedy strategy (ascending min_peers) would leave peers starving."""
+        for strategy, active, supported in [(None, 1, 5), (GreedyActivationStrategy(), 2, 2)]:
+            monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                                       activation_strategy=strategy)
+            monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+            monitor.register_monitored_supporter(1, ('192.168.2.10', 5000), 1, 1)
+            monitor.register_monitored_supporter(2, ('192.168.2.11', 5001), 1, 1)
+            s3 = monitor.register_monitored_supporter(3, ('192.168.2.12', 5002), 5, 5)
+            for i in xrange(5):
+                monitor.register_monitored_peer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+                for _ in xrange(shared.PEER_REQUIRED_MSGS):
+                    monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % i)
+            monitor.update_states()
+
+            self.assertEquals(active, len(monitor.get_active_supporters()))
+            self.assertEquals(supported, len(monitor.filter_peers_by_state(SupportedState)))
+            self.assertEquals(5 - supported, len(monitor.filter_peers_by_state(StarvingState)))
+            if strategy is None:
+                self.assertEquals([s3], monitor.get_active_supporters())
+
+    def testCustomActivationStrategy(self):
+        """Checks if selected supporters get at least min_peers peers assigned in the order of selection."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                                   activation_strategy=ReversedActivationStrategy())
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        s1 = monitor.register_monitored_supporter(1, ('192.168.2.10', 5000), 1, 4)
+        s2 = monitor.register_monitored_supporter(2, ('192.168.2.11', 5001), 2, 3)
+        for i in xrange(5):
+            monitor.register_monitored_peer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+            for _ in xrange(shared.PEER_REQUIRED_MSGS):
+                monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % i)
+        monitor.update_states()
+
+        self.assertEquals(3, s2.assigned_slots())
+        self.assertEquals(2, s1.assigned_slots())
+        self.assertEquals(5, len(monitor.filter_peers_by_state(SupportedState)))
+
+    def create_spread_out_swarm(self, limits, peers):
+        """Activates supporters with the given (min_peer, max_peer) tuples and spreads the given
+        number of starving peers over them.
+
+        @return:
+            2-tuple of the SupporterMonitor and the list of its supporters
+        """
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=ManualClock())
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        supporters = []
+        for i, (min_peer, max_peer) in enumerate(limits):
+            supporters.append(monitor.register_monitored_supporter(i, ('192.168.2.%i' % (10 + i), 5000), min_peer,
+                                                                   max_peer))
+            monitor.activate_supporter(supporters[-1])
+        for i in xrange(peers):
+            monitor.register_monitored_peer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+            for _ in xrange(shared.PEER_REQUIRED_MSGS):
+                monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % i)
+        monitor._assign_starving_peers_to_active_supporters()
+        self.assertEquals(peers, len(monitor.filter_peers_by_state(SupportedState)))
+        return monitor, supporters
+
+    def testConsolidationInactivatesUnderusedSupporters(self):
+        """Checks if the peers of underused supporters are migrated to other active supporters."""
+        monitor, supporters = self.create_spread_out_swarm([(1, 10), (1, 10), (1, 10)], 6)
+        self.assertEquals([2, 2, 2], [s.assigned_slots() for s in supporters])
+
+        monitor.update_states()
+        self.assertEquals(1, len(monitor.get_active_supporters()))
+        self.assertEquals(6, monitor.get_active_supporters()[0].assigned_slots())
+        self.assertEquals(6, len(monitor.filter_peers_by_state(SupportedState)))
+        self.assertEquals(2, monitor.get_freed_supporters_per_cycle())
+        self.assertEquals(4, monitor.get_migrated_peers_per_cycle())
+        # freed supporters receive their empty supportee lists
+        for supporter in supporters:
+            if supporter not in monitor.get_active_supporters():
+                self.assertEquals([], supporter.get_supported_peers())
+
+        monitor.update_states()
+        self.assertEquals(0, monitor.get_freed_supporters_per_cycle())
+        self.assertEquals(0, monitor.get_migrated_peers_per_cycle())
+
+    def testConsolidationRespectsMigrationBudget(self):
+        """Checks if no more than migration_budget peers are migrated per update cycle."""
+        monitor, supporters = self.create_spread_out_swarm([(1, 10), (1, 10), (1, 10)], 6)
+        monitor._migration_budget = 3
+        monitor.update_states()
+        self.assertEquals(2, len(monitor.get_active_supporters()))
+        self.assertEquals(1, monitor.get_freed_supporters_per_cycle())
+        self.assertEquals(2, monitor.get_migrated_peers_per_cycle())
+        monitor.update_states()
+        self.assertEquals(1, len(monitor.get_active_supporters()))
+        self.assertEquals(6, len(monitor.filter_peers_by_state(SupportedState)))
+
+    def testConsolidationRespectsMaxPeers(self):
+        """Checks if supporters are only emptied if the other supporters have enough available slots."""
+        monitor, supporters = self.create_spread_out_swarm([(1, 4), (1, 4)], 5)
+        self.assertEquals([3, 2], [s.assigned_slots() for s in supporters])
+        monitor.update_states()
+        self.assertEquals(2, len(monitor.get_active_supporters()))
+        self.assertEquals([3, 2], [s.assigned_slots() for s in supporters])
+        self.assertEquals(0, monitor.get_migrated_peers_per_cycle())
+
+    def testBatchedMessagesMatchSingleMessages(self):
+        """Checks if a batch of messages results in the same peer states as single messages."""
+        rnd = random.Random(4711)
+        peers = [('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER) for i in xrange(20)]
+        msg_types = [shared.MSG_SUPPORT_REQUIRED] * 3 + [shared.MSG_SUPPORT_NOT_NEEDED, shared.MSG_PEER_REGISTERED]
+        messages = [(rnd.choice(msg_types), rnd.choice(peers)[0]) for _ in xrange(1000)]
+        messages.append((shared.MSG_SUPPORT_REQUIRED, 'UNKNOWN'))
+
+        single = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=ManualClock())
+        for peer in peers:
+            single.register_monitored_peer(*peer)
+        for msg_type, peer_id in messages:
+            single.received_peer_message(msg_type, peer_id)
+
+        batched = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=ManualClock())
+        batched.register_monitored_peers(peers)
+        self.assertTrue(batched.received_peer_messages(iter(messages)) < len(messages) - 1)
+
+        for peer_id, _, _, _ in peers:
+            expected = single.get_monitored_peer(peer_id)
+            actual = batched.get_monitored_peer(peer_id)
+            self.assertEquals(expected.get_state(), actual.get_state())
+            self.assertEquals(expected.get_number_of_support_requests(), actual.get_number_of_support_requests())
+            self.assertEquals(expected.get_last_received_msg(), actual.get_last_received_msg())
+        for state_class in [DefaultState, WatchedState, StarvingState, SupportedState]:
+            self.assertEquals(single.count_peers_by_state(state_class), batched.count_peers_by_state(state_class))
+        self.assertTrue(batched.count_peers_by_state(StarvingState) > 0)
+
+    def testBatchCoalescesRedundantMessages(self):
+        """Checks if repeated messages are coalesced unless they are support requests."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=ManualClock())
+        monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        batch = [(shared.MSG_SUPPORT_NOT_NEEDED, 'XXX---34920F')] * 3
+        batch += [(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')] * shared.PEER_REQUIRED_MSGS
+        batch += [(shared.MSG_SUPPORT_NOT_NEEDED, 'XXX---34920G')] * 2
+        self.assertEquals(1 + shared.PEER_REQUIRED_MSGS, monitor.received_peer_messages(batch))
+        self.assertEquals(1, monitor.count_peers_by_state(StarvingState))
+
+    def testRegisterMonitoredPeers(self):
+        """Checks the bulk registration of peers."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        existing = monitor.register_monitored_peer('XXX---1', '192.168.2.50', 10001, shared.PEER_TYPE_LEECHER)
+        registered = monitor.register_monitored_peers([('XXX---%i' % i, '192.168.2.50', 10000 + i,
+                                                        shared.PEER_TYPE_LEECHER) for i in xrange(3)])
+        self.assertEquals(3, len(registered))
+        self.assertEquals(None, registered[1])
+        self.assertEquals(['XXX---0', 'XXX---2'], [registered[0].get_id(), registered[2].get_id()])
+        self.assertTrue(monitor.get_monitored_peer('XXX---1') is existing)
+        self.assertEquals(3, len(monitor.get_monitored_peers()))
+        self.assertEquals(3, monitor.count_peers_by_state(DefaultState))
+
+    def testSnapshotIsPublishedAtTheEndOfEachCycle(self):
+        """Checks if every update cycle publishes a new snapshot and if published snapshots do not change."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        initial = monitor.get_snapshot()
+        self.assertEquals(0, initial.version)
+        self.assertEquals([], list(initial.peers))
+
+        monitor.register_monitored_supporter(1, ('127.0.0.1', 1024), 1, 5)
+        monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        monitor.register_monitored_peer('XXX---34920G', '192.168.2.51', 10001, shared.PEER_TYPE_LEECHER)
+        for _ in xrange(shared.PEER_REQUIRED_MSGS):
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertTrue(monitor.get_snapshot() is initial)
+        monitor.update_states()
+
+        snapshot = monitor.get_snapshot()
+        self.assertEquals(1, snapshot.version)
+        # default, watched, starving, supported
+        self.assertEquals((1, 0, 0, 1), tuple(snapshot.state_counts))
+        peers = dict((peer.id, peer) for peer in snapshot.peers)
+        self.assertEquals(('Supported', 1, shared.PEER_REQUIRED_MSGS),
+                          (peers['XXX---34920F'].state, peers['XXX---34920F'].supporter_id,
+                           peers['XXX---34920F'].support_requests))
+        self.assertEquals(('Default', None), (peers['XXX---34920G'].state, peers['XXX---34920G'].supporter_id))
+        self.assertEquals([(1, 1, 4, True)], [(s.id, s.assigned_slots, s.available_slots, s.active)
+                                              for s in snapshot.supporters])
+        self.assertRaises(AttributeError, setattr, snapshot, 'version', 5)
+
+        # later messages only show up in the snapshot of the next cycle
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920G')
+        self.assertEquals(1, monitor.get_snapshot().state_counts.default)
+        self.assertEquals(2, monitor.publish_snapshot().version)
+        self.assertEquals(1, monitor.get_snapshot().state_counts.watched)
+        self.assertEquals(0, snapshot.state_counts.watched)
+
+    def testSnapshotRebuildsOnlyChangedPeers(self):
+        """Checks if the records of a snapshot match the peers, while unchanged records are reused."""
+        clock = ManualClock(1000)
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=clock,
+                                      migration_budget=10)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        for i in xrange(4):
+            monitor.register_monitored_supporter(i, ('127.0.0.1', 1024 + i), 1, 6)
+        monitor.register_monitored_peers([('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+                                          for i in xrange(40)])
+        rnd = random.Random(4711)
+        migrated = 0
+        for cycle in xrange(40):
+            for _ in xrange(rnd.randint(0, 8)):
+                peer_id = 'XXX---%i' % rnd.randint(0, 39)
+                if rnd.random() < 0.6:
+                    monitor.received_peer_messages([(shared.MSG_SUPPORT_REQUIRED, peer_id)] * shared.PEER_REQUIRED_MSGS)
+                elif monitor.get_monitored_peer(peer_id) is not None:
+                    monitor.received_peer_message(shared.MSG_SUPPORT_NOT_NEEDED, peer_id)
+            if cycle == 30:
+                monitor.unregister_monitored_peer(monitor.get_monitored_peer('XXX---7'))
+                monitor.unregister_monitored_supporter(monitor.get_active_supporters()[0])
+            clock.advance(rnd.choice([0.5, 0.5, 0.5, TEST_IS_ALIVE_TIMEOUT_BOUND + 1]))
+            monitor.update_states()
+            migrated += monitor.get_migrated_peers_per_cycle()
+
+            supporter_ids = {}
+            for supporter in monitor.get_monitored_supporters():
+                for peer in supporter.get_supported_peers():
+                    supporter_ids[peer] = supporter.get_id()
+            expected = sorted([(mp.get_id(), mp.get_ip(), mp.get_port(), str(mp.get_state()),
+                                mp.get_last_received_msg(), mp.get_number_of_support_requests(),
+                                supporter_ids.get(mp)) for mp in monitor.get_monitored_peers()])
+            snapshot = monitor.get_snapshot()
+            self.assertEquals(cycle + 1, snapshot.version)
+            self.assertEquals(expected, sorted([tuple(peer) for peer in snapshot.peers]))
+            self.assertEquals([mp.get_id() for mp in monitor.get_monitored_peers()],
+                              [peer.id for peer in snapshot.peers])
+            self.assertEquals(len(expected), len(snapshot.peers))
+        self.assertTrue(migrated > 0)
+
+        # a cycle without messages and timeouts does not rebuild any record and shares all chunks
+        monitor.update_states()
+        self.assertEquals(list(snapshot.peers), list(monitor.get_snapshot().peers))
+        self.assertEquals(snapshot.peers.get_chunks(), monitor.get_snapshot().peers.get_chunks())
+        self.assertTrue(all([previous is current for previous, current in zip(snapshot.peers.get_chunks(),
+                                                                          monitor.get_snapshot().peers.get_chunks())]))
+
+    def testSnapshotCompactsSlotsOfUnregisteredPeers(self):
+        """Checks if the peers of snapshots stay in registration order while peers are unregistered and
+        registered, and if only the chunks of changed peers are copied."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        peer_count = shared.SNAPSHOT_CHUNK_SIZE * 3
+        monitor.register_monitored_peers([('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+                                          for i in xrange(peer_count)])
+        monitor.update_states()
+        chunks = monitor.get_snapshot().peers.get_chunks()
+        self.assertEquals(3, len(chunks))
+
+        # a message only copies the chunk of its peer
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % (peer_count - 3))
+        monitor.update_states()
+        self.assertEquals([True, True, False], [previous is current for previous, current in
+                                                zip(chunks, monitor.get_snapshot().peers.get_chunks())])
+
+        # unregistering two thirds of the peers compacts the chunks
+        for i in xrange(peer_count):
+            if i % 3 != 0:
+                monitor.unregister_monitored_peer(monitor.get_monitored_peer('XXX---%i' % i))
+        monitor.register_monitored_peer('XXX---new', '192.168.2.51', 10000, shared.PEER_TYPE_LEECHER)
+        monitor.update_states()
+        snapshot = monitor.get_snapshot()
+        expected = ['XXX---%i' % i for i in xrange(0, peer_count, 3)] + ['XXX---new']
+        self.assertEquals(expected, [peer.id for peer in snapshot.peers])
+        self.assertEquals(len(expected), len(snapshot.peers))
+        self.assertEquals(2, len(snapshot.peers.get_chunks()))
+        self.assertEquals('Watched', list(snapshot.peers)[-2].state)
+
+    def testStatusPagesDoNotBlockOnTheMonitor(self):
+        """Checks if the status pages are rendered from the snapshot while another thread holds the lock."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        monitor.register_monitored_supporter(1, ('127.0.0.1', 1024), 1, 5)
+        monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        monitor.update_states()
+
+        locked = threading.Event()
+        released = threading.Event()
+
+        def hold_lock():
+            monitor.call_synchronized(lambda: locked.set() or released.wait(5))
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait()
+        try:
+            html = MonitorState.retrieve_monitor_state_as_html(monitor)
+            document = json.loads(MonitorState.retrieve_monitor_state_as_json(monitor))
+        finally:
+            released.set()
+            thread.join()
+        self.assertTrue('<td>XXX---34920F</td>' in html)
+        self.assertEquals(1, document['version'])
+        self.assertEquals(1, document['state_counts']['default'])
+        self.assertEquals([['XXX---34920F', '192.168.2.50', 10000, 'Default', None]],
+                          [[p['id'], p['ip'], p['port'], p['state'], p['supporter_id']] for p in document['peers']])
+        self.assertEquals([[1, ['127.0.0.1', 1024], 0, 5, False]],
+                          [[s['id'], s['addr'], s['assigned_slots'], s['available_slots'], s['active']]
+                           for s in document['supporters']])
+
+    def testStatusPagesArePaginatedAndFiltered(self):
+        """Checks the selection of peers by page, state and supporter as well as the chunked output."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        monitor.register_monitored_supporter(1, ('127.0.0.1', 1024), 1, 3)
+        monitor.register_monitored_supporter(2, ('127.0.0.1', 1025), 1, 3)
+        peer_count = shared.STATUS_PAGE_CHUNK_ROWS * 2 + 10
+        monitor.register_monitored_peers([('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+                                          for i in xrange(peer_count)])
+        for i in xrange(5):
+            monitor.received_peer_messages([(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % i)] * shared.PEER_REQUIRED_MSGS)
+        monitor.update_states()
+
+        def peer_ids(**kwargs):
+            document = json.loads(MonitorState.retrieve_monitor_state_as_json(monitor, **kwargs))
+            return [peer['id'] for peer in document['peers']], document['next_offset']
+
+        all_ids = [peer.id for peer in monitor.get_snapshot().peers]
+        self.assertEquals((all_ids, None), peer_ids())
+        self.assertEquals((all_ids[10:20], 20), peer_ids(offset=10, limit=10))
+        self.assertEquals((all_ids[-10:], None), peer_ids(offset=peer_count - 10, limit=10))
+        self.assertEquals(([], 0), peer_ids(limit=0))
+        supported, _ = peer_ids(state='Supported')
+        self.assertEquals(['XXX---%i' % i for i in xrange(5)], sorted(supported))
+        by_supporter = [peer_ids(supporter_id=supporter_id)[0] for supporter_id in (1, 2)]
+        self.assertEquals(sorted(supported), sorted(by_supporter[0] + by_supporter[1]))
+        self.assertEquals(3, len(by_supporter[0]))
+        self.assertEquals(([], None), peer_ids(state='Starving'))
+        document = json.loads(MonitorState.retrieve_monitor_state_as_json(monitor, supporter_id=2))
+        self.assertEquals([2], [supporter['id'] for supporter in document['supporters']])
+
+        chunks = list(MonitorState.iter_monitor_state_as_html(monitor))
+        self.assertEquals(2, len([chunk for chunk in chunks if chunk.count('<tr>') == shared.STATUS_PAGE_CHUNK_ROWS]))
+        html = ''.join(chunks)
+        self.assertEquals(html, MonitorState.retrieve_monitor_state_as_html(monitor))
+        self.assertEquals(peer_count + 2 + 2, html.count('<tr>'))
+        page = MonitorState.retrieve_monitor_state_as_html(monitor, limit=2, state='Supported')
+        self.assertEquals(2 + 1 + 2 + 1, page.count('<tr>'))
+        self.assertTrue('More peers are available from offset 2.' in page)
+        self.assertTrue('Nothing to report yet.' in MonitorState.retrieve_monitor_state_as_html(monitor,
+                                                                                                state='Starving'))
+
+    def testPaginationIsStableAcrossRegistrations(self):
+        """Checks if pages list peers in registration order, so that peers which register between
+        two page reads neither repeat nor skip peers on later pages."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        registered = ['peer-%03i' % i for i in xrange(10, 40)]
+        monitor.register_monitored_peers([(peer_id, '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+                                          for peer_id in registered])
+        monitor.update_states()
+
+        def peer_ids(offset, limit):
+            document = json.loads(MonitorState.retrieve_monitor_state_as_json(monitor, offset=offset, limit=limit))
+            return [peer['id'] for peer in document['peers']]
+
+        first_page = peer_ids(0, 10)
+        self.assertEquals(registered[:10], first_page)
+        # peers whose IDs sort (and hash) before and after the ones of the first page
+        added = ['peer-%03i' % i for i in xrange(10)] + ['peer-%03i' % i for i in xrange(40, 50)]
+        for peer_id in added:
+            monitor.register_monitored_peer(peer_id, '192.168.2.51', 10001, shared.PEER_TYPE_LEECHER)
+        monitor.update_states()
+        second_page = peer_ids(10, 10)
+        self.assertEquals(registered[10:20], second_page)
+        self.assertEquals([], [peer_id for peer_id in second_page if peer_id in first_page])
+        self.assertEquals(registered + added, peer_ids(0, None))
+
     def testCorrectOrderOfActiveSupporters(self):
         """Checks if the ordering of active supporters is correct."""
-        monitor = SupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        # the greedy strategy activates both supporters, although s2 could support both peers
+        # (which the consolidation would fix, so it is disabled)
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND,
+                                   activation_strategy=GreedyActivationStrategy(), migration_budget=0)
         monitor._dispatcher = MockSupporteeListDispatcher(monitor)
         s1 = monitor.register_monitored_supporter(1, ('192.168.2.50', 5000), 1, 1)
         s2 = monitor.register_monitored_supporter(2, ('192.168.2.51', 5001), 1, 6)
@@ -173,6 +617,30 @@ class TestSupporterMonitor(unittest.TestCase):
         self.assertEquals(monitor.get_active_supporters()[0], s2)
         self.assertEquals(monitor.get_active_supporters()[1], s1)
         
+    def testStarvingPeersAreAssignedToSupporterWithMostSlots(self):
+        """Checks if every starving peer is assigned to the active supporter with the most available slots."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        s1 = monitor.register_monitored_supporter(1, ('192.168.2.50', 5000), 1, 3)
+        s2 = monitor.register_monitored_supporter(2, ('192.168.2.51', 5001), 1, 5)
+        s3 = monitor.register_monitored_supporter(3, ('192.168.2.52', 5002), 1, 4)
+        for supporter in [s1, s2, s3]:
+            monitor.activate_supporter(supporter)
+        self.assertEquals([s2, s3, s1], monitor.get_active_supporters())
+        for i in xrange(6):
+            monitor.register_monitored_peer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+            for _ in xrange(shared.PEER_REQUIRED_MSGS):
+                monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % i)
+
+        monitor._assign_starving_peers_to_active_supporters()
+        self.assertEquals(6, monitor.count_peers_by_state(SupportedState))
+        self.assertEquals([1, 3, 2], [s.assigned_slots() for s in [s1, s2, s3]])
+        self.assertEquals([s1, s2, s3], monitor.get_active_supporters())
+
+        monitor.unregister_monitored_supporter(s2)
+        self.assertEquals([s1, s3], monitor.get_active_supporters())
+        self.assertEquals(3, monitor.count_peers_by_state(StarvingState))
+
     def testUpdateCallWithoutHavingPeersOrSupportersSucceeds(self):
         """Tests if the update call succeeds if no peers/supporters are registered.
 
@@ -180,9 +648,107 @@ class TestSupporterMonitor(unittest.TestCase):
         was caused when update_states() was called when no peers/supporters were registered
         at the monitor. This test remains in the testsuite, so that this bug will not get
         introduced again."""
-        monitor = SupporterMonitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        monitor.update_states()
+
+
+    def testMessagesAreNotBlockedBySupporterIO(self):
+        """Tests if incoming peer messages are handled while the I/O phase of an update is running
+        and if the results of the I/O phase are merged back in the next update cycle."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        dispatcher = SlowMockSupporteeListDispatcher(monitor, 2)
+        monitor._dispatcher = dispatcher
+        monitor.register_monitored_supporter(1, ('192.168.2.10', 5000), 1, 1)
+        monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+
+        update = threading.Thread(target=monitor.update_states)
+        update.start()
+        dispatcher.io_started.wait()
+        ts = time.time()
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---34920F')
+        self.assertTrue(time.time() - ts < 1)
+        self.assertTrue(update.isAlive())
+        update.join()
+
+        self.assertTrue(len(monitor.get_monitored_supporters()) == 1)
         monitor._dispatcher = MockSupporteeListDispatcher(monitor)
         monitor.update_states()
+        self.assertTrue(len(monitor.get_monitored_supporters()) == 0)
+
+    def testOnlyExpiredPeersAreUpdated(self):
+        """Tests if an update only touches peers whose deadline has passed."""
+        clock = ManualClock()
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=clock)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        for i in xrange(100):
+            monitor.register_monitored_peer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+        monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---0')
+        mp = monitor.get_monitored_peer('XXX---0')
+        self.assertTrue(isinstance(mp.get_state(), WatchedState))
+        self.assertEquals(mp.get_ts_last_request() + TEST_IS_ALIVE_TIMEOUT_BOUND, mp.get_next_deadline())
+        self.assertEquals(0, monitor._update_expired_peers(clock.now()))
+
+        clock.advance(TEST_IS_ALIVE_TIMEOUT_BOUND)
+        self.assertEquals(1, monitor._update_expired_peers(clock.now()))
+        self.assertTrue(isinstance(mp.get_state(), DefaultState))
+        self.assertEquals(0, monitor._update_expired_peers(clock.now()))
+        self.assertEquals(100, monitor.count_peers_by_state(DefaultState))
+
+    def testUnregisteredPeersAreNotUpdated(self):
+        """Tests if the deadline of an unregistered peer is discarded."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND)
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        mp = monitor.register_monitored_peer('XXX---34920F', '192.168.2.50', 10000, shared.PEER_TYPE_LEECHER)
+        monitor.peer_deadline_changed(mp, monitor.get_clock().now())
+        monitor.unregister_monitored_peer(mp)
+        self.assertEquals(0, monitor._update_expired_peers(monitor.get_clock().now()))
+
+    def testUpdateReadsClockOncePerCycle(self):
+        """Tests if an update cycle evaluates all peers against a single read of the clock."""
+        manual_clock = ManualClock()
+        reads = []
+
+        def time_source():
+            reads.append(None)
+            return manual_clock.now()
+
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, clock=Clock(time_source))
+        monitor._dispatcher = MockSupporteeListDispatcher(monitor)
+        for i in xrange(10):
+            monitor.register_monitored_peer('XXX---%i' % i, '192.168.2.50', 10000 + i, shared.PEER_TYPE_LEECHER)
+            monitor.received_peer_message(shared.MSG_SUPPORT_REQUIRED, 'XXX---%i' % i)
+        manual_clock.advance(TEST_IS_ALIVE_TIMEOUT_BOUND)
+
+        del reads[:]
+        monitor.update_states()
+        self.assertEquals(1, len(reads))
+        self.assertEquals(10, monitor.count_peers_by_state(DefaultState))
+
+    def testStartAndStopAsynchronousUpdates(self):
+        """Tests if state updates are only performed between the calls to start() and stop()."""
+        monitor = self.create_monitor(TEST_IS_ALIVE_TIMEOUT_BOUND, TEST_PEER_TIMEOUT_BOUND, update_interval=0.1)
+        dispatcher = MockSupporteeListDispatcher(monitor)
+        monitor._dispatcher = dispatcher
+        self.assertEquals(0.1, monitor.get_update_interval())
+        time.sleep(0.25)
+        self.assertEquals(0, dispatcher.plans_created)
+        monitor.start()
+        self.assertTrue(monitor.is_running())
+        time.sleep(0.35)
+        monitor.stop()
+        self.assertFalse(monitor.is_running())
+        self.assertEquals(3, dispatcher.plans_created)
+        self.assertEquals(0, monitor.get_skipped_updates())
+        time.sleep(0.25)
+        self.assertEquals(3, dispatcher.plans_created)
+
+
+class ReversedActivationStrategy(LargestFirstActivationStrategy):
+    """Selects the same supporters as LargestFirstActivationStrategy, but in reversed order."""
+
+    def select_supporters(self, starving_peers, supporters):
+        return list(reversed(LargestFirstActivationStrategy.select_supporters(self, starving_peers, supporters)))
 
 
 class MockSupporteeListDispatcher():
@@ -190,6 +756,7 @@ class MockSupporteeListDispatcher():
         assert isinstance(monitor, SupporterMonitor)
         
         self._monitor = monitor
+        self.plans_created = 0
         
     def register_proxy(self, supporter):
         assert isinstance(supporter, MonitoredSupporter)
@@ -198,8 +765,28 @@ class MockSupporteeListDispatcher():
     def unregister_proxy(self, supporter):
         assert isinstance(supporter, MonitoredSupporter)
     
-    def dispatch_peer_lists(self):
+    def create_dispatch_plan(self):
+        self.plans_created += 1
+        return DispatchPlan((), ())
+
+    def execute_dispatch_plan(self, plan):
+        return DispatchResult((), (), (), 0)
+
+    def close(self, timeout=None):
         pass
-    
-    def query_all_supporters(self):
-        pass
\ No newline at end of file
+
+
+class SlowMockSupporteeListDispatcher(MockSupporteeListDispatcher):
+    """Simulates an I/O phase that blocks for some time and reports every supporter as dead."""
+    def __init__(self, monitor, delay):
+        MockSupporteeListDispatcher.__init__(self, monitor)
+        self._delay = delay
+        self.io_started = threading.Event()
+
+    def create_dispatch_plan(self):
+        return DispatchPlan((), tuple([(s, None) for s in self._monitor.get_monitored_supporters()]))
+
+    def execute_dispatch_plan(self, plan):
+        self.io_started.set()
+        time.sleep(self._delay)
+        return DispatchResult(tuple([s for s, _ in plan.probes]), (), (), len(plan.probes))
\ No newline at end of file